@@ -0,0 +1,67 @@
+#!/usr/bin/python3
+
+# Compare growing a result dataframe with pd.concat inside the chunk loop
+# (what the capstone scripts used to do) against FrameAccumulator.
+# Run from the "Final Capstone" directory:
+#   python3 benchmarks/bench_accumulate.py [rows ...]
+
+import os
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from wind_siting.accumulate import FrameAccumulator
+
+# The scripts process 1000 records at a time.
+chunk_size = 1000
+
+
+# A chunk that looks roughly like an NREL cell chunk after the state sjoin.
+def make_chunk(first_id, rows, rng):
+    return pd.DataFrame({'id': np.arange(first_id, first_id + rows),
+                         'wind_class': rng.integers(1, 8, rows).astype(float),
+                         'centroid_lat': rng.uniform(25, 49, rows),
+                         'centroid_long': rng.uniform(-125, -67, rows),
+                         'state': rng.choice(['TX','CA','IA','RI'], rows)})
+
+
+def concat_in_loop(total_rows):
+    rng = np.random.default_rng(0)
+    out_df = pd.DataFrame()
+    for first_id in range(0, total_rows, chunk_size):
+        chunk = make_chunk(first_id, min(chunk_size, total_rows - first_id), rng)
+        out_df = pd.concat([out_df, chunk], ignore_index=True)
+    return out_df
+
+
+def accumulate(total_rows):
+    rng = np.random.default_rng(0)
+    out_chunks = FrameAccumulator()
+    for first_id in range(0, total_rows, chunk_size):
+        out_chunks.append(make_chunk(first_id, min(chunk_size, total_rows - first_id), rng))
+    return out_chunks.to_frame()
+
+
+def measure(func, total_rows):
+    tracemalloc.start()
+    start = time.perf_counter()
+    out_df = func(total_rows)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return out_df, elapsed, peak
+
+
+if __name__ == '__main__':
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000, 1000000]
+    print("{:>9} {:>15} {:>10} {:>14}".format('rows', 'method', 'seconds', 'peak MiB'))
+    for total_rows in sizes:
+        results = []
+        for name, func in [('concat in loop', concat_in_loop), ('accumulator', accumulate)]:
+            out_df, elapsed, peak = measure(func, total_rows)
+            results.append(out_df)
+            print("{:>9} {:>15} {:>10.2f} {:>14.1f}".format(total_rows, name, elapsed, peak / 2**20))
+        pd.testing.assert_frame_equal(results[0], results[1])
@@ -0,0 +1,144 @@
+#!/usr/bin/python3
+
+# Time the geometry steps of the nrel stage on one very big synthetic state
+# (1M cells by default), per object, as nrel_add_attributes.py used to do
+# them, against the vectorized versions in wind_siting.stages and
+# wind_siting.nearest, and check that both give the same answers:
+#   centroid points    [Point(xy) for xy in zip(...)] vs gpd.points_from_xy
+#   centroid lat/long  .centroid.y and .centroid.x vs one shapely.centroid
+#   turbine join       the cells with vs without a column of centroid Points
+#   nearest line       .apply(nearest_points) + two .apply unpacks + a
+#                      distance per row vs NearestLineIndex
+#   line count         .apply(buffer(1)) + sjoin vs NearestLineIndex.count_within
+# The per-row nearest line and line count would take hours on 1M cells, so
+# they run on a sample and their time is scaled up to the whole state.
+#
+# Peak memory is measured two ways: tracemalloc (Python objects only, which
+# is where a list of a million Points goes) and the RSS high-water mark
+# (everything, including the GEOS geometries, though a step can reuse heap
+# the step before it freed, so small RSS differences don't mean much).
+# Run from the "Final Capstone" directory:
+#   python3 benchmarks/bench_cell_features.py [--cells N] [--sample N]
+
+import os
+import sys
+import time
+import argparse
+import warnings
+import tracemalloc
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+from shapely.geometry import Point
+from shapely.ops import nearest_points
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from wind_siting.fixtures import extent, make_cells, make_power_lines, make_turbines
+from wind_siting.nearest import NearestLineIndex
+from wind_siting.parallel import hwm_rss, reset_peak_rss
+
+
+def measure(func):
+    reset_peak_rss()
+    start_rss = hwm_rss()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    traced_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, traced_peak, hwm_rss() - start_rss
+
+
+# Memory isn't scaled up with the time: a sampled step shows no memory.
+def report(step, rows, name, elapsed, traced_peak, rss_peak, scale=1):
+    memory = ['{:.1f}'.format(peak / 2**20) if scale == 1 else '-' for peak in [traced_peak, rss_peak]]
+    print("{:<18} {:>9} {:<16} {:>10.2f} {:>12} {:>10}".format(step, rows, name, elapsed * scale, *memory))
+
+
+def compare(step, rows, before, after, scale=1):
+    for name, (result, elapsed, traced_peak, rss_peak) in [('per object', before), ('vectorized', after)]:
+        report(step, rows, name, elapsed, traced_peak, rss_peak, scale if name == 'per object' else 1)
+    print("{:<18} {:>9} {:<16} {:>9.1f}x".format('', '', 'speedup', before[1] * scale / after[1]))
+
+
+# Joining turbines to the cells and merging the counts back, as cell_features does.
+def turbine_join(cells, turbines):
+    turbines_here = gpd.sjoin(cells, turbines, how='left')
+    turbines_here = turbines_here.loc[~turbines_here['index_right'].isnull()]
+    counts = turbines_here['id'].value_counts().rename('turbine_count')
+    return pd.DataFrame(cells.drop(columns='geometry')).merge(right=counts, left_on='id', right_index=True, how='left')
+
+
+def per_row_nearest(centroids, power_lines):
+    lines_union = shapely.union_all(np.asarray(power_lines['geometry'].values))
+    nearest_point = centroids.apply(lambda x: nearest_points(x, lines_union))
+    on_centroid = nearest_point.apply(lambda x: x[0])
+    on_line = nearest_point.apply(lambda x: x[1])
+    return np.array([a.distance(b) for a, b in zip(on_centroid, on_line)])
+
+
+def per_row_line_count(centroids, power_lines):
+    buffers = gpd.GeoDataFrame({'id': np.arange(len(centroids))},
+                               geometry=centroids.apply(lambda x: x.buffer(1)).values, crs=power_lines.crs)
+    candidate_lines = gpd.sjoin(power_lines, buffers, how='right')
+    return candidate_lines.groupby('id')['OBJECTID'].count().reindex(buffers['id']).values
+
+
+if __name__ == '__main__':
+    warnings.simplefilter('ignore')
+    parser = argparse.ArgumentParser(description='Per-object vs vectorized geometry steps of the nrel stage.')
+    parser.add_argument('--cells', type=int, default=1000000)
+    parser.add_argument('--sample', type=int, default=2000,
+                        help='cells the per-row nearest line and line count run on (default: %(default)s)')
+    parser.add_argument('--lines', type=int, default=2000)
+    parser.add_argument('--turbines', type=int, default=20000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    state = gpd.GeoDataFrame({'STUSPS': ['XX']}, geometry=[shapely.box(*extent)], crs='epsg:4326')
+    cells = make_cells(args.cells, rng)
+    power_lines = make_power_lines(args.lines, rng)
+    turbines = make_turbines(args.turbines, state, rng).to_crs(cells.crs).rename(columns={'index': 't_index'})
+    n = cells.shape[0]
+    print("{} cells, {} power lines, {} turbines".format(n, power_lines.shape[0], turbines.shape[0]))
+    print("{:<18} {:>9} {:<16} {:>10} {:>12} {:>10}".format('step', 'rows', 'method', 'seconds', 'traced MiB', 'RSS MiB'))
+
+    before = measure(lambda: (cells['geometry'].centroid.y.values, cells['geometry'].centroid.x.values))
+    after = measure(lambda: (lambda c: (shapely.get_y(c), shapely.get_x(c)))(shapely.centroid(np.asarray(cells['geometry'].values))))
+    assert np.array_equal(before[0][0], after[0][0]) and np.array_equal(before[0][1], after[0][1])
+    compare('centroid lat/long', n, before, after)
+    cells['centroid_lat'], cells['centroid_long'] = after[0]
+
+    before = measure(lambda: [Point(xy) for xy in zip(cells['centroid_long'], cells['centroid_lat'])])
+    after = measure(lambda: gpd.points_from_xy(cells['centroid_long'], cells['centroid_lat']))
+    assert shapely.equals_exact(np.array(before[0], dtype=object), np.asarray(after[0]), 0).all()
+    compare('centroid points', n, before, after)
+    centroids = gpd.GeoSeries(after[0], index=cells.index, crs=cells.crs)
+    point_list = before[0]
+    del before, after
+
+    with_points = cells.assign(centroid=point_list)
+    del point_list
+    before = measure(lambda: turbine_join(with_points, turbines))
+    after = measure(lambda: turbine_join(cells, turbines))
+    pd.testing.assert_frame_equal(before[0].drop(columns='centroid'), after[0])
+    compare('turbine join', n, before, after)
+    del with_points, before, after
+
+    sample = centroids.sample(min(args.sample, n), random_state=0).sort_index()
+    scale = n / sample.shape[0]
+    line_index = NearestLineIndex(power_lines)
+    before = measure(lambda: per_row_nearest(sample, power_lines))
+    after = measure(lambda: line_index.nearest_index(centroids))
+    assert np.allclose(before[0], after[0][1][centroids.index.get_indexer(sample.index)])
+    compare('nearest line', n, before, after, scale)
+    del before, after
+
+    before = measure(lambda: per_row_line_count(sample, power_lines))
+    after = measure(lambda: line_index.count_within(centroids, 1))
+    assert np.array_equal(before[0], after[0][centroids.index.get_indexer(sample.index)])
+    compare('line count', n, before, after, scale)
+    print("(per object nearest line and line count: {} cells, seconds scaled by {:.0f})".format(sample.shape[0], scale))
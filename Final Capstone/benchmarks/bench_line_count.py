@@ -0,0 +1,108 @@
+#!/usr/bin/python3
+
+# Check wind_siting.nearest.NearestLineIndex.count_within against the
+# line_count feature the capstone scripts used to build:
+#   buffer(radius) around every point, gpd.sjoin(lines, buffers, how='right'),
+#   then groupby('id').count() of the lines each buffer picked up
+# on random points and lines, plus lines placed in the sliver between a
+# buffer and its circle: a buffer is a polygon with quad_segs (16) segments
+# per quarter circle, so its edges dip to the apothem,
+# radius * cos(pi / (4 * quad_segs)), between vertices on the circle. A short
+# line tangent to the circle at a distance between the two is inside the
+# buffer near a vertex and outside it mid-edge; count_within checks those
+# against the buffer itself.
+# Asserts the same count for every point at every radius, that there were
+# sliver lines on both sides of the buffer's edge, and that counting against
+# the true circle (quad_segs=None) would have given different counts.
+# Run from the "Final Capstone" directory:
+#   python3 benchmarks/bench_line_count.py [--points N] [--lines N]
+
+import os
+import sys
+import time
+import argparse
+import warnings
+import numpy as np
+import geopandas as gpd
+import shapely
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from wind_siting.nearest import NearestLineIndex
+
+quad_segs = 16
+
+
+def random_lines(n_lines, rng):
+    starts = rng.uniform((0, 0), (20, 10), (n_lines, 2))
+    steps = rng.normal(0, 0.5, (n_lines, 4, 2))
+    return list(shapely.linestrings(np.concatenate([starts[:, None, :], starts[:, None, :] + np.cumsum(steps, axis=1)],
+                                                   axis=1)))
+
+
+# For each point, a short line tangent to a circle around it, at a distance
+# in the sliver between radius's buffer and its circle, at a random angle.
+def sliver_lines(points, radius, rng):
+    apothem = radius * np.cos(np.pi / (4 * quad_segs))
+    distance = rng.uniform(apothem, radius, len(points))
+    angle = rng.uniform(0, 2 * np.pi, len(points))
+    xy = shapely.get_coordinates(points)
+    mid = xy + distance[:, None] * np.column_stack([np.cos(angle), np.sin(angle)])
+    along = 0.002 * radius * np.column_stack([-np.sin(angle), np.cos(angle)])
+    return list(shapely.linestrings(np.stack([mid - along, mid + along], axis=1)))
+
+
+def per_row_line_count(points, power_lines, radius):
+    buffers = gpd.GeoDataFrame({'id': np.arange(len(points))},
+                               geometry=points.apply(lambda x: x.buffer(radius, quad_segs)).values, crs=power_lines.crs)
+    candidate_lines = gpd.sjoin(power_lines, buffers, how='right')
+    return candidate_lines.groupby('id')['OBJECTID'].count().reindex(buffers['id']).values
+
+
+if __name__ == '__main__':
+    warnings.simplefilter('ignore')
+    parser = argparse.ArgumentParser(description='count_within against buffers, sjoin and groupby.')
+    parser.add_argument('--points', type=int, default=500)
+    parser.add_argument('--lines', type=int, default=400)
+    parser.add_argument('--radii', type=float, nargs='+', default=[1.0, 0.5, 0.25])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    points = gpd.GeoSeries(shapely.points(rng.uniform((1, 1), (19, 9), (args.points, 2))), crs='epsg:4326')
+    lines = random_lines(args.lines, rng)
+    slivers = []
+    for radius in args.radii:
+        slivers += sliver_lines(np.asarray(points.values), radius, rng)
+    power_lines = gpd.GeoDataFrame({'OBJECTID': np.arange(len(lines) + len(slivers))},
+                                   geometry=lines + slivers, crs='epsg:4326')
+
+    start = time.perf_counter()
+    before = np.column_stack([per_row_line_count(points, power_lines, radius) for radius in args.radii])
+    before_time = time.perf_counter() - start
+    line_index = NearestLineIndex(power_lines)
+    start = time.perf_counter()
+    after = line_index.count_within(points, args.radii)
+    after_time = time.perf_counter() - start
+    circle = line_index.count_within(points, args.radii, quad_segs=None)
+
+    mismatched = np.flatnonzero((before != after).any(axis=1))
+    if len(mismatched):
+        first = mismatched[0]
+        sys.exit("{} of {} points have different counts, e.g. point {} ({}): {} with buffers, {} with count_within".format(
+                 len(mismatched), len(points), first, points.iloc[first], before[first], after[first]))
+
+# Which of the sliver lines made it into the buffer of the point they were
+# placed around, to show there were both kinds.
+    sliver_points = np.tile(np.asarray(points.values), len(args.radii))
+    sliver_radii = np.repeat(args.radii, len(points))
+    buffers = shapely.buffer(sliver_points, sliver_radii, quad_segs=quad_segs)
+    in_buffer = shapely.intersects(buffers, np.array(slivers, dtype=object))
+    assert in_buffer.any() and not in_buffer.all(), "every sliver line fell on the same side of its buffer's edge"
+    differ = np.count_nonzero((circle != after).any(axis=1))
+    assert differ > 0, "the sliver lines didn't change any count against the true circle"
+
+    print("{} points, {} lines ({} in a buffer's sliver: {} inside the buffer, {} outside), radii {}".format(
+          len(points), power_lines.shape[0], len(slivers), np.count_nonzero(in_buffer),
+          np.count_nonzero(~in_buffer), ', '.join(str(radius) for radius in args.radii)))
+    print("same counts as buffers + sjoin for every point; {} points would differ against the true circle".format(differ))
+    print("buffers + sjoin {:.2f} s, count_within {:.3f} s".format(before_time, after_time))
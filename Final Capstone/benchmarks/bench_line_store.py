@@ -0,0 +1,188 @@
+#!/usr/bin/python3
+
+# What it costs a state to get hold of its power lines, on a synthetic
+# national network (wind_siting/fixtures.py): reading its own power_by_state
+# file (the nrel stage before the line store), picking its rows out of
+# power_out_df and shipping them to a worker (the turbines stage before the
+# line store), against looking them up in the line store, by state or by the
+# state's bounding box. Checks that the store gives back exactly the rows
+# power_out_df has.
+#
+# Then memory with --workers processes going through every state between
+# them. Before, the parent held all of power_out_df and each worker got its
+# own pickled copy of its lines; now each worker maps the store. Private
+# memory (RssAnon: parsed geometries, frames) is per process and adds up;
+# mapped pages (RssFile) sit in the page cache once, however many workers
+# map them.
+# Run from the "Final Capstone" directory:
+#   python3 benchmarks/bench_line_store.py [--lines N] [--states N] [--workers N ...]
+
+import os
+import sys
+import time
+import pickle
+import shutil
+import argparse
+import tempfile
+import warnings
+import contextlib
+import multiprocessing
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from wind_siting import line_store, stages, storage
+from wind_siting.fixtures import make_states, make_power_lines
+from wind_siting.nearest import LINE_ATTRIBUTES
+
+
+def memory_status():
+    fields = {}
+    with open('/proc/self/status') as f:
+        for line in f:
+            name, _, value = line.partition(':')
+            if name in ('RssAnon', 'RssFile'):
+                fields[name] = int(value.split()[0]) * 1024
+    return fields
+
+
+def timed(func, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+# Rows of two frames are the same lines in the same order.
+def same_rows(a, b):
+    columns = [col for col in a.columns if col != 'geometry']
+    pd.testing.assert_frame_equal(pd.DataFrame(a[columns]).reset_index(drop=True),
+                                  pd.DataFrame(b[columns]).reset_index(drop=True), check_dtype=False)
+    assert a.geometry.reset_index(drop=True).geom_equals_exact(b.geometry.reset_index(drop=True), 0).all()
+
+
+# One worker's share of the states, held until the end (an upper bound: a
+# worker lets go of each state's lines once it's done with them). Returns
+# the rows, the worker's private memory by then and what it mapped from disk.
+# A worker's pickled lines arrive before it starts, so its private memory is
+# measured against an idle worker rather than from when it starts.
+def idle():
+    return memory_status()
+
+
+def worker_pickled(blobs):
+    start = memory_status()
+    frames = [pickle.loads(blob) for blob in blobs]
+    end = memory_status()
+    return sum(frame.shape[0] for frame in frames), end['RssAnon'], end['RssFile'] - start['RssFile']
+
+
+def worker_store(root, states):
+    start = memory_status()
+    store = line_store.open_store(root)
+    frames = [store.for_states([state], LINE_ATTRIBUTES) for state in states]
+    end = memory_status()
+    return sum(frame.shape[0] for frame in frames), end['RssAnon'], end['RssFile'] - start['RssFile']
+
+
+# Before: the parent reads power_out_df and pickles each state's lines for
+# the worker that gets it (and keeps them until every state is done).
+def parent_pickled(root, states, workers, queue):
+    start = memory_status()
+    power_out_df = storage.read_frame('{}/power_out_df'.format(root))
+    shares = [[pickle.dumps(power_out_df.loc[power_out_df['state'] == state].copy(deep=True))
+               for state in states[worker::workers]] for worker in range(workers)]
+    parent = memory_status()['RssAnon'] - start['RssAnon']
+    with multiprocessing.get_context('spawn').Pool(workers) as pool:
+        results = pool.map(worker_pickled, shares)
+    queue.put((parent, results))
+
+
+# Now: the parent never touches the lines.
+def parent_store(root, states, workers, queue):
+    with multiprocessing.get_context('spawn').Pool(workers) as pool:
+        results = pool.starmap(worker_store, [(root, states[worker::workers]) for worker in range(workers)])
+    queue.put((0, results))
+
+
+# Each layout runs in a fresh process, and its workers are spawned rather
+# than forked, so nobody starts out with someone else's heap.
+def run_layout(target, root, states, workers):
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=target, args=(root, states, workers, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+if __name__ == '__main__':
+    warnings.simplefilter('ignore')
+    parser = argparse.ArgumentParser(description='Per-state power line setup: state files and power_out_df vs the line store.')
+    parser.add_argument('--lines', type=int, default=50000)
+    parser.add_argument('--states', type=int, default=16)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    borders = make_states(args.states, rng)
+    power_lines = make_power_lines(args.lines, rng)
+    root = tempfile.mkdtemp(prefix='line_store_')
+    try:
+        os.makedirs(os.path.join(root, 'power_by_state'))
+        with contextlib.redirect_stdout(open(os.devnull, 'w')):
+            power_out_df = stages.power_lines_by_state(power_lines, borders[['STUSPS','geometry']])
+        storage.write_frame(power_out_df, '{}/power_out_df'.format(root), 'parquet')
+        states = sorted(power_out_df['state'].unique())
+        for state in states:
+            storage.write_frame(power_out_df.loc[power_out_df['state'] == state],
+                                '{}/power_by_state/power_{}'.format(root, state), 'parquet')
+        _, build = timed(lambda: line_store.write_store(root, power_out_df), repeat=1)
+        store_bytes = sum(os.path.getsize(os.path.join(line_store.store_path(root), name))
+                          for name in os.listdir(line_store.store_path(root)))
+        print("{} lines, {} rows in power_out_df, {} states; store built in {:.2f} s, {:.1f} MiB on disk".format(
+              power_lines.shape[0], power_out_df.shape[0], len(states), build, store_bytes / 2**20))
+
+        _, read_national = timed(lambda: storage.read_frame('{}/power_out_df'.format(root)))
+        _, open_national = timed(lambda: line_store.PowerLineStore(line_store.store_path(root)))
+        print("once per process: read power_out_df {:.1f} ms, open the store {:.2f} ms".format(
+              read_national * 1000, open_national * 1000))
+
+        store = line_store.open_store(root)
+        print("{:<6} {:>7} {:>12} {:>14} {:>10} {:>10} {:>9}".format(
+              'state', 'rows', 'state file', 'power_out_df', 'store', 'bbox', 'speedup'))
+        totals = np.zeros(4)
+        for state in states:
+            state_file, file_time = timed(lambda: storage.read_frame('{}/power_by_state/power_{}'.format(root, state)))
+            shipped, ship_time = timed(lambda: pickle.loads(pickle.dumps(
+                power_out_df.loc[power_out_df['state'].isin([state])].copy(deep=True))))
+            looked_up, store_time = timed(lambda: store.for_states([state]))
+            bounds = borders.loc[borders['STUSPS'] == state].total_bounds
+            in_bbox, bbox_time = timed(lambda: store.in_bbox(bounds))
+            same_rows(shipped, looked_up)
+            same_rows(state_file, looked_up)
+            assert set(looked_up['OBJECTID']) <= set(in_bbox['OBJECTID'])
+            totals += [file_time, ship_time, store_time, bbox_time]
+            print("{:<6} {:>7} {:>10.2f}ms {:>12.2f}ms {:>8.2f}ms {:>8.2f}ms {:>8.1f}x".format(
+                  state, looked_up.shape[0], file_time * 1000, ship_time * 1000, store_time * 1000,
+                  bbox_time * 1000, min(file_time, ship_time) / store_time))
+        print("{:<6} {:>7} {:>10.2f}ms {:>12.2f}ms {:>8.2f}ms {:>8.2f}ms {:>8.1f}x".format(
+              'total', '', *(totals * 1000), totals[:2].min() / totals[2]))
+
+        with multiprocessing.get_context('spawn').Pool(1) as pool:
+            baseline = pool.apply(idle)['RssAnon']
+        print("{:<14} {:>8} {:>12} {:>12} {:>12} {:>12}".format(
+              'layout', 'workers', 'parent MiB', 'worker MiB', 'total MiB', 'mapped MiB'))
+        for workers in args.workers:
+            for name, target in [('power_out_df', parent_pickled), ('line store', parent_store)]:
+                parent, results = run_layout(target, root, states, workers)
+                assert sum(result[0] for result in results) == power_out_df.shape[0]
+                private = [max(result[1] - baseline, 0) for result in results]
+                print("{:<14} {:>8} {:>12.1f} {:>12.1f} {:>12.1f} {:>12.1f}".format(
+                      name, workers, parent / 2**20, max(private) / 2**20, (parent + sum(private)) / 2**20,
+                      max(result[2] for result in results) / 2**20))
+    finally:
+        shutil.rmtree(root)
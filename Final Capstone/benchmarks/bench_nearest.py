@@ -0,0 +1,111 @@
+#!/usr/bin/python3
+
+# Check wind_siting.nearest.NearestLineIndex against the per-row loop the
+# capstone scripts used to find each point's nearest power line:
+#   nearest_points(point, unary_union of the lines), then the distance from
+#   the point it found on the union to every line, and the first line at
+#   the minimum (np.where(...)[0][0])
+# on random lines and points, plus the ties that loop settles by frame order:
+#   duplicates    copies of some of the lines, later in the frame
+#   stars         lines that all start at one vertex, with points on the far
+#                 side of it, so the vertex is the nearest point of each
+#   on a line     points that sit exactly on a vertex of a line
+# Asserts that both pick the same line for every point, at the same distance
+# (to 1e-12), and prints how long each took.
+# Run from the "Final Capstone" directory:
+#   python3 benchmarks/bench_nearest.py [--lines N] [--points N]
+
+import os
+import sys
+import time
+import argparse
+import warnings
+import numpy as np
+import geopandas as gpd
+import shapely
+
+from shapely.ops import nearest_points
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from wind_siting.nearest import NearestLineIndex
+
+
+# Random polylines of a few segments each, in a 20 x 10 degree box.
+def random_lines(n_lines, rng):
+    starts = rng.uniform((0, 0), (20, 10), (n_lines, 2))
+    steps = rng.normal(0, 0.5, (n_lines, 4, 2))
+    coords = np.concatenate([starts[:, None, :], starts[:, None, :] + np.cumsum(steps, axis=1)], axis=1)
+    return list(shapely.linestrings(coords))
+
+
+# n_stars vertices with five lines each, all leading away to the right
+# (within 45 degrees of east), and a point to the left of each vertex.
+def star_lines(n_stars, rng):
+    lines, points = [], []
+    for vertex in rng.uniform((1, 1), (19, 9), (n_stars, 2)):
+        for angle in rng.uniform(-np.pi / 4, np.pi / 4, 5):
+            lines.append(shapely.LineString([vertex, vertex + 0.3 * np.array([np.cos(angle), np.sin(angle)])]))
+        points.append(shapely.Point(vertex - rng.uniform(0.05, 0.5) * np.array([1, rng.uniform(-0.5, 0.5)])))
+    return lines, points
+
+
+def make_lines(n_lines, n_points, rng):
+    lines = random_lines(n_lines, rng)
+    lines += [lines[idx] for idx in rng.choice(len(lines), n_lines // 10, replace=False)]
+    stars, star_points = star_lines(n_lines // 20, rng)
+    lines += stars
+    power_lines = gpd.GeoDataFrame({'OBJECTID': np.arange(len(lines)) + 1000,
+                                    'TYPE': 'AC; OVERHEAD',
+                                    'VOLTAGE': rng.choice([230.0, 345.0, 500.0], len(lines)),
+                                    'VOLT_CLASS': '345',
+                                    'SHAPE__Len': shapely.length(lines)},
+                                   geometry=lines, crs='epsg:4326')
+# Shuffle, so the copies and the stars aren't all at the end of the frame.
+    power_lines = power_lines.iloc[rng.permutation(len(power_lines))].reset_index(drop=True)
+
+    on_line = [shapely.Point(shapely.get_coordinates(lines[idx])[2]) for idx in rng.choice(n_lines, n_points // 10)]
+    points = list(shapely.points(rng.uniform((-1, -1), (21, 11), (n_points, 2)))) + star_points + on_line
+    return power_lines, gpd.GeoSeries(points, crs='epsg:4326')
+
+
+def per_row_nearest(points, power_lines):
+    lines_union = power_lines['geometry'].unary_union
+    line_idx, distance = [], []
+    for point in points:
+        on_point, on_line = nearest_points(point, lines_union)
+        pt_on_line_distances = power_lines['geometry'].distance(on_line).values
+        line_idx.append(np.where(pt_on_line_distances == pt_on_line_distances.min())[0][0])
+        distance.append(on_point.distance(on_line))
+    return np.array(line_idx), np.array(distance)
+
+
+if __name__ == '__main__':
+    warnings.simplefilter('ignore')
+    parser = argparse.ArgumentParser(description='NearestLineIndex against the per-row nearest line loop.')
+    parser.add_argument('--lines', type=int, default=300)
+    parser.add_argument('--points', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    power_lines, points = make_lines(args.lines, args.points, np.random.default_rng(args.seed))
+
+    start = time.perf_counter()
+    before_idx, before_distance = per_row_nearest(points, power_lines)
+    before = time.perf_counter() - start
+    start = time.perf_counter()
+    after = NearestLineIndex(power_lines).query(points)
+    elapsed = time.perf_counter() - start
+
+    after_idx = power_lines['OBJECTID'].reset_index(drop=True).reindex(before_idx).values
+    mismatched = np.flatnonzero(after['OBJECTID'].values != after_idx)
+    if len(mismatched):
+        first = mismatched[0]
+        sys.exit("{} of {} points have a different nearest line, e.g. point {} ({}): OBJECTID {} per row, {} indexed".format(
+                 len(mismatched), len(points), first, points.iloc[first], after_idx[first], after['OBJECTID'].iloc[first]))
+    assert np.allclose(before_distance, after['dist_to_nearest_line'].values, rtol=0, atol=1e-12)
+
+    ties = sum(np.count_nonzero(power_lines['geometry'].distance(point).values == distance) > 1
+               for point, distance in zip(points, after['dist_to_nearest_line'].values))
+    print("{} lines, {} points ({} tied between lines): same nearest line and distance for every point".format(
+          power_lines.shape[0], len(points), ties))
+    print("per row {:.2f} s, NearestLineIndex {:.3f} s".format(before, elapsed))
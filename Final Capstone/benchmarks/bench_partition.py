@@ -0,0 +1,120 @@
+#!/usr/bin/python3
+
+# Check wind_siting.partition.StatePartitioner against what
+# nrel_add_state_and_centroid.py used to do to split the NREL cells by state:
+#   gpd.sjoin(cells, borders, op='intersects', how='left'), then for each
+#   state a gpd.overlay(..., how='intersection') with that state's border,
+#   keeping the rows sjoin gave that state
+# on a grid of cells over a handful of made-up states with awkward borders:
+# a wavy one, a sloping one, an enclave (a state in a hole in another) and
+# the grid's own lines lying along some of them, so there are cells fully
+# inside a state, cells that straddle two or three, cells that only touch a
+# border along an edge, and cells offshore.
+# Asserts that both give the same (cell, state) pairs, the same columns, and
+# clipped geometries that are the same to within --tolerance of their area,
+# and prints how long each took.
+# Run from the "Final Capstone" directory:
+#   python3 benchmarks/bench_partition.py [--step DEG]
+
+import os
+import sys
+import time
+import argparse
+import warnings
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from wind_siting.partition import StatePartitioner
+
+
+# Four states over (0, 0, 10, 6): AA and BB split by a wavy line, CC across
+# the north above a sloping border, and DD an enclave inside BB.
+def make_borders():
+    y = np.linspace(0, 6, 61)
+    wavy = np.column_stack([5 + 0.7 * np.sin(1.3 * y), y])
+    west = shapely.Polygon(np.vstack([[(0, 6), (0, 0)], wavy]))
+    east = shapely.Polygon(np.vstack([wavy[::-1], [(10, 0), (10, 6)]]))
+    north = shapely.Polygon([(0, 4), (10, 5), (10, 6), (0, 6)])
+    enclave = shapely.Polygon([(7, 1), (8.5, 1.5), (8, 3), (7.25, 2.5)])
+    states = [('AA', west.difference(north)), ('BB', east.difference(north).difference(enclave)),
+              ('CC', north), ('DD', enclave)]
+    return gpd.GeoDataFrame({'STUSPS': [code for code, _ in states]},
+                            geometry=[geom for _, geom in states], crs='epsg:4326')
+
+
+# A grid of step x step cells from a degree past the states' edges, so the
+# outermost rings are offshore and the next one touches a border from outside.
+# The grid lines go through 0, 0, so they lie along the states' outer edges.
+def make_cells(step, rng):
+    x, y = np.meshgrid(np.arange(-int(1 / step), int(11 / step)) * step,
+                       np.arange(-int(1 / step), int(7 / step)) * step)
+    x, y = x.ravel(), y.ravel()
+    return gpd.GeoDataFrame({'id': np.arange(len(x)),
+                             'wind_class': rng.integers(1, 8, len(x)),
+                             'cap_factor': rng.uniform(0.1, 0.5, len(x))},
+                            geometry=shapely.box(x, y, x + step, y + step), crs='epsg:4326')
+
+
+def sjoin_overlay(cells, borders):
+    joined = gpd.sjoin(cells, borders[['STUSPS','geometry']], predicate='intersects', how='left')
+    joined = joined.drop(columns='index_right').rename(columns={'STUSPS': 'state'})
+    joined['state'] = joined['state'].fillna('Offshore')
+    frames = []
+    for state in joined['state'].unique():
+        if state == 'Offshore':
+            continue
+        state_df = gpd.overlay(joined, borders.loc[borders['STUSPS'] == state, ['geometry']], how='intersection')
+        frames.append(state_df.loc[state_df['state'] == state])
+    return gpd.GeoDataFrame(pd.concat(frames), crs=cells.crs)
+
+
+def by_pair(frame):
+    return frame.sort_values(['id','state']).reset_index(drop=True)
+
+
+if __name__ == '__main__':
+    warnings.simplefilter('ignore')
+    parser = argparse.ArgumentParser(description='StatePartitioner against sjoin plus an overlay per state.')
+    parser.add_argument('--step', type=float, default=0.2, help='cell size in degrees (default: %(default)s)')
+    parser.add_argument('--tolerance', type=float, default=1e-9,
+                        help='largest symmetric difference, as a fraction of the area (default: %(default)s)')
+    args = parser.parse_args()
+
+    borders = make_borders()
+    cells = make_cells(args.step, np.random.default_rng(0))
+
+    start = time.perf_counter()
+    before = by_pair(sjoin_overlay(cells, borders))
+    before_time = time.perf_counter() - start
+    start = time.perf_counter()
+    after = by_pair(StatePartitioner(borders[['STUSPS','geometry']]).partition(cells).rename(columns={'STUSPS': 'state'}))
+    after_time = time.perf_counter() - start
+
+    assert sorted(before.columns) == sorted(after.columns), (list(before.columns), list(after.columns))
+    pd.testing.assert_frame_equal(pd.DataFrame(before.drop(columns='geometry')),
+                                  pd.DataFrame(after[before.columns].drop(columns='geometry')), check_dtype=False)
+    before_geoms = np.asarray(before.geometry.values)
+    after_geoms = np.asarray(after.geometry.values)
+    difference = shapely.area(shapely.symmetric_difference(before_geoms, after_geoms)) / shapely.area(before_geoms)
+    assert (difference <= args.tolerance).all(), "{} clipped cells differ, by up to {:.2e} of their area".format(
+           np.count_nonzero(difference > args.tolerance), difference.max())
+
+# What kinds of cells there were, so a grid that misses one shows up.
+    border_geoms = np.asarray(borders.geometry.values)
+    cell_geoms = np.asarray(cells.geometry.values)
+    states_per_cell = after['id'].value_counts().reindex(cells['id'], fill_value=0).to_numpy()
+    within = shapely.within(cell_geoms[:, None], border_geoms[None, :]).any(axis=1)
+    touching = shapely.touches(cell_geoms[:, None], border_geoms[None, :]).any(axis=1) & (states_per_cell == 0)
+    kinds = {'inside one state': np.count_nonzero(within),
+             'straddling': np.count_nonzero(states_per_cell > 1),
+             'in three states': np.count_nonzero(states_per_cell > 2),
+             'touching only': np.count_nonzero(touching),
+             'offshore': np.count_nonzero(states_per_cell == 0) - np.count_nonzero(touching)}
+    assert all(count > 0 for count in kinds.values()), kinds
+    print("{} cells, {} (cell, state) pairs: {}".format(
+          cells.shape[0], after.shape[0], ', '.join('{} {}'.format(count, kind) for kind, count in kinds.items())))
+    print("same pairs and columns; clipped geometries the same to {:.1e} of their area".format(difference.max()))
+    print("sjoin + overlay {:.2f} s, StatePartitioner {:.3f} s".format(before_time, after_time))
@@ -0,0 +1,159 @@
+#!/usr/bin/python3
+
+# Run the whole pipeline -- the centroid, power, turbines and nrel stages of
+# python3 -m wind_siting run -- on synthetic inputs (wind_siting/fixtures.py)
+# at one or more scales, and record each stage's throughput and peak memory,
+# as the pipeline's own instrumentation reports them, to a results file.
+# Every run is appended, tagged with the git commit, and compared with the
+# last run at the same scale, so a change that slows a stage down shows up
+# in the table. The results file (benchmarks/pipeline_results.jsonl unless
+# --results says otherwise) is local to the checkout and ignored by git.
+#
+# Each stage runs in its own process, on a fresh copy of the inputs, exactly
+# as it would from the command line, with a config file that points every
+# stage at the fixtures. Nothing touches the network.
+# Run from the "Final Capstone" directory:
+#   python3 benchmarks/bench_pipeline.py [--scale small medium large] [--workers N]
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+capstone_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, capstone_dir)
+from wind_siting import config
+from wind_siting.fixtures import scales, write_fixtures
+from wind_siting.instrument import read_report
+
+default_results = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pipeline_results.jsonl')
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=capstone_dir,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Every stage reads and writes the fixture directory.
+def write_config(data_dir):
+    config_path = os.path.join(data_dir, 'wind_siting.ini')
+    with open(config_path, 'w') as f:
+        f.write("[DEFAULT]\nin = {0}\nfeatures_in = {0}\nout = {0}\n".format(data_dir))
+    return config_path
+
+
+def run_script(name, config_path, data_dir, report, log, workers, extra=()):
+    argv = ['run', name, '--config', config_path, '--report', report, '--workers', str(workers)] + list(extra)
+    env = dict(os.environ, PYTHONPATH=os.path.abspath(capstone_dir))
+    start = time.perf_counter()
+    log.flush()
+    log_start = log.tell()
+    if subprocess.run([sys.executable, '-W', 'ignore', '-m', 'wind_siting'] + argv, cwd=data_dir, env=env,
+                      stdout=log, stderr=subprocess.STDOUT).returncode != 0:
+        log.seek(log_start)
+        raise RuntimeError("{} failed:\n{}".format(name, ''.join(log.readlines()[-20:])))
+    return time.perf_counter() - start
+
+
+# One result per (script, stage), summed over states, plus each script's
+# total from the outside.
+def stage_results(records, script, wall):
+    stages = {}
+    for record in records:
+        if record['script'] != script:
+            continue
+        stage = stages.setdefault(record['stage'], {'calls': 0, 'rows': 0, 'wall_s': 0.0, 'cpu_s': 0.0, 'peak_rss': 0})
+        stage['calls'] += record['calls']
+        stage['rows'] += record['rows'] or 0
+        stage['wall_s'] += record['wall_s']
+        stage['cpu_s'] += record['cpu_s']
+        stage['peak_rss'] = max(stage['peak_rss'], record['peak_rss'])
+    stages['total'] = {'calls': 1, 'rows': 0, 'wall_s': wall, 'cpu_s': None,
+                       'peak_rss': max([stage['peak_rss'] for stage in stages.values()] or [0])}
+    for stage in stages.values():
+        stage['rows_per_s'] = stage['rows'] / stage['wall_s'] if stage['rows'] and stage['wall_s'] else None
+    return stages
+
+
+def previous_results(results_path):
+    previous = {}
+    if os.path.exists(results_path):
+        with open(results_path) as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    continue
+                previous[(result['scale'], result['script'], result['stage'])] = result
+    return previous
+
+
+# Change from the last run: in throughput where the stage counts rows,
+# in wall time where it doesn't. Negative is slower.
+def change(result, last):
+    if last is None:
+        return ''
+    if result['rows_per_s'] and last.get('rows_per_s'):
+        return '{:+.0f}%'.format(100 * (result['rows_per_s'] / last['rows_per_s'] - 1))
+    if result['wall_s'] and last.get('wall_s'):
+        return '{:+.0f}%'.format(100 * (last['wall_s'] / result['wall_s'] - 1))
+    return ''
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the wind-siting pipeline on synthetic inputs.')
+    parser.add_argument('--scale', nargs='+', choices=sorted(scales), default=['small'])
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--results', default=default_results,
+                        help='JSON-lines file each run is appended to (default: %(default)s)')
+    parser.add_argument('--keep', action='store_true',
+                        help="don't delete the fixtures and outputs afterwards")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    previous = previous_results(args.results)
+    print("{:<7} {:<28} {:<18} {:>6} {:>10} {:>9} {:>11} {:>8} {:>8}".format(
+          'scale', 'script', 'stage', 'calls', 'rows', 'wall s', 'rows/s', 'peak MB', 'vs last'))
+    for scale in args.scale:
+        data_dir = tempfile.mkdtemp(prefix='wind_siting_{}_'.format(scale))
+        report = os.path.join(data_dir, 'instrumentation.jsonl')
+        try:
+            start = time.perf_counter()
+            counts = write_fixtures(data_dir, scale)
+            print("{:<7} fixtures: {} ({:.1f} s)".format(
+                  scale, ', '.join('{} {}'.format(count, name) for name, count in counts.items()),
+                  time.perf_counter() - start))
+            config_path = write_config(data_dir)
+            results = []
+            with open(os.path.join(data_dir, 'pipeline.log'), 'w+') as log:
+# The score stage needs a fitted model; benchmarks/bench_scoring.py has it.
+                for script in [stage for stage in config.stages if stage != 'score']:
+                    wall = run_script(script, config_path, data_dir, report, log, args.workers)
+                    stages = stage_results(read_report(report), script, wall)
+                    for stage, result in sorted(stages.items(), key=lambda item: (item[0] == 'total', item[0])):
+                        result.update({'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit': commit,
+                                       'scale': scale, 'cells': counts['cells'], 'workers': args.workers,
+                                       'script': script, 'stage': stage})
+                        results.append(result)
+                        print("{:<7} {:<28} {:<18} {:>6} {:>10} {:>9.2f} {:>11} {:>8.0f} {:>8}".format(
+                              scale, script, stage, result['calls'], result['rows'] or '', result['wall_s'],
+                              '{:.0f}'.format(result['rows_per_s']) if result['rows_per_s'] else '',
+                              result['peak_rss'] / 2**20, change(result, previous.get((scale, script, stage)))))
+            augmented = [name for name in os.listdir(os.path.join(data_dir, 'nrel_augmented_by_state'))
+                         if name.endswith('.geojson')]
+            assert len(augmented) == counts['states'], "expected {} augmented state files, got {}".format(
+                   counts['states'], len(augmented))
+            with open(args.results, 'a') as f:
+                f.write(''.join(json.dumps(result) + '\n' for result in results))
+        finally:
+            if args.keep:
+                print("Fixtures and outputs kept in", data_dir)
+            else:
+                shutil.rmtree(data_dir)
+    print("Results appended to", args.results)
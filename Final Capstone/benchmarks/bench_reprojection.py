@@ -0,0 +1,108 @@
+#!/usr/bin/python3
+
+# Time the reprojection each state pays for, on synthetic inputs
+# (wind_siting/fixtures.py): geopandas' .to_crs() on every call, as the
+# scripts used to do it, against wind_siting.projection with its cached
+# transformers, and what the 'metres' distance mode adds on top (the lines
+# and points put in the state's conic once). Then the same for the chunked
+# national passes (power lines and NREL cells, 1000 rows at a time).
+# Run from the "Final Capstone" directory:
+#   python3 benchmarks/bench_reprojection.py [--scale small medium large]
+
+import os
+import sys
+import time
+import argparse
+import warnings
+import numpy as np
+import geopandas as gpd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from wind_siting import projection
+from wind_siting.fixtures import scales, make_fixtures
+
+chunk_size = 1000
+old_crs = {'init': 'epsg:4326'}
+
+
+def timed(func, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+# Per state: the turbines put in the cells' CRS for the turbine join, and in
+# the wind_class lookup's CRS, as the turbines and nrel stages do.
+def state_before(turbines):
+    turbines.to_crs(old_crs)
+    turbines['geometry'].to_crs(old_crs)
+
+
+def state_after(turbines, crs):
+    projection.to_crs(turbines, crs)
+    projection.to_crs(turbines['geometry'], crs)
+
+
+def state_metres(turbines, centroids, lines):
+    projection.distance_frames(lines, turbines['geometry'], 'metres')
+    projection.distance_frames(lines, centroids, 'metres')
+
+
+def chunked(frame, reproject):
+    for first_idx in range(0, frame.shape[0], chunk_size):
+        reproject(frame.iloc[first_idx:first_idx + chunk_size])
+
+
+if __name__ == '__main__':
+    warnings.simplefilter('ignore')
+    parser = argparse.ArgumentParser(description='Time per-state and per-chunk reprojection.')
+    parser.add_argument('--scale', nargs='+', choices=sorted(scales), default=['medium'])
+    args = parser.parse_args()
+
+    for scale in args.scale:
+        fixtures = make_fixtures(scale)
+        states = fixtures['states']
+        cells = fixtures['cells']
+        cell_crs = projection.as_crs(old_crs)
+        centroids = cells['geometry'].centroid.set_crs(cell_crs, allow_override=True)
+        cell_state = gpd.sjoin(gpd.GeoDataFrame(geometry=centroids), states[['STUSPS','geometry']],
+                               how='inner', predicate='within')['STUSPS']
+        lines = fixtures['power_lines']
+
+        print("{} ({} states, {} cells, {} turbines, {} lines)".format(
+              scale, states.shape[0], cells.shape[0], fixtures['turbines'].shape[0], lines.shape[0]))
+        print("{:<6} {:>8} {:>9} {:>12} {:>12} {:>9} {:>12}".format(
+              'state', 'cells', 'turbines', 'before ms', 'after ms', 'speedup', 'metres ms'))
+        totals = np.zeros(3)
+        for state in sorted(states['STUSPS']):
+            turbines = fixtures['turbines'].loc[fixtures['turbines']['t_state'] == state]
+            state_centroids = centroids.loc[cell_state.index[cell_state == state]]
+            state_lines = lines.loc[lines.intersects(states.loc[states['STUSPS'] == state, 'geometry'].iloc[0])]
+            if turbines.shape[0] == 0:
+                continue
+            before = timed(lambda: state_before(turbines))
+            after = timed(lambda: state_after(turbines, cell_crs))
+            metres = timed(lambda: state_metres(turbines, state_centroids, state_lines))
+            totals += [before, after, metres]
+            print("{:<6} {:>8} {:>9} {:>12.2f} {:>12.2f} {:>8.1f}x {:>12.2f}".format(
+                  state, state_centroids.shape[0], turbines.shape[0], before * 1000, after * 1000,
+                  before / after, metres * 1000))
+        print("{:<6} {:>8} {:>9} {:>12.2f} {:>12.2f} {:>8.1f}x {:>12.2f}".format(
+              'total', '', '', totals[0] * 1000, totals[1] * 1000, totals[0] / totals[1], totals[2] * 1000))
+
+        print("{:<22} {:>12} {:>12} {:>9}".format('national pass', 'before ms', 'after ms', 'speedup'))
+        cells_raw = cells.set_crs('epsg:4269', allow_override=True)
+# The power lines are now reprojected once; the NREL cells are still
+# streamed a chunk at a time, but with one transformer for every chunk.
+        passes = [('power lines', lines.set_crs('epsg:4269', allow_override=True),
+                   lambda frame: projection.to_crs(frame, old_crs)),
+                  ('NREL cells', cells_raw,
+                   lambda frame: chunked(frame, lambda chunk: projection.to_crs(chunk, old_crs)))]
+        for name, frame, reproject in passes:
+            before = timed(lambda: chunked(frame, lambda chunk: chunk.to_crs(old_crs)))
+            after = timed(lambda: reproject(frame))
+            print("{:<22} {:>12.1f} {:>12.1f} {:>8.1f}x".format(name, before * 1000, after * 1000, before / after))
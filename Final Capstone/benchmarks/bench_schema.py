@@ -0,0 +1,141 @@
+#!/usr/bin/python3
+
+# Memory per NREL cell on one large synthetic state (1M cells by default),
+# with the dtypes pandas and the readers give us against wind_siting.schema's
+# compact ones: the state's cells as the nrel stage loads them, and the
+# augmented cells cell_features makes out of them, column by column, in
+# bytes per cell as pandas counts them (the geometry column is just its
+# pointers; the GEOS polygons behind them are the same either way). Then the
+# RSS per cell, each way in a fresh process: with the cells loaded, with the
+# augmented cells (and the inputs the stage holds) once it's done, and the
+# peak. The polygons are most of that, so the RSS moves less than the
+# columns do, and the peak depends as much on when glibc happens to give
+# freed heap back as on the dtypes.
+# Run from the "Final Capstone" directory:
+#   python3 benchmarks/bench_schema.py [--cells N]
+
+import os
+import sys
+import ctypes
+import shutil
+import argparse
+import tempfile
+import warnings
+import contextlib
+import multiprocessing
+import numpy as np
+import geopandas as gpd
+import shapely
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from wind_siting import schema, stages
+from wind_siting.fixtures import extent, make_cells, make_power_lines, make_turbines
+from wind_siting.parallel import hwm_rss, reset_peak_rss
+from wind_siting.wind_class import WindClassLookup
+
+
+# What's resident, after handing the heap glibc is holding on to (freed,
+# but not given back) to the OS, so that's not counted as the frames'.
+def held_rss():
+    try:
+        ctypes.CDLL('libc.so.6').malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+
+
+# Inputs as the scripts wrote them before there was a schema: float64 and
+# strings throughout.
+def write_inputs(directory, n_cells):
+    rng = np.random.default_rng(0)
+    cells = make_cells(n_cells, rng).drop(columns='gid')
+    centroids = shapely.centroid(np.asarray(cells.geometry.values))
+    cells['state'] = 'TX'
+    cells['centroid_lat'] = shapely.get_y(centroids)
+    cells['centroid_long'] = shapely.get_x(centroids)
+    cells = cells[['id','wind_class','cap_factor','state','centroid_lat','centroid_long','geometry']]
+    cells['id'] = cells['id'].astype(float)
+    cells.to_parquet(os.path.join(directory, 'cells.parquet'), index=False)
+
+    state = gpd.GeoDataFrame({'STUSPS': ['TX']}, geometry=[shapely.box(*extent)], crs='epsg:4326')
+    power_lines = make_power_lines(2000, rng)
+    power_lines['state'] = 'TX'
+    power_lines.to_parquet(os.path.join(directory, 'power_lines.parquet'), index=False)
+    turbines = make_turbines(20000, state, rng).to_crs(cells.crs).rename(columns={'index': 't_index'})
+    turbines['wind_class'] = rng.integers(1, 8, turbines.shape[0]).astype(float)
+    turbines.to_parquet(os.path.join(directory, 'turbines.parquet'), index=False)
+    make_cells(20000, rng).to_parquet(os.path.join(directory, 'exclusions.parquet'), index=False)
+
+
+def load(directory, name, frame_schema, compact):
+    frame = gpd.read_parquet(os.path.join(directory, name + '.parquet'))
+    return schema.compact(frame, frame_schema) if compact else frame
+
+
+# One state through the nrel stage: load, add the features, and (with the
+# schema) compact what comes out, as wind_siting.pipeline.nrel_state does.
+def run_state(directory, compact):
+    start_rss = held_rss()
+    reset_peak_rss()
+    cells = load(directory, 'cells', schema.nrel_cells, compact)
+    loaded_rss = held_rss() - start_rss
+    power_lines = load(directory, 'power_lines', schema.power_lines, compact)
+    turbines = load(directory, 'turbines', schema.turbine_features, compact)
+    lookup = WindClassLookup.from_exclusions(load(directory, 'exclusions', schema.nrel_cells, compact))
+    loaded = schema.bytes_per_row(cells)
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        augmented = stages.cell_features(cells, power_lines, turbines, lookup)
+    if compact:
+        augmented = schema.compact(augmented, schema.cell_features)
+    cell_count = cells.shape[0]
+    del cells
+    return {'cells': cell_count,
+            'loaded': loaded,
+            'augmented': schema.bytes_per_row(augmented),
+            'loaded_rss': loaded_rss,
+            'augmented_rss': held_rss() - start_rss,
+            'peak_rss': hwm_rss() - start_rss,
+            'stats': stages.cell_statistics(augmented, 'TX').describe('TX')}
+
+
+def print_columns(title, before, after, cells):
+    print("{:<22} {:>12} {:>12}".format(title, 'before B', 'after B'))
+    for column in before.index:
+        print("{:<22} {:>12.1f} {:>12.1f}".format(column, before[column], after.get(column, np.nan)))
+    print("{:<22} {:>12.1f} {:>12.1f}   ({:.0f} MiB -> {:.0f} MiB for {} cells)".format(
+          'total per cell', before.sum(), after.sum(), before.sum() * cells / 2**20, after.sum() * cells / 2**20, cells))
+
+
+if __name__ == '__main__':
+    warnings.simplefilter('ignore')
+    parser = argparse.ArgumentParser(description='Bytes per NREL cell with and without the compact schema.')
+    parser.add_argument('--cells', type=int, default=1000000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='bench_schema_')
+    try:
+        write_inputs(directory, args.cells)
+# A fresh process for each, so neither inherits the other's heap.
+        with multiprocessing.get_context('spawn').Pool(1, maxtasksperchild=1) as pool:
+            before = pool.apply(run_state, (directory, False))
+        with multiprocessing.get_context('spawn').Pool(1, maxtasksperchild=1) as pool:
+            after = pool.apply(run_state, (directory, True))
+
+        cells = before['cells']
+        print_columns('loaded cells', before['loaded'], after['loaded'], cells)
+        print_columns('augmented cells', before['augmented'], after['augmented'], cells)
+        print("{:<22} {:>12} {:>12}".format('RSS per cell', 'before B', 'after B'))
+        for key, label in [('loaded_rss', 'cells loaded'), ('augmented_rss', 'augmented, held'), ('peak_rss', 'peak')]:
+            print("{:<22} {:>12.1f} {:>12.1f}".format(label, before[key] / cells, after[key] / cells))
+
+# What float32 costs the statistics that go into national_df.
+        print("{:<34} {:>12}".format('national stats', 'max rel diff'))
+        for column, stats in before['stats'].items():
+            diffs = [abs(after['stats'][column][stat] - value) / abs(value)
+                     for stat, value in stats.items() if isinstance(value, float) and value]
+            print("{:<34} {:>12.2e}".format(column, max(diffs)))
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,149 @@
+#!/usr/bin/python3
+
+# Scoring every NREL cell with a fitted model, on synthetic augmented states
+# of growing size (--cells), the notebook's way against the score stage's:
+#   whole state   read the state's augmented GeoJSON, build the features and
+#                 predict_proba all of its cells at once
+#   batched       wind_siting.pipeline.score_state: the feature columns
+#                 only, --batch-size cells at a time, each batch's scores
+#                 written before the next is read
+# Each runs in a fresh process, and reports cells/s and its peak RSS above
+# what the process held once the model was loaded, which for the score
+# stage should stay put however big the state gets. Checks that both give
+# every cell the same probability.
+#
+# Then the whole score stage (wind_siting.pipeline.run_score) over all of
+# the states, with each of --workers.
+# Run from the "Final Capstone" directory:
+#   python3 benchmarks/bench_scoring.py [--cells N ...] [--batch-size N] [--estimator rfc|svc|sgdc]
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import warnings
+import contextlib
+import multiprocessing
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from wind_siting import pipeline, plan, scoring, storage
+from wind_siting.fixtures import extent, state_codes, voltages
+from wind_siting.manifest import Manifest
+from wind_siting.parallel import hwm_rss, reset_peak_rss
+
+
+# n augmented cells for one state: the columns the model and the output
+# need, with values like the nrel stage's, plus the cells themselves.
+def make_augmented(n_cells, us_state, rng):
+    x = rng.uniform(extent[0], extent[2], n_cells)
+    y = rng.uniform(extent[1], extent[3], n_cells)
+    wind_class = np.clip(np.round(rng.normal(3, 1.5, n_cells)), 1, 7)
+    voltage = rng.integers(0, len(voltages), n_cells)
+# A few cells with no line near them (and so no line features), as in WY.
+    no_line = rng.random(n_cells) < 0.01
+    cells = gpd.GeoDataFrame({'id': np.arange(n_cells),
+                              'state': us_state,
+                              'centroid_lat': y + 0.01,
+                              'centroid_long': x + 0.01,
+                              'SHAPE__Len': np.where(no_line, np.nan, rng.lognormal(11, 1, n_cells)),
+                              'VOLTAGE': np.where(no_line, np.nan, [voltages[v][0] for v in voltage]),
+                              'VOLT_CLASS': np.where(no_line, None, [voltages[v][1] for v in voltage]),
+                              'dist_to_nearest_line': np.where(no_line, np.nan, rng.exponential(0.4, n_cells)),
+                              'line_count': np.where(no_line, np.nan, rng.poisson(3, n_cells)),
+                              'wind_class': wind_class,
+                              'turbine_count': np.where(rng.random(n_cells) < 0.02, rng.integers(1, 30, n_cells), 0),
+                              'wind_class_excl': np.where(rng.random(n_cells) < 0.4, wind_class, 0)},
+                             geometry=shapely.box(x, y, x + 0.02, y + 0.02), crs='epsg:4326')
+    return cells
+
+
+# The notebook: the whole state, geometries and all, then one predict_proba.
+def score_whole(model_file, input_file, output_file):
+    bundle = scoring.load_model(model_file)
+    start_rss = hwm_rss()
+    reset_peak_rss()
+    start = time.perf_counter()
+    cells = gpd.read_file(input_file)
+    scores = scoring.score_cells(cells, bundle)
+    scores.to_parquet(output_file, index=False)
+    return time.perf_counter() - start, hwm_rss() - start_rss, cells.shape[0]
+
+
+def score_batched(model_file, input_file, output_file, batch_size):
+    scoring.load_model(model_file)
+    start_rss = hwm_rss()
+    reset_peak_rss()
+    start = time.perf_counter()
+    manifest = Manifest(os.path.dirname(output_file), 'bench')
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        result = pipeline.score_state('XX', model_file, manifest, {}, input_file, output_file, batch_size)
+    return time.perf_counter() - start, hwm_rss() - start_rss, result['cells']
+
+
+def in_fresh_process(func, *args):
+    with multiprocessing.get_context('spawn').Pool(1, maxtasksperchild=1) as pool:
+        return pool.apply(func, args)
+
+
+if __name__ == '__main__':
+    warnings.simplefilter('ignore')
+    parser = argparse.ArgumentParser(description='Whole-state vs batched scoring of the augmented NREL cells.')
+    parser.add_argument('--cells', type=int, nargs='+', default=[25000, 100000, 400000])
+    parser.add_argument('--batch-size', type=int, default=plan.score_batch_size)
+    parser.add_argument('--estimator', choices=plan.estimators, default='rfc')
+    parser.add_argument('--train', type=int, default=5000, help='cells the model is fitted to (default: %(default)s)')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    root = tempfile.mkdtemp(prefix='bench_scoring_')
+    try:
+        os.makedirs(os.path.join(root, 'nrel_augmented_by_state'))
+        model_file = os.path.join(root, 'model.joblib')
+        start = time.perf_counter()
+        scoring.save_model(scoring.fit_model(make_augmented(args.train, 'XX', rng), args.estimator, 0), model_file)
+        print("{} fitted to {} cells in {:.1f} s ({:.1f} MiB on disk)".format(
+              args.estimator, args.train, time.perf_counter() - start, os.path.getsize(model_file) / 2**20))
+
+        states = []
+        for us_state, n_cells in zip(state_codes, args.cells):
+            make_augmented(n_cells, us_state, rng).to_file(
+                storage.artifact_path(plan.augmented_stem(root, us_state), 'geojson'), driver='GeoJSON')
+            states.append(us_state)
+
+        print("{:<8} {:>9} {:<12} {:>10} {:>12} {:>14}".format('state', 'cells', 'method', 'seconds', 'cells/s', 'peak MiB'))
+        for us_state in states:
+            input_file = storage.artifact_path(plan.augmented_stem(root, us_state), 'geojson')
+            whole_file = os.path.join(root, 'whole_{}.parquet'.format(us_state))
+            batched_file = os.path.join(root, 'batched_{}.parquet'.format(us_state))
+            for name, result in [('whole state', in_fresh_process(score_whole, model_file, input_file, whole_file)),
+                                 ('batched', in_fresh_process(score_batched, model_file, input_file, batched_file,
+                                                              args.batch_size))]:
+                elapsed, peak, cells = result
+                print("{:<8} {:>9} {:<12} {:>10.2f} {:>12.0f} {:>14.1f}".format(
+                      us_state, cells, name, elapsed, cells / elapsed, peak / 2**20))
+            whole = pd.read_parquet(whole_file)
+            batched = pd.read_parquet(batched_file)
+            assert np.array_equal(whole['id'].to_numpy(), batched['id'].to_numpy())
+            assert np.allclose(whole['siting_probability'].to_numpy(dtype=float), batched['siting_probability'].to_numpy(dtype=float),
+                               atol=1e-6, equal_nan=True)
+
+        print("{:<8} {:>9} {:>10} {:>12}".format('workers', 'cells', 'seconds', 'cells/s'))
+        for workers in args.workers:
+            out_dir = os.path.join(root, 'workers_{}'.format(workers))
+            run_args = argparse.Namespace(model=model_file, force=[], state=None, workers=workers,
+                                          memory_budget=None, batch_size=args.batch_size)
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(open(os.devnull, 'w')):
+                pipeline.run_score({'in': root, 'out': out_dir}, run_args)
+            elapsed = time.perf_counter() - start
+            cells = sum(args.cells[:len(states)])
+            print("{:<8} {:>9} {:>10.2f} {:>12.0f}".format(workers, cells, elapsed, cells / elapsed))
+    finally:
+        shutil.rmtree(root)
@@ -0,0 +1,177 @@
+#!/usr/bin/python3
+
+# How far the national statistics built from wind_siting.sketch are from the
+# exact ones, on synthetic states (wind_siting/fixtures.py) run through the
+# nrel stage's features. Each state's sketches are built a chunk at a time
+# and round-tripped through JSON, as a worker hands them back and the
+# manifest keeps them; then they're merged into national figures the way
+# run_nrel does (in state order), and the way a pool of workers would if
+# each merged its own states as they finished.
+#
+# Checks, for every feature in plan.statistics_columns, per state and
+# nationally, and fails if any is out of bounds:
+#   count, mean, std, min, max   the same as describe() on all the values,
+#                                to 1e-9 relative
+#   quantiles                    a rank error (how far, in fractions of the
+#                                values, the answer is from the right place)
+#                                within two centroids' width of the digest at
+#                                that quantile, pi * sqrt(q (1 - q)) /
+#                                compression each, at 999 quantiles
+# and prints the worst rank error against its bound, the 25/50/75% values
+# against describe()'s, and what the sketches cost.
+# Run from the "Final Capstone" directory:
+#   python3 benchmarks/bench_statistics.py [--scale medium] [--chunks N] [--workers N]
+
+import os
+import sys
+import json
+import time
+import argparse
+import warnings
+import contextlib
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from wind_siting import plan, schema, sketch, stages
+from wind_siting.fixtures import make_fixtures, scales
+from wind_siting.partition import StatePartitioner
+from wind_siting.wind_class import WindClassLookup
+
+quantiles = np.arange(1, 1000) / 1000
+
+
+# The features of every state's cells, as the nrel stage makes them.
+def state_features(fixtures):
+    borders = fixtures['states'][['STUSPS','geometry']]
+    cells = stages.split_cells_by_state(fixtures['cells'], StatePartitioner(borders), borders.crs)
+    power_out_df = stages.power_lines_by_state(stages.usable_power_lines(fixtures['power_lines']), borders)
+    turbines = fixtures['turbines'].to_crs(cells.crs).rename(columns={'index': 't_index'})
+    turbines['wind_class'] = np.random.default_rng(0).integers(1, 8, turbines.shape[0])
+    lookup = WindClassLookup.from_exclusions(fixtures['cells_excl'])
+    for us_state in sorted(cells['state'].unique()):
+        power_lines = power_out_df.loc[power_out_df['state'] == us_state]
+        augmented = stages.cell_features(cells.loc[cells['state'] == us_state], power_lines if power_lines.shape[0] else None,
+                                         turbines.loc[turbines['t_state'] == us_state], lookup,
+                                         plan.line_count_radius, plan.extra_line_count_radii, us_state)
+        yield us_state, schema.compact(augmented, schema.cell_features)
+
+
+# Where value would sit among the sorted values, as a range of quantiles
+# under describe()'s linear interpolation (a whole range when it's one of
+# the values, and that value repeats), and how far q is from that range.
+def rank_error(sorted_values, qs, estimates):
+    n = len(sorted_values)
+    left = np.searchsorted(sorted_values, estimates, 'left')
+    right = np.searchsorted(sorted_values, estimates, 'right')
+    below = np.clip(left, 1, n - 1)
+    gap = sorted_values[below] - sorted_values[below - 1]
+    between = below - 1 + (estimates - sorted_values[below - 1]) / np.where(gap > 0, gap, 1)
+    found = right > left
+    low = np.where(found, left, np.clip(between, 0, n - 1)) / (n - 1)
+    high = np.where(found, right - 1, np.clip(between, 0, n - 1)) / (n - 1)
+    return np.maximum(0, np.maximum(low - qs, qs - high))
+
+
+def rank_error_bound(qs, compression, n):
+    return 2 * np.pi * np.sqrt(qs * (1 - qs)) / compression + 1 / n
+
+
+# One feature's sketch against its exact values: the worst rank error and
+# its bound there, the quartiles both ways and the worst moment.
+def check(summary, values, compression):
+    values = np.sort(values[~np.isnan(values)])
+    if len(values) < 2:
+        return None
+    errors = rank_error(values, quantiles, summary.quantile(quantiles))
+    bounds = rank_error_bound(quantiles, compression, len(values))
+    worst = np.argmax(errors / bounds)
+    exact = pd.Series(values).describe()
+    described = summary.describe()
+    moments = max(abs(described[stat] - exact[stat]) / max(abs(exact[stat]), 1e-300)
+                  for stat in ['count','mean','std','min','max'])
+    return {'n': len(values),
+            'rank_error': errors[worst],
+            'bound': bounds[worst],
+            'q': quantiles[worst],
+            'quartiles': [(described[stat], exact[stat]) for stat in ['25%','50%','75%']],
+            'moments': moments,
+            'ok': bool((errors <= bounds).all() and moments < 1e-9)}
+
+
+def report(scope, column, result):
+    if result is None:
+        return True
+    quartiles = ' '.join('{:.4g}/{:.4g}'.format(*pair) for pair in result['quartiles'])
+    print("{:<16} {:<22} {:>9} {:>10.2e} {:>10.2e} {:>6.3f} {:>10.1e}  {}{}".format(
+          scope, column, result['n'], result['rank_error'], result['bound'], result['q'],
+          result['moments'], quartiles, '' if result['ok'] else '  OUT OF BOUNDS'))
+    return result['ok']
+
+
+if __name__ == '__main__':
+    warnings.simplefilter('ignore')
+    parser = argparse.ArgumentParser(description='Accuracy of the mergeable national statistics against exact ones.')
+    parser.add_argument('--scale', choices=sorted(scales), default='medium')
+    parser.add_argument('--chunks', type=int, default=8, help='chunks each state is added in (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=3, help='workers the states are shared out between (default: %(default)s)')
+    parser.add_argument('--compression', type=int, default=plan.statistics_compression)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    columns = plan.statistics_columns
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        features = list(state_features(make_fixtures(args.scale)))
+
+    state_stats = {}
+    exact = {}
+    sketch_time = describe_time = 0.0
+    json_bytes = []
+    for us_state, augmented in features:
+        start = time.perf_counter()
+        stats = sketch.FeatureStatistics(columns, args.compression)
+        for chunk in np.array_split(np.arange(augmented.shape[0]), args.chunks):
+            stats.update(augmented.iloc[chunk])
+        sketch_time += time.perf_counter() - start
+        start = time.perf_counter()
+        for column in columns:
+            augmented[column].astype('float64').describe()
+        describe_time += time.perf_counter() - start
+        recorded = json.dumps(stats.to_dict())
+        json_bytes.append(len(recorded))
+        state_stats[us_state] = sketch.FeatureStatistics.from_dict(json.loads(recorded))
+        exact[us_state] = {column: augmented[column].to_numpy(dtype=float, na_value=np.nan) for column in columns}
+
+# In state order, as run_nrel merges them.
+    national = sketch.FeatureStatistics(columns, args.compression)
+    for us_state in sorted(state_stats):
+        national.merge(state_stats[us_state])
+# Shared out between workers, each merging its states in the order they
+# happen to finish, and the workers' sketches merged in whatever order.
+    workers = [sketch.FeatureStatistics(columns, args.compression) for _ in range(args.workers)]
+    for number, us_state in enumerate(rng.permutation(sorted(state_stats))):
+        workers[number % args.workers].merge(state_stats[us_state])
+    pooled = sketch.FeatureStatistics(columns, args.compression)
+    for number in rng.permutation(args.workers):
+        pooled.merge(workers[number])
+
+    cells = sum(augmented.shape[0] for _, augmented in features)
+    print("{} states, {} cells, each added in {} chunks; compression {}".format(
+          len(features), cells, args.chunks, args.compression))
+    print("{:<16} {:<22} {:>9} {:>10} {:>10} {:>6} {:>10}  {}".format(
+          'scope', 'feature', 'values', 'rank err', 'bound', 'at q', 'moments', 'sketch/exact 25% 50% 75%'))
+    ok = True
+    for column in columns:
+        for us_state in sorted(state_stats):
+            ok &= report(us_state, column, check(state_stats[us_state].summaries[column],
+                                                 exact[us_state][column], args.compression))
+        everything = np.concatenate([exact[us_state][column] for us_state in sorted(exact)])
+        ok &= report('national', column, check(national.summaries[column], everything, args.compression))
+        ok &= report('national/pooled', column, check(pooled.summaries[column], everything, args.compression))
+
+    print("sketches: {:.0f} values/s per feature ({:.0f} for describe()), {:.1f} KiB of JSON per state, "
+          "{} centroids at most".format(cells * len(columns) / sketch_time, cells * len(columns) / describe_time,
+                                         np.mean(json_bytes) / 1024,
+                                         max(len(summary.digest) for summary in national.summaries.values())))
+    if not ok:
+        sys.exit("Some statistics were out of bounds")
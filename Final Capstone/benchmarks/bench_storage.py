@@ -0,0 +1,67 @@
+#!/usr/bin/python3
+
+# Compare GeoJSON and GeoParquet for the per-state intermediate files:
+# write and read throughput, a column-projected read (wind_class + geometry,
+# which is all the turbines stage needs from the NREL exclusion files), and
+# size on disk.
+# Run from the "Final Capstone" directory:
+#   python3 benchmarks/bench_storage.py [cells ...]
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import numpy as np
+import geopandas as gpd
+import shapely
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from wind_siting import storage
+
+
+# A square grid of NREL-like cells (~2km, in degrees) with the columns the
+# NREL state files carry.
+def make_cells(n_cells, rng):
+    side = int(np.ceil(np.sqrt(n_cells)))
+    cell = 0.02
+    x, y = np.meshgrid(np.arange(side) * cell - 100, np.arange(side) * cell + 35)
+    x = x.ravel()[:n_cells]
+    y = y.ravel()[:n_cells]
+    return gpd.GeoDataFrame({'id': np.arange(n_cells),
+                             'wind_class': rng.integers(1, 8, n_cells),
+                             'state': 'TX',
+                             'centroid_lat': y + cell / 2,
+                             'centroid_long': x + cell / 2,
+                             'capacity_factor': rng.random(n_cells),
+                             'elevation': rng.uniform(0, 3000, n_cells)},
+                            geometry=shapely.box(x, y, x + cell, y + cell),
+                            crs='epsg:4326')
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000]
+    rng = np.random.default_rng(0)
+    tmp_dir = tempfile.mkdtemp()
+    print("{:>8} {:>8} {:>10} {:>10} {:>13} {:>10} {:>17}".format(
+        'cells', 'format', 'MB', 'write s', 'write cells/s', 'read s', 'projected read s'))
+    try:
+        for n_cells in sizes:
+            cells = make_cells(n_cells, rng)
+            for fmt in ['geojson', 'parquet']:
+                stem = os.path.join(tmp_dir, 'nrel_w_exclusions_TX_{}'.format(n_cells))
+                path, write_s = timed(lambda: storage.write_frame(cells, stem, fmt))
+                full, read_s = timed(lambda: storage.read_frame(stem))
+                _, projected_s = timed(lambda: storage.read_frame(stem, columns=['wind_class']))
+                assert full.shape[0] == n_cells
+                print("{:>8} {:>8} {:>10.1f} {:>10.2f} {:>13.0f} {:>10.2f} {:>17.2f}".format(
+                    n_cells, fmt, os.path.getsize(path) / 2**20, write_s, n_cells / write_s, read_s, projected_s))
+                os.remove(path)
+    finally:
+        shutil.rmtree(tmp_dir)
@@ -0,0 +1,83 @@
+#!/usr/bin/python3
+
+# Peak RSS of reading a national NREL-style shapefile all at once and then
+# slicing it into chunks (what nrel_add_state_and_centroid.py used to do)
+# versus streaming it from disk with iter_batches. Each run happens in a
+# fresh process so the peaks don't contaminate each other.
+# Run from the "Final Capstone" directory:
+#   python3 benchmarks/bench_streaming.py [cells ...]
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import warnings
+import multiprocessing
+import numpy as np
+import geopandas as gpd
+import shapely
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from wind_siting.streaming import iter_batches
+from wind_siting.parallel import peak_rss
+
+chunk_size = 1000
+
+# The scripts take centroids in EPSG:4326 too; we know.
+warnings.filterwarnings('ignore', 'Geometry is in a geographic CRS')
+
+
+def write_cells(path, n_cells):
+    rng = np.random.default_rng(0)
+    side = int(np.ceil(np.sqrt(n_cells)))
+    x, y = np.meshgrid(np.arange(side) * 0.02 - 100, np.arange(side) * 0.02 + 35)
+    x = x.ravel()[:n_cells]
+    y = y.ravel()[:n_cells]
+    gpd.GeoDataFrame({'gid': np.arange(n_cells),
+                      'wind_class': rng.integers(1, 8, n_cells)},
+                     geometry=shapely.box(x, y, x + 0.02, y + 0.02),
+                     crs='epsg:4326').to_file(path)
+
+
+def whole_file(path):
+    nrel_wind_data = gpd.read_file(path)
+    rows = 0
+    for first_idx in range(0, nrel_wind_data.shape[0], chunk_size):
+        rows += nrel_wind_data[first_idx:first_idx + chunk_size].centroid.shape[0]
+    return rows
+
+
+def streamed(path):
+    rows = 0
+    for batch in iter_batches(path, chunk_size):
+        rows += batch.centroid.shape[0]
+    return rows
+
+
+def run(name, path, results):
+    func = {'whole file': whole_file, 'streamed': streamed}[name]
+    start = time.perf_counter()
+    rows = func(path)
+    results.put((rows, time.perf_counter() - start, peak_rss()))
+
+
+if __name__ == '__main__':
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100000, 400000]
+    context = multiprocessing.get_context('spawn')
+    tmp_dir = tempfile.mkdtemp()
+    print("{:>8} {:>11} {:>9} {:>14}".format('cells', 'method', 'seconds', 'peak RSS MiB'))
+    try:
+        for n_cells in sizes:
+            path = os.path.join(tmp_dir, 'ref_wind_{}.shp'.format(n_cells))
+            write_cells(path, n_cells)
+            for name in ['whole file', 'streamed']:
+                results = context.Queue()
+                proc = context.Process(target=run, args=(name, path, results))
+                proc.start()
+                rows, elapsed, peak = results.get()
+                proc.join()
+                assert rows == n_cells
+                print("{:>8} {:>11} {:>9.1f} {:>14.0f}".format(n_cells, name, elapsed, peak / 2**20))
+    finally:
+        shutil.rmtree(tmp_dir)
@@ -0,0 +1,162 @@
+#!/usr/bin/python3
+
+# The nrel stage with --partition states against --partition tiles, on
+# synthetic inputs (wind_siting/fixtures.py) run through the centroid,
+# power and turbines stages first. Each partitioning writes to a directory
+# of its own, from the same inputs, in its own process, as it would from the
+# command line. Reports each one's wall time, its longest job and the
+# biggest peak RSS of any of its jobs (from the pipeline's instrumentation),
+# which for tiles depends on --tile-size rather than on the biggest state.
+#
+# Then checks that tiling changed nothing, and fails if it did:
+#   augmented cells   every state's GeoJSON has the same cells, in the same
+#                     order, with the same features (and says whether the
+#                     files are byte for byte the same)
+#   national stats    count, min and max the same; mean and std to 1e-9
+#                     relative; the 25/50/75% within the digest's rank error
+#                     of the exact quantiles (a state that's put back
+#                     together in more than one batch adds its statistics up
+#                     a batch at a time, which the digest doesn't promise to
+#                     do exactly as it would all at once)
+# The fixtures' cells are far sparser than NREL's 2 km grid, so the tiles
+# are bigger by default than plan.tile_size: 6 degree tiles of the medium
+# fixtures hold about as many cells as 2 degree tiles of the real thing.
+# Run from the "Final Capstone" directory:
+#   python3 benchmarks/bench_tiles.py [--scale medium] [--tile-size DEG] [--workers N] [--distance metres]
+
+import os
+import sys
+import time
+import shutil
+import filecmp
+import argparse
+import tempfile
+import warnings
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from wind_siting import plan, schema, sketch, storage
+from wind_siting.fixtures import scales, write_fixtures
+from wind_siting.instrument import read_report
+from bench_pipeline import run_script, write_config
+from bench_statistics import rank_error, rank_error_bound
+
+moments = ['mean', 'std']
+exact_stats = ['count', 'min', 'max']
+
+
+# python3 -m wind_siting run nrel, with --out out_dir and these extra arguments.
+def run_nrel(config_path, data_dir, out_dir, report, log, workers, extra):
+    os.makedirs(os.path.join(out_dir, 'nrel_augmented_by_state'), exist_ok=True)
+    return run_script('nrel', config_path, data_dir, report, log, workers, ['--out', out_dir] + extra)
+
+
+# The longest job and the biggest peak of any job (state, or tile and the
+# splitting and putting back together of each state), from the report.
+def job_summary(report):
+    jobs = [record for record in read_report(report) if record['stage'] == 'state']
+    return (len(jobs), max(record['wall_s'] for record in jobs),
+            max(record['peak_rss'] for record in jobs))
+
+
+# The cells come back in the schema's dtypes, which is what the statistics
+# were added up from: GeoJSON has a float32 like 147779.375 as 147779.38.
+def compare_cells(states_file, tiles_file):
+    states_cells = gpd.read_file(states_file)
+    tiles_cells = gpd.read_file(tiles_file)
+    pd.testing.assert_frame_equal(pd.DataFrame(states_cells.drop(columns='geometry')),
+                                  pd.DataFrame(tiles_cells.drop(columns='geometry')))
+    assert states_cells.geometry.geom_equals_exact(tiles_cells.geometry, 0).all()
+    return schema.compact(states_cells, schema.cell_features)
+
+
+# Every column of national_df: the tiles' stats against the states', and
+# the quartiles against the exact values of the column's cells.
+def compare_stats(states_df, tiles_df, values):
+    worst = {'moments': 0.0, 'rank_error': 0.0, 'bound': np.inf}
+    ok = True
+    for column in states_df.columns:
+        states_stats, tiles_stats = states_df[column], tiles_df[column]
+        ok &= bool(np.allclose(states_stats[exact_stats], tiles_stats[exact_stats], rtol=0, atol=0, equal_nan=True))
+        diff = (np.abs(states_stats[moments] - tiles_stats[moments]) / np.abs(states_stats[moments])).max()
+        worst['moments'] = max(worst['moments'], diff if np.isfinite(diff) else 0.0)
+        ok &= bool(not np.isfinite(diff) or diff < 1e-9)
+        sorted_values = np.sort(values[column][~np.isnan(values[column])])
+        if len(sorted_values) < 2:
+            continue
+        qs = np.array(sketch.describe_quantiles)
+        errors = rank_error(sorted_values, qs, tiles_stats[['25%', '50%', '75%']].to_numpy(dtype=float))
+        bounds = rank_error_bound(qs, plan.statistics_compression, len(sorted_values))
+        if (errors / bounds).max() > worst['rank_error'] / worst['bound']:
+            worst['rank_error'], worst['bound'] = errors.max(), bounds[np.argmax(errors / bounds)]
+        ok &= bool((errors <= bounds).all())
+    return ok, worst
+
+
+if __name__ == '__main__':
+    warnings.simplefilter('ignore')
+    parser = argparse.ArgumentParser(description='The nrel stage by state against by tile, on synthetic inputs.')
+    parser.add_argument('--scale', choices=sorted(scales), default='medium')
+    parser.add_argument('--tile-size', type=float, default=6.0, metavar='DEG')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--distance', choices=plan.distance_modes, default=plan.default_distance)
+    parser.add_argument('--keep', action='store_true',
+                        help="don't delete the fixtures and outputs afterwards")
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix='bench_tiles_')
+    try:
+        start = time.perf_counter()
+        counts = write_fixtures(data_dir, args.scale)
+        print("{} fixtures: {} ({:.1f} s)".format(
+              args.scale, ', '.join('{} {}'.format(count, name) for name, count in counts.items()),
+              time.perf_counter() - start))
+        config_path = write_config(data_dir)
+        out_dirs = {mode: os.path.join(data_dir, 'out_' + mode) for mode in plan.partition_modes}
+        with open(os.path.join(data_dir, 'pipeline.log'), 'w+') as log:
+            for stage in ['centroid', 'power', 'turbines']:
+                run_script(stage, config_path, data_dir, os.path.join(data_dir, 'instrumentation.jsonl'), log, 1)
+
+            print("{:<10} {:>9} {:>6} {:>14} {:>14}".format('partition', 'wall s', 'jobs', 'longest job s', 'peak job MB'))
+            for mode, out_dir in out_dirs.items():
+                report = os.path.join(data_dir, 'instrumentation_{}.jsonl'.format(mode))
+                extra = ['--distance', args.distance, '--partition', mode, '--tile-size', str(args.tile_size)]
+                wall = run_nrel(config_path, data_dir, out_dir, report, log, args.workers, extra)
+                jobs, longest, peak = job_summary(report)
+                print("{:<10} {:>9.2f} {:>6} {:>14.2f} {:>14.0f}".format(mode, wall, jobs, longest, peak / 2**20))
+
+# {national_df column: its values}, for the exact quantiles.
+        ok = True
+        values = {}
+        print("{:<6} {:>9} {:>12}".format('state', 'cells', 'same bytes'))
+        for name in sorted(os.listdir(os.path.join(out_dirs['states'], 'nrel_augmented_by_state'))):
+            stem, fmt = storage.split_format(name)
+            if fmt != 'geojson':
+                continue
+            us_state = stem.split('_')[2]
+            states_file, tiles_file = [os.path.join(out_dirs[mode], 'nrel_augmented_by_state', name)
+                                       for mode in ['states', 'tiles']]
+            cells = compare_cells(states_file, tiles_file)
+            print("{:<6} {:>9} {:>12}".format(us_state, cells.shape[0], str(filecmp.cmp(states_file, tiles_file, shallow=False))))
+            for column in plan.statistics_columns:
+                values['{}_{}'.format(column, us_state)] = cells[column].to_numpy(dtype=float, na_value=np.nan)
+        for column in plan.statistics_columns:
+            values['{}_national'.format(column)] = np.concatenate([value for label, value in values.items()
+                                                                   if label.rsplit('_', 1)[0] == column])
+
+        stats = [pd.read_csv(os.path.join(out_dirs[mode], 'national_level_statistics.csv'), index_col=0)
+                 for mode in ['states', 'tiles']]
+        stats_ok, worst = compare_stats(stats[0], stats[1], values)
+        ok &= stats_ok
+        print("national stats: moments to {:.1e}, worst quartile rank error {:.2e} (bound {:.2e}){}".format(
+              worst['moments'], worst['rank_error'], worst['bound'], '' if stats_ok else '  OUT OF BOUNDS'))
+        if not ok:
+            sys.exit("Tiling changed the nrel stage's output")
+        print("Tiled output is the same as by state")
+    finally:
+        if args.keep:
+            print("Fixtures and outputs kept in", data_dir)
+        else:
+            shutil.rmtree(data_dir)
@@ -0,0 +1,146 @@
+#!/usr/bin/python3
+
+# Check wind_siting.wind_class.WindClassLookup (built from the exclusion
+# cells, saved and loaded back, as load_wind_class_lookup keeps it) against
+# the joins the capstone scripts used to make:
+#   cells      a unary_union of the exclusion cells per wind_class, an sjoin
+#              of every NREL cell to those, fillna(0), then sort by id and
+#              wind_class_excl and keep each id's first row: the lowest
+#              class the cell touches, or 0
+#   turbines   an sjoin of the turbines to the exclusion cells themselves,
+#              then fillna(2)
+# on two grids that don't line up, as the two NREL datasets don't, with gaps
+# in the exclusion cells and cells past their edge, and on turbines at
+# random, on the exclusion cells' edges and corners, and outside them.
+#
+# The cells have to match exactly. The turbines have to match exactly where
+# the old join gave a turbine one row. A turbine on the edge between two
+# exclusion cells used to get a row for each (with the other features
+# repeated); it now gets one, with the lowest of their classes, and that's
+# what's checked for those.
+# Run from the "Final Capstone" directory:
+#   python3 benchmarks/bench_wind_class.py [--turbines N]
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import warnings
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from wind_siting.wind_class import WindClassLookup
+
+step = 0.1
+extent = (0.0, 0.0, 6.0, 4.0)
+
+
+# Exclusion cells on a step grid over extent, about a third of them
+# excluded, with a random wind_class each.
+def make_exclusions(rng):
+    x, y = np.meshgrid(np.arange(int(extent[2] / step)) * step, np.arange(int(extent[3] / step)) * step)
+    x, y = x.ravel(), y.ravel()
+    keep = rng.random(len(x)) > 0.35
+    return gpd.GeoDataFrame({'wind_class': rng.integers(1, 8, np.count_nonzero(keep))},
+                            geometry=shapely.box(x[keep], y[keep], x[keep] + step, y[keep] + step), crs='epsg:4326')
+
+
+# NREL cells on a coarser, offset grid that reaches past the exclusions.
+def make_cells():
+    cell_step = 0.13
+    x, y = np.meshgrid(np.arange(-0.5, extent[2] + 0.5, cell_step) + 0.037,
+                       np.arange(-0.5, extent[3] + 0.5, cell_step) + 0.037)
+    x, y = x.ravel(), y.ravel()
+    return gpd.GeoDataFrame({'id': np.arange(len(x))},
+                            geometry=shapely.box(x, y, x + cell_step, y + cell_step), crs='epsg:4326')
+
+
+# Turbines anywhere (some outside the exclusions), on the vertical edges of
+# the exclusion grid, and on its corners.
+def make_turbines(n_turbines, rng):
+    columns = np.arange(1, int(extent[2] / step)) * step
+    rows = np.arange(1, int(extent[3] / step)) * step
+    anywhere = rng.uniform((extent[0] - 0.3, extent[1] - 0.3), (extent[2] + 0.3, extent[3] + 0.3), (n_turbines, 2))
+    edges = np.column_stack([rng.choice(columns, n_turbines // 5), rng.uniform(extent[1], extent[3], n_turbines // 5)])
+    corners = np.column_stack([rng.choice(columns, n_turbines // 10), rng.choice(rows, n_turbines // 10)])
+    xy = np.vstack([anywhere, edges, corners])
+    return gpd.GeoDataFrame({'t_index': np.arange(len(xy))}, geometry=shapely.points(xy), crs='epsg:4326')
+
+
+def union_sjoin_dedup(cells, exclusions):
+    classes = gpd.GeoDataFrame({'wind_class': exclusions['wind_class'].unique()},
+                               geometry=[exclusions.loc[exclusions['wind_class'] == wind_class].unary_union
+                                         for wind_class in exclusions['wind_class'].unique()],
+                               crs=exclusions.crs)
+    joined = gpd.sjoin(cells, classes, how='left').drop(columns='index_right')
+    joined = joined.rename(columns={'wind_class': 'wind_class_excl'})
+    joined['wind_class_excl'] = joined['wind_class_excl'].fillna(0)
+    return joined.sort_values(by=['id','wind_class_excl']).drop_duplicates(subset=['id'], keep='first')
+
+
+def turbine_sjoin(turbines, exclusions):
+    joined = gpd.sjoin(turbines, exclusions[['wind_class','geometry']], how='left').drop(columns='index_right')
+    joined['wind_class'] = joined['wind_class'].fillna(2)
+    return joined
+
+
+if __name__ == '__main__':
+    warnings.simplefilter('ignore')
+    parser = argparse.ArgumentParser(description='WindClassLookup against the union, sjoin and dedup it replaced.')
+    parser.add_argument('--turbines', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    exclusions = make_exclusions(rng)
+    cells = make_cells()
+    turbines = make_turbines(args.turbines, rng)
+
+    lookup_dir = tempfile.mkdtemp(prefix='bench_wind_class_')
+    try:
+        start = time.perf_counter()
+        WindClassLookup.from_exclusions(exclusions).save(os.path.join(lookup_dir, 'wind_class_lookup_XX.parquet'))
+        lookup = WindClassLookup.load(os.path.join(lookup_dir, 'wind_class_lookup_XX.parquet'))
+        build_time = time.perf_counter() - start
+    finally:
+        shutil.rmtree(lookup_dir)
+
+    start = time.perf_counter()
+    before = union_sjoin_dedup(cells, exclusions)
+    before_time = time.perf_counter() - start
+    start = time.perf_counter()
+    after = pd.Series(lookup.min_class(cells['geometry']), index=cells['id']).fillna(0)
+    after_time = time.perf_counter() - start
+    assert before.shape[0] == cells.shape[0]
+    mismatched = np.flatnonzero(before.set_index('id')['wind_class_excl'].reindex(cells['id']).values != after.values)
+    assert len(mismatched) == 0, "{} of {} cells have a different wind_class_excl, e.g. id {}".format(
+           len(mismatched), cells.shape[0], cells['id'].iloc[mismatched[0]])
+    touching = np.bincount(lookup.tree.query(np.asarray(cells.geometry.values), predicate='intersects')[0],
+                           minlength=cells.shape[0])
+    print("{} cells ({} touching no exclusion polygon, {} touching several), {} exclusion cells in {} polygons: "
+          "same wind_class_excl for every cell".format(cells.shape[0], np.count_nonzero(touching == 0),
+                                                       np.count_nonzero(touching > 1), exclusions.shape[0],
+                                                       len(lookup.wind_classes)))
+    print("union + sjoin + dedup {:.2f} s, lookup {:.3f} s (built, saved and loaded in {:.2f} s)".format(
+          before_time, after_time, build_time))
+
+    rows = turbine_sjoin(turbines, exclusions)
+    found = lookup.min_class(turbines['geometry'])
+    after = pd.Series(found, index=turbines['t_index']).fillna(2)
+    per_turbine = rows.groupby('t_index')['wind_class']
+    single = (per_turbine.size() == 1).reindex(turbines['t_index']).values
+    assert np.array_equal(rows.loc[rows['t_index'].isin(turbines['t_index'][single]), 'wind_class'].values,
+                          after.values[single])
+# The documented change: one row per turbine, at the lowest class it touches.
+    assert np.array_equal(per_turbine.min().reindex(turbines['t_index']).values, after.values)
+    classes_differ = (per_turbine.nunique() > 1).reindex(turbines['t_index']).values
+    assert np.count_nonzero(~single) > 0 and np.count_nonzero(classes_differ) > 0
+    print("{} turbines, {} of them outside every exclusion cell: the old join's one row for each of {}; "
+          "for the {} on an edge ({} rows, {} with different classes either side), their lowest class".format(
+          turbines.shape[0], np.count_nonzero(np.isnan(found)), np.count_nonzero(single),
+          np.count_nonzero(~single), rows.shape[0] - np.count_nonzero(single), np.count_nonzero(classes_differ)))
@@ -0,0 +1,5 @@
+# The wind-siting capstone pipeline and its helpers. Run it from
+# "Final Capstone" with
+#   python3 -m wind_siting run centroid power turbines nrel
+# (see wind_siting/cli.py), or import the pieces, e.g.
+#   from wind_siting.nearest import nearest_lines
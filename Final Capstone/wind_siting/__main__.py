@@ -0,0 +1,3 @@
+from wind_siting.cli import main
+
+main()
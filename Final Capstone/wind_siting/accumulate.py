@@ -0,0 +1,34 @@
+import pandas as pd
+import geopandas as gpd
+
+
+# Collects the chunks produced inside a processing loop and concatenates them
+# once at the end. Growing a dataframe with pd.concat([acc, chunk]) on every
+# pass copies everything collected so far, which is quadratic in the number
+# of rows; appending to a list and concatenating once is linear.
+class FrameAccumulator:
+
+    def __init__(self, crs=None):
+        self.chunks = []
+        self.crs = crs
+        self.rows = 0
+
+    def __len__(self):
+        return self.rows
+
+    def append(self, chunk):
+        if self.crs is None:
+            self.crs = getattr(chunk, 'crs', None)
+        self.chunks.append(chunk)
+        self.rows += chunk.shape[0]
+
+# Materialize everything collected so far. Keyword arguments go to pd.concat,
+# e.g. sort=True to line up chunks whose columns come back in different orders.
+    def to_frame(self, ignore_index=True, **concat_kwargs):
+        if len(self.chunks) == 0:
+            return gpd.GeoDataFrame(crs=self.crs)
+        out = pd.concat(self.chunks, ignore_index=ignore_index, **concat_kwargs)
+        self.chunks = [out]
+        if 'geometry' in out.columns:
+            return gpd.GeoDataFrame(out, crs=self.crs)
+        return out
@@ -0,0 +1,162 @@
+import os
+import sys
+import time
+import argparse
+
+from wind_siting import config, instrument, plan, storage
+from wind_siting.manifest import add_manifest_arguments
+from wind_siting.parallel import StateFailures, add_worker_arguments
+
+# One command line for the whole pipeline:
+#
+#   python3 -m wind_siting run centroid power turbines nrel [--state TX --state OK]
+#                              [--in DIR] [--out DIR] [--config FILE] [--dry-run]
+#                              [--distance degrees|metres] [--partition states|tiles [--tile-size DEG]]
+#   python3 -m wind_siting fit MODEL_FILE [--estimator rfc|svc|sgdc] [--state KS] [--sample N]
+#   python3 -m wind_siting run score --model MODEL_FILE [--batch-size N]
+#
+# Stages run in the order given. Where each one reads and writes comes from
+# wind_siting.config; --in and --out override it for every stage named.
+# Only the stages that actually run import geopandas (wind_siting.pipeline),
+# so --help and --dry-run come back straight away.
+
+
+def add_run_arguments(parser):
+    parser.add_argument('stages', nargs='+', choices=config.stages, metavar='STAGE',
+                        help='one or more of: {}'.format(', '.join(config.stages)))
+    parser.add_argument('--state', action='append', default=None, metavar='STATE',
+                        help='only build STATE; can be given more than once (default: every state)')
+    parser.add_argument('--in', dest='in_dir', default=None, metavar='DIR',
+                        help='read every input from DIR instead of the configured directories')
+    parser.add_argument('--out', dest='out_dir', default=None, metavar='DIR',
+                        help='write every output to DIR instead of the configured directory')
+    parser.add_argument('--distance', choices=plan.distance_modes, default=plan.default_distance,
+                        help='what the distance features are measured in (default: %(default)s)')
+    parser.add_argument('--partition', choices=plan.partition_modes, default=plan.default_partition,
+                        help='nrel: a job per state, or per square tile of cells (default: %(default)s)')
+    parser.add_argument('--tile-size', type=float, default=plan.tile_size, metavar='DEG',
+                        help='nrel: the width of a tile in degrees, with --partition tiles (default: %(default)s)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='print what each stage would read, write and rebuild, and stop')
+    parser.add_argument('--model', default=None, metavar='FILE',
+                        help='score: the fitted model to score the cells with (from the fit command)')
+    parser.add_argument('--batch-size', type=int, default=plan.score_batch_size, metavar='N',
+                        help='score: cells read and scored at a time (default: %(default)s)')
+    config.add_config_arguments(parser)
+    add_worker_arguments(parser)
+    add_manifest_arguments(parser)
+    storage.add_storage_arguments(parser)
+    instrument.add_instrument_arguments(parser)
+
+
+# The model is fitted to the augmented cells the score stage reads.
+def add_fit_arguments(parser):
+    parser.add_argument('model_file', metavar='MODEL_FILE', help='where to save the fitted model')
+    parser.add_argument('--estimator', choices=plan.estimators, default='rfc',
+                        help="the notebook's RandomForestClassifier, SVC or SGDClassifier (default: %(default)s)")
+    parser.add_argument('--state', action='append', default=None, metavar='STATE',
+                        help='fit to STATE; can be given more than once (default: every state)')
+    parser.add_argument('--sample', type=int, default=None, metavar='N',
+                        help='fit to at most N cells of each state (default: all of them)')
+    parser.add_argument('--random-state', type=int, default=42)
+    parser.add_argument('--in', dest='in_dir', default=None, metavar='DIR',
+                        help='read the augmented cells from DIR instead of the configured directory')
+    config.add_config_arguments(parser)
+    instrument.add_instrument_arguments(parser)
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(prog='python3 -m wind_siting',
+                                     description='Build the wind-siting datasets.')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    add_run_arguments(commands.add_parser('run', help='run one or more stages of the pipeline'))
+    add_fit_arguments(commands.add_parser('fit', help='fit a model for the score stage'))
+    return parser
+
+
+def print_states(label, states):
+    print("  {:<12} {}".format(label + ':', ' '.join(states) if states else '-'))
+
+
+# What a stage would do, from the manifests alone. A stage whose inputs
+# don't exist yet (because an earlier stage in the same command hasn't run)
+# says so instead.
+def dry_run(stage, dirs, args):
+    print("{}:".format(stage))
+    for key, directory in sorted(dirs.items()):
+        print("  {:<12} {}".format(key + ':', directory))
+    try:
+        if stage == 'centroid':
+            for qualifier in ['w','no']:
+                manifest = plan.centroid_manifest(dirs, qualifier, args.force)
+                current = plan.all_current(manifest, plan.centroid_input_files(dirs, qualifier))
+                print("  {:<12} {}".format(qualifier + ':', 'up to date' if current else 'stream the national file'))
+        elif stage == 'power':
+            current = plan.all_current(plan.power_manifest(dirs, args.force, args.format), plan.power_input_files(dirs))
+            print("  {:<12} {}".format('lines:', 'up to date' if current else 'join to state'))
+        elif stage == 'turbines':
+            jobs = plan.turbine_jobs(dirs, plan.turbines_manifest(dirs, args.force, args.distance), args.format, args.state)
+            print_states('up to date', [job[0] for job in jobs if job[5]])
+            print_states('rebuild', [job[0] for job in jobs if not job[5]])
+        elif stage == 'nrel':
+            jobs = plan.nrel_jobs(dirs, plan.nrel_manifest(dirs, args.force, args.distance), args.state)
+            print_states('up to date', [job[0] for job in jobs if job[4]])
+            print_states('rebuild', [job[0] for job in jobs if not job[4]])
+        elif stage == 'score':
+            if args.model is None:
+                print("  {:<12} {}".format('model:', 'none given (--model)'))
+                return
+            jobs = plan.score_jobs(dirs, plan.score_manifest(dirs, args.force), os.path.abspath(args.model), args.state)
+            print_states('up to date', [job[0] for job in jobs if job[4]])
+            print_states('rescore', [job[0] for job in jobs if not job[4]])
+    except FileNotFoundError as e:
+        print("  {:<12} inputs not there yet ({})".format('waiting:', e.filename or e))
+
+
+def run(args):
+    stage_config = config.load_config(args.config)
+    if args.state:
+        args.state = [state.upper() for state in args.state]
+    for stage in args.stages:
+        dirs = config.stage_dirs(stage_config, stage, args.in_dir, args.out_dir)
+        if args.dry_run:
+            dry_run(stage, dirs, args)
+            continue
+# Only now do we need geopandas.
+        from wind_siting import pipeline
+        run_id = instrument.configure(args.report, stage, args.profile)
+        print("Starting {} at ".format(stage),time.strftime('%X %x %Z'))
+# A state that failed has been printed already; the rest are finished and
+# recorded, so stop here rather than start the next stage without it.
+        try:
+            pipeline.runners[stage](dirs, args)
+        except StateFailures as e:
+            instrument.summarize(args.report, run_id, script=stage)
+            raise SystemExit("{} stopped at {}: {}".format(stage, time.strftime('%X %x %Z'), e))
+        instrument.summarize(args.report, run_id, script=stage)
+        print("Completed {} at ".format(stage),time.strftime('%X %x %Z'))
+
+
+def fit(args):
+    if args.state:
+        args.state = [state.upper() for state in args.state]
+    dirs = config.stage_dirs(config.load_config(args.config), 'score', args.in_dir)
+    from wind_siting import pipeline
+    run_id = instrument.configure(args.report, 'fit', args.profile)
+    print("Starting fit at ",time.strftime('%X %x %Z'))
+    pipeline.run_fit(dirs, args)
+    instrument.summarize(args.report, run_id, script='fit')
+    print("Completed fit at ",time.strftime('%X %x %Z'))
+
+
+def main(argv=None):
+    args = make_parser().parse_args(sys.argv[1:] if argv is None else argv)
+    if args.command == 'run':
+        run(args)
+    elif args.command == 'fit':
+        fit(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+import os
+import configparser
+
+# Where each stage of the pipeline reads its inputs and writes its outputs.
+# The defaults are where the scripts have always looked; to run somewhere
+# else, write an INI file with a section per stage, e.g.
+#
+#   [DEFAULT]
+#   data = /data/wind_capstone
+#
+#   [centroid]
+#   in = /data/nrel_raw
+#   out = %(data)s
+#
+#   [power]
+#   in = %(data)s
+#   out = %(data)s
+#
+# and pass it as --config, point WIND_SITING_CONFIG at it, or leave it in
+# the working directory as wind_siting.ini. Anything not in the file keeps
+# its default.
+#
+#   centroid  in: ref-wind-*/ and tl_2017_us_state/ (the raw NREL and Census files)
+#             out: nrel_{w,no}_exclusions_by_state/
+#   power     in: Electric_Power_Transmission_Lines/, lower48_borders.geojson
+#             out: power_out_df, power_by_state/
+#   turbines  in: existing_turbines.geojson, lower48_borders.geojson, power_out_df,
+#                 power_by_state/, nrel_w_exclusions_by_state/
+#             out: turbines_by_state/, wind_class_lookup/
+#   nrel      in: nrel_{no,w}_exclusions_by_state/
+#             features_in: power_by_state/, turbines_by_state/
+#             out: nrel_augmented_by_state/, national_level_statistics.csv, wind_class_lookup/
+#   score     in: nrel_augmented_by_state/ (and the model, given with --model)
+#             out: cell_scores_by_state/
+config_env = 'WIND_SITING_CONFIG'
+default_config_file = 'wind_siting.ini'
+
+capstone_path = '/home/jeremy/Documents/Jupyter/Final Capstone'
+disk_dir = '/home/jeremy/Google_Drive/wind_capstone'
+local_dir = '/media/jeremy/Seagate Backup Plus Drive/wind_capstone'
+
+stages = ['centroid', 'power', 'turbines', 'nrel', 'score']
+default_dirs = {'centroid': {'in': '.', 'out': local_dir},
+                'power': {'in': capstone_path, 'out': capstone_path},
+                'turbines': {'in': capstone_path, 'out': capstone_path},
+                'nrel': {'in': local_dir, 'features_in': disk_dir, 'out': local_dir},
+                'score': {'in': local_dir, 'out': local_dir}}
+
+
+# --config, shared by everything that runs a stage.
+def add_config_arguments(parser):
+    parser.add_argument('--config', default=None,
+                        help='INI file of where each stage reads and writes '
+                             '(default: ${}, else ./{} if there is one)'.format(config_env, default_config_file))
+
+
+def config_path(path=None):
+    if path:
+        return path
+    if os.environ.get(config_env):
+        return os.environ[config_env]
+    if os.path.exists(default_config_file):
+        return default_config_file
+    return None
+
+
+# {stage: {'in': dir, 'out': dir, ...}} from the defaults and the config file.
+def load_config(path=None):
+    path = config_path(path)
+    parser = configparser.ConfigParser()
+    if path is not None:
+        if not parser.read(path):
+            raise FileNotFoundError(path)
+        unknown = set(parser.sections()) - set(stages)
+        if unknown:
+            raise ValueError("{}: unknown stage(s) {}; expected {}".format(path, ', '.join(sorted(unknown)), ', '.join(stages)))
+    config = {}
+    for stage in stages:
+# An empty section still picks up [DEFAULT].
+        if not parser.has_section(stage):
+            parser.add_section(stage)
+        dirs = dict(default_dirs[stage])
+        dirs.update((key, parser.get(stage, key)) for key in default_dirs[stage] if parser.has_option(stage, key))
+        config[stage] = dirs
+    return config
+
+
+# One stage's directories with --in / --out applied. --in stands for every
+# directory the stage reads from.
+def stage_dirs(config, stage, in_dir=None, out_dir=None):
+    dirs = dict(config[stage])
+    if in_dir is not None:
+        for key in dirs:
+            if key != 'out':
+                dirs[key] = in_dir
+    if out_dir is not None:
+        dirs['out'] = out_dir
+    return dirs
@@ -0,0 +1,189 @@
+#!/usr/bin/python3
+
+# Synthetic stand-ins for the capstone's inputs, so the whole pipeline can be
+# run (and timed) on any machine, without the multi-GB NREL shapefiles or the
+# drives the real ones live on.
+#
+# write_fixtures(directory, scale) lays everything out the way the pipeline
+# expects to find it, with directory standing in for every stage's input and
+# output directory alike (--in directory --out directory):
+#   tl_2017_us_state/tl_2017_us_state.shp       state borders
+#   ref-wind-with-exclusions/ref_wind.shp        NREL cells, with exclusions
+#   ref-wind-no-excl/ref_wind_no_excl.shp        NREL cells, without
+#   lower48_borders.geojson                      borders plus their neighbors
+#   existing_turbines.geojson                    turbines, clustered in farms
+#   Electric_Power_Transmission_Lines/Electric_Power_Transmission_Lines.shp
+# plus the empty per-state output directories the stages write into.
+#
+# The states are a ragged grid of rectangles of very different sizes (so
+# there's a TX and an RI), the NREL cells a regular grid over all of them
+# with a strip of "offshore" cells past the edge, and the transmission lines
+# meandering polylines with the HIFLD attributes the scripts filter on.
+#
+# To write a set of fixtures:
+#   python3 -m wind_siting.fixtures fixtures --scale small
+
+import os
+import argparse
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+# Rough sizes of each input. 'large' is about a tenth of the country.
+scales = {'small': {'states': 4, 'cells': 20000, 'turbines': 2000, 'lines': 400},
+          'medium': {'states': 9, 'cells': 200000, 'turbines': 10000, 'lines': 2000},
+          'large': {'states': 16, 'cells': 1000000, 'turbines': 60000, 'lines': 8000}}
+
+# The lower 48, more or less.
+extent = (-125.0, 25.0, -67.0, 49.0)
+offshore = 1.0
+
+state_codes = ['AL', 'AR', 'AZ', 'CA', 'CO', 'CT', 'DE', 'FL', 'GA', 'IA', 'ID', 'IL',
+               'IN', 'KS', 'KY', 'LA', 'MA', 'MD', 'ME', 'MI', 'MN', 'MO', 'MS', 'MT',
+               'NC', 'ND', 'NE', 'NH', 'NJ', 'NM', 'NV', 'NY', 'OH', 'OK', 'OR', 'PA',
+               'RI', 'SC', 'SD', 'TN', 'TX', 'UT', 'VA', 'VT', 'WA', 'WI', 'WV', 'WY']
+
+# HIFLD voltage, and the VOLT_CLASS that goes with it.
+voltages = [(-999999.0, 'NOT AVAILABLE'), (69.0, 'UNDER 100'), (115.0, '100-161'), (138.0, '100-161'),
+            (230.0, '220-287'), (345.0, '345'), (500.0, '500'), (765.0, '735 AND ABOVE')]
+statuses = ['IN SERVICE', 'IN SERVICE', 'IN SERVICE', 'UNDER CONST', 'NOT AVAILABLE']
+
+output_dirs = ['power_by_state', 'turbines_by_state', 'nrel_w_exclusions_by_state',
+               'nrel_no_exclusions_by_state', 'nrel_augmented_by_state']
+
+
+# Split [low, high] into n pieces of random (and very uneven) widths.
+def uneven_splits(low, high, n, rng):
+    widths = rng.dirichlet(np.full(n, 1.5))
+    return low + (high - low) * np.concatenate([[0], np.cumsum(widths)])
+
+
+def make_states(n_states, rng):
+    n_cols = int(np.ceil(np.sqrt(n_states)))
+    col_edges = uneven_splits(extent[0], extent[2], n_cols, rng)
+    per_col = np.full(n_cols, n_states // n_cols)
+    per_col[:n_states % n_cols] += 1
+    boxes = []
+    for col in range(n_cols):
+        row_edges = uneven_splits(extent[1], extent[3], per_col[col], rng)
+        for row in range(per_col[col]):
+            boxes.append(shapely.box(col_edges[col], row_edges[row], col_edges[col + 1], row_edges[row + 1]))
+    codes = sorted(rng.choice(state_codes, n_states, replace=False))
+    states = gpd.GeoDataFrame({'STUSPS': codes,
+                               'REGION': rng.choice(['1', '2', '3', '4'], n_states),
+                               'NAME': ['State of {}'.format(code) for code in codes]},
+                              geometry=boxes, crs='epsg:4326')
+    tree = shapely.STRtree(states.geometry.values)
+    neighbors = []
+    for idx, geom in enumerate(states.geometry.values):
+        touching = [other for other in tree.query(geom, predicate='intersects') if other != idx]
+        neighbors.append(','.join(sorted(states['STUSPS'].iloc[touching])))
+    states['neighbors'] = neighbors
+    return states
+
+
+def make_cells(n_cells, rng):
+    width = extent[2] - extent[0] + offshore
+    height = extent[3] - extent[1]
+    cell = np.sqrt(width * height / n_cells)
+    x, y = np.meshgrid(np.arange(extent[0], extent[0] + width, cell),
+                       np.arange(extent[1], extent[3], cell))
+    x = x.ravel()
+    y = y.ravel()
+    n = x.shape[0]
+# Wind class varies smoothly across the country (windier in the middle), plus noise.
+    middle = 1 - np.abs((x - extent[0]) / width - 0.5) * 2
+    wind_class = np.clip(np.round(1 + 5 * middle + rng.normal(0, 1, n)), 1, 7)
+    return gpd.GeoDataFrame({'gid': np.arange(n),
+                             'id': np.arange(n),
+                             'wind_class': wind_class,
+                             'cap_factor': np.round(0.1 + 0.05 * wind_class + rng.normal(0, 0.02, n), 4)},
+                            geometry=shapely.box(x, y, x + cell, y + cell),
+                            crs='epsg:4326')
+
+
+def make_turbines(n_turbines, states, rng):
+    n_farms = max(n_turbines // 50, 1)
+    farm_x = rng.uniform(extent[0], extent[2], n_farms)
+    farm_y = rng.uniform(extent[1], extent[3], n_farms)
+    farm = rng.integers(0, n_farms, n_turbines)
+    x = np.clip(farm_x[farm] + rng.normal(0, 0.05, n_turbines), extent[0], extent[2] - 1e-6)
+    y = np.clip(farm_y[farm] + rng.normal(0, 0.05, n_turbines), extent[1], extent[3] - 1e-6)
+    turbines = gpd.GeoDataFrame({'index': np.arange(n_turbines),
+                                 'case_id': 3000001 + np.arange(n_turbines),
+                                 'p_name': ['Farm {}'.format(f) for f in farm],
+                                 'p_year': rng.integers(1985, 2020, n_farms)[farm].astype(float),
+                                 'p_tnum': np.bincount(farm, minlength=n_farms)[farm].astype(float),
+                                 'p_cap': rng.uniform(5, 300, n_farms)[farm].round(2),
+                                 't_cap': rng.choice([1500.0, 2000.0, 2300.0, 3000.0], n_turbines),
+                                 't_hh': rng.choice([80.0, 90.0, -9999.0], n_turbines),
+                                 't_rd': rng.choice([77.0, 100.0, 116.0, -9999.0], n_turbines)},
+                                geometry=gpd.points_from_xy(x, y), crs='epsg:4326')
+    in_state = gpd.sjoin(turbines, states[['STUSPS', 'geometry']], how='left', predicate='intersects')
+    turbines['t_state'] = in_state.loc[~in_state.index.duplicated(), 'STUSPS'].values
+    return turbines.to_crs('epsg:4269')
+
+
+# Transmission lines: random walks with a heading that drifts a little each step.
+def make_power_lines(n_lines, rng):
+    lines = []
+    for _ in range(n_lines):
+        n_steps = rng.integers(2, 12)
+        heading = rng.uniform(0, 2 * np.pi) + np.cumsum(rng.normal(0, 0.3, n_steps))
+        steps = rng.uniform(0.05, 0.6, n_steps)
+        start = rng.uniform(extent[:2], extent[2:])
+        coords = start + np.vstack([[0, 0], np.cumsum(np.column_stack([np.cos(heading), np.sin(heading)]) * steps[:, None], axis=0)])
+        lines.append(shapely.LineString(coords))
+    voltage = rng.integers(0, len(voltages), n_lines)
+    power_lines = gpd.GeoDataFrame({'OBJECTID': np.arange(1, n_lines + 1),
+                                    'ID': ['{:06d}'.format(100000 + i) for i in range(n_lines)],
+                                    'TYPE': rng.choice(['AC; OVERHEAD', 'AC; UNDERGROUND', 'DC; OVERHEAD'], n_lines, p=[0.9, 0.07, 0.03]),
+                                    'STATUS': rng.choice(statuses, n_lines),
+                                    'VOLTAGE': [voltages[v][0] for v in voltage],
+                                    'VOLT_CLASS': [voltages[v][1] for v in voltage]},
+                                   geometry=lines, crs='epsg:4326')
+# HIFLD lengths are in metres; a degree is near enough 111 km.
+    power_lines['SHAPE__Len'] = (shapely.length(power_lines.geometry.values) * 111000).round(3)
+    return power_lines
+
+
+def make_fixtures(scale, seed=0):
+    sizes = scales[scale] if isinstance(scale, str) else scale
+    rng = np.random.default_rng(seed)
+    states = make_states(sizes['states'], rng)
+    cells = make_cells(sizes['cells'], rng)
+# Exclusions (protected land, urban areas, ...) knock out about a third of the cells.
+    cells_excl = cells.loc[rng.random(cells.shape[0]) > 0.35].reset_index(drop=True)
+    return {'states': states,
+            'cells': cells,
+            'cells_excl': cells_excl,
+            'turbines': make_turbines(sizes['turbines'], states, rng),
+            'power_lines': make_power_lines(sizes['lines'], rng)}
+
+
+# Write a full set of inputs for the scripts into directory. Returns the
+# number of rows of each.
+def write_fixtures(directory, scale='small', seed=0):
+    fixtures = make_fixtures(scale, seed)
+    for subdir in ['tl_2017_us_state', 'ref-wind-with-exclusions', 'ref-wind-no-excl',
+                   'Electric_Power_Transmission_Lines'] + output_dirs:
+        os.makedirs(os.path.join(directory, subdir), exist_ok=True)
+    fixtures['states'].drop('neighbors', axis='columns')\
+                      .to_file(os.path.join(directory, 'tl_2017_us_state', 'tl_2017_us_state.shp'))
+    fixtures['states'].to_file(os.path.join(directory, 'lower48_borders.geojson'), driver='GeoJSON')
+    fixtures['cells_excl'].to_file(os.path.join(directory, 'ref-wind-with-exclusions', 'ref_wind.shp'))
+    fixtures['cells'].to_file(os.path.join(directory, 'ref-wind-no-excl', 'ref_wind_no_excl.shp'))
+    fixtures['turbines'].to_file(os.path.join(directory, 'existing_turbines.geojson'), driver='GeoJSON')
+    fixtures['power_lines'].to_file(os.path.join(directory, 'Electric_Power_Transmission_Lines',
+                                                 'Electric_Power_Transmission_Lines.shp'))
+    return {name: frame.shape[0] for name, frame in fixtures.items()}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write synthetic inputs for the wind-siting scripts.')
+    parser.add_argument('directory')
+    parser.add_argument('--scale', choices=sorted(scales), default='small')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    print(pd.Series(write_fixtures(args.directory, args.scale, args.seed)).to_string())
@@ -0,0 +1,241 @@
+import os
+import sys
+import json
+import time
+import pstats
+import cProfile
+import functools
+import contextlib
+
+from wind_siting.parallel import hwm_rss, reset_peak_rss
+
+# Per-stage timings for the pipeline scripts: how long each stage took for
+# each state (wall clock and CPU), how much memory it peaked at and how many
+# rows it handled, so we can tell where a run's time and RAM actually go.
+#
+#   with span('nearest_line', us_state) as stage:
+#       ...
+#       stage.rows = nearest_df.shape[0]
+#
+# Spans with the same (stage, state) are added up in memory, so a stage that
+# runs once per chunk comes out as one record, and flush() appends one JSON
+# line per (stage, state) to the report. Worker processes append to the same
+# report; configure() passes its settings to them through the environment,
+# which a process pool inherits whether it forks or spawns. summarize()
+# prints the table for one run from the report afterwards.
+report_env = 'WIND_SITING_REPORT'
+run_env = 'WIND_SITING_RUN'
+script_env = 'WIND_SITING_SCRIPT'
+profile_env = 'WIND_SITING_PROFILE'
+
+default_report = 'instrumentation.jsonl'
+
+totals = {}
+open_spans = []
+
+
+# --report / --profile, shared by the pipeline scripts. Only scripts that
+# work a state at a time have a state to profile.
+def add_instrument_arguments(parser, profile=True):
+    parser.add_argument('--report', default=default_report,
+                        help='JSON-lines file the per-stage timings are appended to (default: %(default)s)')
+    if profile:
+        parser.add_argument('--profile', metavar='STATE', default=None,
+                            help='run cProfile over STATE (each of its tiles, if it is tiled) and save the '
+                                 'stats next to the report')
+
+
+# Call once, before the first span. Returns the run id the records are tagged with.
+def configure(report_path, script_path, profile_state=None):
+    run_id = '{}-{}'.format(time.strftime('%Y%m%dT%H%M%S'), os.getpid())
+    os.environ[report_env] = os.path.abspath(report_path)
+    os.environ[run_env] = run_id
+    os.environ[script_env] = os.path.splitext(os.path.basename(script_path))[0]
+    if profile_state:
+        os.environ[profile_env] = profile_state.upper()
+    else:
+        os.environ.pop(profile_env, None)
+    return run_id
+
+
+# A stage's peak is its own (the kernel's high-water mark is reset when it
+# starts) rather than the biggest stage before it, unless the kernel won't
+# reset it: then peak_scope is 'process' instead of 'stage'.
+class Span:
+
+    def __init__(self, stage, state=None, rows=None):
+        self.stage = stage
+        self.state = state
+        self.rows = rows
+        self.peak = 0
+
+    def __enter__(self):
+        if open_spans:
+# The enclosing span's peak so far is about to be reset; keep it.
+            open_spans[-1].peak = max(open_spans[-1].peak, hwm_rss())
+        self.peak_scope = 'stage' if reset_peak_rss() else 'process'
+        open_spans.append(self)
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self.wall_start
+        cpu = time.process_time() - self.cpu_start
+        self.peak = max(self.peak, hwm_rss())
+        open_spans.pop()
+        if open_spans:
+            open_spans[-1].peak = max(open_spans[-1].peak, self.peak)
+        total = totals.setdefault((self.stage, self.state),
+                                  {'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0, 'peak_rss': 0, 'rows': None})
+        total['calls'] += 1
+        total['wall_s'] += wall
+        total['cpu_s'] += cpu
+        total['peak_rss'] = max(total['peak_rss'], self.peak)
+        total['peak_scope'] = self.peak_scope
+        if self.rows is not None:
+            total['rows'] = (total['rows'] or 0) + int(self.rows)
+        return False
+
+
+def span(stage, state=None, rows=None):
+    return Span(stage, state, rows)
+
+
+# Time every item an iterator hands out (e.g. the batches read off disk) as
+# one stage, counting the rows of each.
+def timed_iter(iterable, stage, state=None):
+    iterator = iter(iterable)
+    while True:
+        with span(stage, state) as stage_span:
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            stage_span.rows = len(item)
+        yield item
+
+
+# Append what's been recorded in this process to the report and start over.
+# Without configure() (e.g. a function imported into a notebook), the
+# records are just dropped.
+def flush():
+    report_path = os.environ.get(report_env)
+    if report_path and totals:
+        lines = []
+        for (stage, state), total in totals.items():
+            record = {'run': os.environ.get(run_env), 'script': os.environ.get(script_env),
+                      'pid': os.getpid(), 'stage': stage, 'state': state}
+            record.update(total)
+            record['rows_per_s'] = total['rows'] / total['wall_s'] if total['rows'] and total['wall_s'] else None
+            lines.append(json.dumps(record) + '\n')
+# One write per flush, to a file opened for appending, so lines from
+# different workers don't interleave.
+        directory = os.path.dirname(report_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(report_path, 'a') as f:
+            f.write(''.join(lines))
+    totals.clear()
+
+
+def profile_path(report_path, script, state, label=None):
+    name = '_'.join(part for part in ['profile', script, state, label] if part)
+    return os.path.join(os.path.dirname(report_path), name + '.prof')
+
+
+# cProfile whatever runs inside, if state is the --profile state, or one of
+# its tiles (<state>_<tile>, with --partition tiles; each gets a profile of
+# its own). label tells apart the profiles of a state that's profiled more
+# than once a run.
+def profile_wanted(state):
+    profile_state = os.environ.get(profile_env)
+    if not state or not profile_state:
+        return False
+    return state.upper() == profile_state or state.upper().startswith(profile_state + '_')
+
+
+@contextlib.contextmanager
+def profiled(state, label=None):
+    if not profile_wanted(state):
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        path = profile_path(os.environ.get(report_env, os.path.abspath(default_report)),
+                            os.environ.get(script_env), state, label)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        profiler.dump_stats(path)
+        print("cProfile stats for {} saved to {}; the top 25 by cumulative time:".format(state, path))
+        pstats.Stats(profiler, stream=sys.stdout).sort_stats('cumulative').print_stats(25)
+
+
+# Decorator for a script's process_state(us_state, ...): the whole state is
+# one 'state' span (profiled if it's the --profile state), and its records
+# are flushed before the result goes back to run_states.
+def traced_state(func):
+    @functools.wraps(func)
+    def wrapper(us_state, *args, **kwargs):
+        try:
+            with profiled(us_state), span('state', us_state):
+                return func(us_state, *args, **kwargs)
+        finally:
+            flush()
+    return wrapper
+
+
+def read_report(report_path, run_id=None):
+    records = []
+    if not os.path.exists(report_path):
+        return records
+    with open(report_path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if run_id is None or record.get('run') == run_id:
+                records.append(record)
+    return records
+
+
+# Print a run's timings: one line per stage (summed over states), then the
+# slowest states. Peak memory is the largest of any single stage. script
+# limits it to one of the stages run in the same process.
+def summarize(report_path, run_id, top_states=10, script=None):
+    flush()
+    records = [record for record in read_report(report_path, run_id)
+               if script is None or record.get('script') == script]
+    if not records:
+        return
+    stages = {}
+    for record in records:
+        stage = stages.setdefault(record['stage'], {'states': set(), 'calls': 0, 'wall_s': 0.0,
+                                                    'cpu_s': 0.0, 'peak_rss': 0, 'rows': 0})
+        stage['states'].add(record['state'])
+        stage['calls'] += record['calls']
+        stage['wall_s'] += record['wall_s']
+        stage['cpu_s'] += record['cpu_s']
+        stage['peak_rss'] = max(stage['peak_rss'], record['peak_rss'])
+        stage['rows'] += record['rows'] or 0
+
+    print("Stage timings for run {} ({}):".format(' '.join(part for part in [run_id, script] if part), report_path))
+    print("{:<20} {:>6} {:>8} {:>10} {:>10} {:>10} {:>12} {:>12}".format(
+          'stage', 'states', 'calls', 'wall s', 'cpu s', 'peak MB', 'rows', 'rows/s'))
+    for name, stage in sorted(stages.items(), key=lambda item: item[1]['wall_s'], reverse=True):
+        print("{:<20} {:>6} {:>8} {:>10.2f} {:>10.2f} {:>10.0f} {:>12} {:>12}".format(
+              name, len(stage['states'] - {None}), stage['calls'], stage['wall_s'], stage['cpu_s'],
+              stage['peak_rss'] / 2**20, stage['rows'] or '',
+              '{:.0f}'.format(stage['rows'] / stage['wall_s']) if stage['rows'] and stage['wall_s'] else ''))
+
+    state_records = sorted([record for record in records if record['stage'] == 'state'],
+                           key=lambda record: record['wall_s'], reverse=True)
+    if state_records:
+        print("Slowest states:")
+        for record in state_records[:top_states]:
+            print("{:<6} {:>10.2f} s wall {:>10.2f} s cpu {:>10.0f} MB peak".format(
+                  record['state'], record['wall_s'], record['cpu_s'], record['peak_rss'] / 2**20))
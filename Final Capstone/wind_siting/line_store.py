@@ -0,0 +1,231 @@
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+from geopandas.array import GeometryArray
+from wind_siting import projection
+
+# The national transmission network, written once by the power stage as flat
+# arrays (.npy) that any stage or worker process memory-maps read-only:
+#
+#   coords.npy, offsets_<n>.npy   every line's coordinates, as shapely's
+#                                 ragged arrays (to_ragged_array)
+#   bounds.npy                    each line's bounding box
+#   column_<n>.npy                the attribute columns; strings as codes
+#                                 into categories_<n>.npy
+#   row_line.npy, row_state.npy   power_out_df's rows: which line and which
+#                                 state each one is, in power_out_df's order
+#
+# A line that crosses a border is stored once, however many states it's in.
+# Looking up a state (or its neighbors) or a bounding box only compares a
+# few small arrays; only the lines that are asked for are ever turned into
+# geometries. The pages stay in the page cache, shared between every worker
+# that has the store open, instead of each one parsing its own copy.
+store_dirname = 'power_line_store'
+meta_file = 'meta.json'
+store_version = 2
+
+
+def store_path(root):
+    return os.path.join(root, store_dirname)
+
+
+def exists(root):
+    return os.path.exists(os.path.join(store_path(root), meta_file))
+
+
+# power_out_df is indexed by the line each row came from (see
+# stages.power_lines_by_state), with one row per (line, state). Written to a
+# temporary directory and swapped in, so a reader never sees half a store.
+# Returns the path of meta.json, which changes whenever the store does.
+def write_store(root, power_out_df):
+    directory = store_path(root)
+    tmp_dir = directory + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    row_line, _ = pd.factorize(power_out_df.index)
+    first_row = np.unique(row_line, return_index=True)[1]
+    lines = power_out_df.iloc[first_row]
+    geoms = np.asarray(lines.geometry.values).copy()
+    geoms[shapely.is_missing(geoms)] = shapely.LineString()
+    geom_type, coords, offsets = shapely.to_ragged_array(geoms)
+    np.save(os.path.join(tmp_dir, 'coords.npy'), coords)
+    for level, level_offsets in enumerate(offsets):
+        np.save(os.path.join(tmp_dir, 'offsets_{}.npy'.format(level)), level_offsets)
+    np.save(os.path.join(tmp_dir, 'bounds.npy'), shapely.bounds(geoms))
+
+    columns = []
+    for number, name in enumerate(col for col in lines.columns if col not in [lines.geometry.name, 'state']):
+        values = lines[name]
+        column = {'name': name, 'file': 'column_{}.npy'.format(number), 'dtype': str(values.dtype)}
+        if isinstance(values.dtype, pd.CategoricalDtype) or not (pd.api.types.is_numeric_dtype(values) or
+                                                                pd.api.types.is_datetime64_any_dtype(values)):
+            codes, categories = pd.factorize(values)
+            np.save(os.path.join(tmp_dir, column['file']), codes.astype(np.int32))
+            column['categories'] = 'categories_{}.npy'.format(number)
+            np.save(os.path.join(tmp_dir, column['categories']), np.array([str(category) for category in categories], dtype=str))
+        elif pd.api.types.is_extension_array_dtype(values):
+# Nullable ints (wind_siting.schema): the values, plus where the NAs are.
+            np.save(os.path.join(tmp_dir, column['file']), values.to_numpy(dtype=values.dtype.numpy_dtype, na_value=0))
+            if values.isna().any():
+                column['mask'] = 'mask_{}.npy'.format(number)
+                np.save(os.path.join(tmp_dir, column['mask']), values.isna().to_numpy())
+        else:
+            np.save(os.path.join(tmp_dir, column['file']), values.to_numpy())
+        columns.append(column)
+
+    row_state, states = pd.factorize(power_out_df['state'])
+    np.save(os.path.join(tmp_dir, 'row_line.npy'), row_line.astype(np.int32))
+    np.save(os.path.join(tmp_dir, 'row_state.npy'), row_state.astype(np.int16))
+    meta = {'version': store_version,
+            'crs': power_out_df.crs.to_json() if power_out_df.crs is not None else None,
+            'geom_type': int(geom_type),
+            'levels': len(offsets),
+            'columns': columns,
+            'states': [str(state) for state in states],
+            'state_dtype': str(power_out_df['state'].dtype)}
+    with open(os.path.join(tmp_dir, meta_file), 'w') as f:
+        json.dump(meta, f, indent=1)
+
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp_dir, directory)
+    return os.path.join(directory, meta_file)
+
+
+# All of start:start+length, for each (start, length), end to end.
+def ranges(starts, lengths):
+    ends = np.cumsum(lengths)
+    return np.arange(ends[-1] if len(ends) else 0) - np.repeat(ends - lengths, lengths) + np.repeat(starts, lengths)
+
+
+class PowerLineStore:
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, meta_file)) as f:
+            self.meta = json.load(f)
+        if self.meta['version'] != store_version:
+            raise ValueError("{} was written by another version of the line store; rerun the power stage".format(directory))
+        self.directory = directory
+        self.crs = projection.as_crs(self.meta['crs']) if self.meta['crs'] is not None else None
+        self.coords = self.load('coords.npy')
+        self.offsets = [self.load('offsets_{}.npy'.format(level)) for level in range(self.meta['levels'])]
+        self.bounds = self.load('bounds.npy')
+        self.row_line = self.load('row_line.npy')
+        self.row_state = self.load('row_state.npy')
+        self.states = self.meta['states']
+        self.state_names = np.array(self.states, dtype=object)
+        self.state_dtype = pd.CategoricalDtype(pd.Index(self.states)) if self.meta['state_dtype'] == 'category' else None
+        self.columns = {column['name']: column for column in self.meta['columns']}
+        self.arrays = {}
+
+    def load(self, name):
+        return np.load(os.path.join(self.directory, name), mmap_mode='r')
+
+    def __len__(self):
+        return self.bounds.shape[0]
+
+# Positions of the lines in these states, one per power_out_df row and in
+# its order, so a line in two of the states comes back twice, the way
+# power_out_df.loc[power_out_df['state'].isin(states)] has it. With bbox,
+# only the ones whose bounding box touches it, still in that order.
+    def state_rows(self, states, bbox=None):
+        codes = [self.states.index(state) for state in states if state in self.states]
+        mask = np.isin(self.row_state, codes)
+        row_line = np.asarray(self.row_line[mask])
+        row_state = np.asarray(self.row_state[mask])
+        if bbox is not None:
+            touching = self.touches(bbox, row_line)
+            row_line, row_state = row_line[touching], row_state[touching]
+        return row_line, row_state
+
+# Whether each of these lines' bounding box touches (minx, miny, maxx, maxy).
+    def touches(self, bbox, line_idx=slice(None)):
+        min_x, min_y, max_x, max_y = bbox
+        bounds = np.asarray(self.bounds[line_idx])
+        return ((bounds[:, 0] <= max_x) & (bounds[:, 2] >= min_x) &
+                (bounds[:, 1] <= max_y) & (bounds[:, 3] >= min_y))
+
+# Positions of the lines whose bounding box touches (minx, miny, maxx, maxy).
+    def bbox_lines(self, bbox):
+        return np.flatnonzero(self.touches(bbox))
+
+    def geometries(self, line_idx):
+        selected = np.asarray(line_idx, dtype=np.int64)
+        offsets = []
+# Walk down from the lines to their parts to their coordinates.
+        for level_offsets in reversed(self.offsets):
+            starts = np.asarray(level_offsets[selected])
+            lengths = np.asarray(level_offsets[selected + 1]) - starts
+            offsets.insert(0, np.concatenate([[0], np.cumsum(lengths)]))
+            selected = ranges(starts, lengths)
+        return shapely.from_ragged_array(shapely.GeometryType(self.meta['geom_type']),
+                                         np.asarray(self.coords[selected]), tuple(offsets))
+
+# Each column's array (and its categories, or where its NAs are) is only
+# loaded the first time the column is asked for. Columns come back in the
+# dtypes power_out_df had: categoricals as categoricals, nullable ints as
+# nullable ints, and other strings taken from an Index, which gives the same
+# string dtype reading power_out_df does (arrow-backed, with pandas 3)
+# rather than a Python object per row.
+    def column(self, name, line_idx):
+        if name not in self.arrays:
+            column = self.columns[name]
+            values = None
+            if column['dtype'] == 'category':
+                values = pd.CategoricalDtype(pd.Index(np.asarray(self.load(column['categories']))))
+            elif 'categories' in column:
+                values = pd.Index(np.asarray(self.load(column['categories'])))
+            mask = self.load(column['mask']) if 'mask' in column else None
+            self.arrays[name] = (self.load(column['file']), values, mask)
+        array, values, mask = self.arrays[name]
+        if isinstance(values, pd.CategoricalDtype):
+            return pd.Categorical.from_codes(np.asarray(array[line_idx]), dtype=values)
+        if values is not None:
+            return values.take(array[line_idx], allow_fill=True, fill_value=np.nan).array
+        out = np.asarray(array[line_idx])
+        if self.columns[name]['dtype'] != str(out.dtype):
+            out = pd.array(out, dtype=self.columns[name]['dtype'])
+            if mask is not None:
+                out[np.asarray(mask[line_idx])] = pd.NA
+        return out
+
+# A GeoDataFrame of these lines (positions may repeat), with the attribute
+# columns asked for (default: all of them), a state column if state_codes
+# are given, and a RangeIndex. Built in one go: geopandas takes about as
+# long to add a column as it does to build the whole frame.
+    def frame(self, line_idx, columns=None, state_codes=None):
+        names = list(self.columns) if columns is None else list(columns)
+        data = {name: self.column(name, line_idx) for name in names}
+        if state_codes is not None and self.state_dtype is not None:
+            data['state'] = pd.Categorical.from_codes(state_codes, dtype=self.state_dtype)
+        elif state_codes is not None:
+            data['state'] = self.state_names[state_codes]
+        data['geometry'] = GeometryArray(self.geometries(line_idx), crs=self.crs)
+        return gpd.GeoDataFrame(data, geometry='geometry')
+
+# The lines of these states, as power_out_df rows (with their state).
+    def for_states(self, states, columns=None, bbox=None):
+        line_idx, state_codes = self.state_rows(states, bbox)
+        return self.frame(line_idx, columns, state_codes)
+
+# Each line whose bounding box touches bbox, once.
+    def in_bbox(self, bbox, columns=None):
+        return self.frame(self.bbox_lines(bbox), columns)
+
+
+# One store per process and directory, reopened if the power stage has
+# rewritten it since.
+open_stores = {}
+
+
+def open_store(root):
+    directory = store_path(root)
+    stamp = os.stat(os.path.join(directory, meta_file)).st_mtime_ns
+    if directory not in open_stores or open_stores[directory][0] != stamp:
+        open_stores[directory] = (stamp, PowerLineStore(directory))
+    return open_stores[directory][1]
@@ -0,0 +1,127 @@
+import os
+import glob
+import json
+import hashlib
+
+# Every per-state output directory gets a .manifest/ folder with one small JSON
+# file per state, recording what that state's output was built from: a content
+# hash of each input file, the stage's version, and the script's parameters.
+# A rerun skips any state whose record still matches, so after a crash (or a
+# data fix in a single state) only the states that need it are rebuilt.
+#
+# One file per state means worker processes can record their own state as
+# soon as it is written without stepping on each other.
+manifest_dirname = '.manifest'
+
+
+def file_digest(path, block_size=2**20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# --force, shared by the per-state scripts.
+def add_manifest_arguments(parser):
+    parser.add_argument('--force', action='append', default=[], metavar='STATE',
+                        help="rebuild STATE even if its inputs haven't changed; "
+                             "can be given more than once, or as 'all'")
+
+
+class Manifest:
+
+    def __init__(self, output_dir, version, params=None, force=()):
+        self.output_dir = output_dir
+        self.version = version
+# Round-trip through JSON so e.g. tuples compare equal to what we read back.
+        self.params = json.loads(json.dumps(params or {}))
+        self.force = set(state.upper() for state in force)
+        self.digests = {}
+
+    def entry_path(self, state):
+        return os.path.join(self.output_dir, manifest_dirname, '{}.json'.format(state))
+
+    def entry(self, state):
+        try:
+            with open(self.entry_path(state)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def states(self):
+        pattern = os.path.join(self.output_dir, manifest_dirname, '*.json')
+        return sorted(os.path.splitext(os.path.basename(path))[0] for path in glob.glob(pattern))
+
+    def forced(self, state):
+        return 'ALL' in self.force or state.upper() in self.force
+
+# Content hashes for a state's input files. Hashing multi-GB files on every
+# run would eat most of what we save, so a file whose size and mtime match
+# the last record reuses the hash from that record. Missing inputs (WY has
+# no power line file) are recorded as None, so their later appearance
+# counts as a change.
+# Hashes are also kept on the manifest by (path, size, mtime), so the states
+# of a stage that all come from one national file (centroid's ~48) hash it
+# once between them, even on a first run when none of them has a record.
+    def input_digests(self, state, paths):
+        previous = (self.entry(state) or {}).get('inputs', {})
+        inputs = {}
+        for path in paths:
+            if not os.path.exists(path):
+                inputs[path] = None
+                continue
+            stat = os.stat(path)
+            old = previous.get(path)
+            key = (path, stat.st_size, stat.st_mtime_ns)
+            if old and old['size'] == stat.st_size and old['mtime_ns'] == stat.st_mtime_ns:
+                inputs[path] = old
+            elif key in self.digests:
+                inputs[path] = self.digests[key]
+            else:
+                inputs[path] = {'sha256': file_digest(path),
+                                'size': stat.st_size,
+                                'mtime_ns': stat.st_mtime_ns}
+            self.digests[key] = inputs[path]
+        return inputs
+
+    def is_current(self, state, inputs, outputs):
+        if self.forced(state):
+            return False
+        entry = self.entry(state)
+        if entry is None:
+            return False
+        if entry.get('version') != self.version or entry.get('params') != self.params:
+            return False
+        if not all(os.path.exists(path) for path in outputs):
+            return False
+        recorded = entry.get('inputs', {})
+        if set(recorded) != set(inputs):
+            return False
+        for path, digest in inputs.items():
+            old = recorded[path]
+            if (digest is None) != (old is None):
+                return False
+            if digest is not None and digest['sha256'] != old['sha256']:
+                return False
+        return True
+
+# Whatever the script wants back on a skipped rerun (e.g. the per-state
+# summary statistics) can be stored in result; it must be JSON-serializable.
+    def result(self, state):
+        return (self.entry(state) or {}).get('result')
+
+# Only call this once the outputs are completely written.
+    def record(self, state, inputs, outputs, result=None):
+        path = self.entry_path(state)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {'state': state,
+                 'version': self.version,
+                 'params': self.params,
+                 'inputs': inputs,
+                 'outputs': outputs,
+                 'result': result}
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(entry, f, indent=1)
+        os.replace(tmp_path, path)
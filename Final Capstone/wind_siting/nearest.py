@@ -0,0 +1,177 @@
+import numpy as np
+import pandas as pd
+import shapely
+
+from wind_siting import projection
+
+# The attributes of the nearest transmission line that get copied onto
+# each turbine/NREL cell, plus the distance to that line.
+LINE_ATTRIBUTES = ['OBJECTID','TYPE','VOLTAGE','VOLT_CLASS','SHAPE__Len']
+NEAREST_COLUMNS = LINE_ATTRIBUTES + ['dist_to_nearest_line']
+
+
+# A spatial index (STRtree) over a set of power lines. Build it once per
+# set of lines, then ask it for the nearest line of a whole array of points
+# in a single call, instead of running nearest_points() against a unary_union
+# and then re-scanning every line to figure out which one we landed on.
+class NearestLineIndex:
+
+    def __init__(self, power_lines):
+# Positional order matters: ties are broken by the first line in the
+# dataframe, same as np.where(...)[0][0] did in the per-row version.
+        self.lines = power_lines.reset_index(drop=True)
+        self.tree = shapely.STRtree(np.asarray(self.lines['geometry'].values))
+
+    def __len__(self):
+        return self.lines.shape[0]
+
+# Returns a positional line index for every point (-1 if the point is
+# empty/missing), and the distance from the point to that line.
+    def nearest_index(self, points):
+        points = np.asarray(points, dtype=object)
+        line_idx = np.full(len(points), -1, dtype=np.int64)
+        distance = np.full(len(points), np.nan)
+        if len(points) == 0 or len(self) == 0:
+            return line_idx, distance
+
+        pairs = self.tree.query_nearest(points, all_matches=True)
+# all_matches=True returns every line tied for nearest. Keep the lowest
+# line index for each point.
+        order = np.lexsort((pairs[1], pairs[0]))
+        pairs = pairs[:, order]
+        pt_idx, first = np.unique(pairs[0], return_index=True)
+        line_idx[pt_idx] = pairs[1][first]
+
+        found = line_idx >= 0
+        distance[found] = shapely.distance(points[found],
+                                           self.tree.geometries.take(line_idx[found]))
+        return line_idx, distance
+
+# The batched equivalent of the per-row loop in the capstone scripts:
+# one row per point, with the nearest line's attributes and the distance
+# to it, indexed like the points that were passed in.
+    def query(self, points):
+        line_idx, distance = self.nearest_index(points)
+        if isinstance(points, pd.Series):
+            index = points.index
+        else:
+            index = pd.RangeIndex(len(line_idx))
+# self.lines has a RangeIndex, so reindexing by -1 gives a row of NaNs
+# for points that had no nearest line.
+        out = self.lines[LINE_ATTRIBUTES].reindex(line_idx)
+        out.index = index
+        out['dist_to_nearest_line'] = distance
+        return out
+
+
+# How many lines come within each radius of each point, e.g. the number of
+# lines within 1 degree. Returns an array of counts per point for a single
+# radius, or a (points x radii) array for a list of radii, from one query.
+#
+# This used to be done by buffering every point and sjoining the lines to the
+# buffers. A buffer is a polygon with quad_segs segments per quarter circle,
+# slightly inside the true circle, so to reproduce those counts exactly, lines
+# that pass through the sliver between the two are checked against the
+# buffer itself. quad_segs=None counts against the true circle instead.
+    def count_within(self, points, radii, quad_segs=16):
+        points = np.asarray(points, dtype=object)
+        single = np.ndim(radii) == 0
+        radii = np.atleast_1d(np.asarray(radii, dtype=float))
+        counts = np.zeros((len(points), len(radii)), dtype=np.int64)
+        if len(points) == 0 or len(self) == 0:
+            return counts[:, 0] if single else counts
+
+        pt_idx, line_idx = self.tree.query(points, predicate='dwithin', distance=radii.max())
+        distance = shapely.distance(points[pt_idx], self.tree.geometries.take(line_idx))
+        for col, radius in enumerate(radii):
+            if quad_segs is None:
+                inside = distance <= radius
+            else:
+                inside = distance <= radius * np.cos(np.pi / (4 * quad_segs))
+                sliver = ~inside & (distance <= radius)
+                buffers = shapely.buffer(points[pt_idx[sliver]], radius, quad_segs=quad_segs)
+                inside[sliver] = shapely.intersects(buffers, self.tree.geometries.take(line_idx[sliver]))
+            counts[:, col] = np.bincount(pt_idx[inside], minlength=len(points))
+        return counts[:, 0] if single else counts
+
+
+# The same queries in metres (--distance metres). The lines and the points
+# are both in a projected CRS in metres (projection.distance_frames puts them
+# in one fitted to the state), which picks the nearest line and the
+# candidates within a radius. The distances themselves are then geodesic,
+# from each point to the nearest point on its line, so they don't depend on
+# the projection. Points in any other CRS are reprojected first.
+class GeodesicLineIndex(NearestLineIndex):
+
+# Lines whose projected distance is within this fraction of a radius are
+# checked geodesically, to allow for the projection's scale error.
+    tolerance = 0.02
+
+    def __init__(self, power_lines):
+        self.crs = power_lines.crs
+        super().__init__(power_lines)
+
+    def project(self, points):
+        return np.asarray(projection.to_crs(points, self.crs).values, dtype=object)
+
+# Geodesic distance from each point to the nearest point of its line.
+    def distance_to(self, points, line_idx):
+        ends = shapely.get_coordinates(shapely.shortest_line(points, self.tree.geometries.take(line_idx)))
+        return projection.geodesic_distance(shapely.points(ends[0::2]), shapely.points(ends[1::2]), self.crs)
+
+    def nearest_index(self, points):
+        points = self.project(points)
+        line_idx, distance = super().nearest_index(points)
+        found = line_idx >= 0
+        if found.any():
+            distance[found] = self.distance_to(points[found], line_idx[found])
+        return line_idx, distance
+
+# radii are in metres. Counts are against the true (geodesic) circle, so
+# there's no buffer to reproduce and quad_segs is ignored.
+    def count_within(self, points, radii, quad_segs=None):
+        points = self.project(points)
+        single = np.ndim(radii) == 0
+        radii = np.atleast_1d(np.asarray(radii, dtype=float))
+        counts = np.zeros((len(points), len(radii)), dtype=np.int64)
+        if len(points) == 0 or len(self) == 0:
+            return counts[:, 0] if single else counts
+
+        pt_idx, line_idx = self.tree.query(points, predicate='dwithin', distance=radii.max() * (1 + self.tolerance))
+        distance = shapely.distance(points[pt_idx], self.tree.geometries.take(line_idx))
+        near_edge = np.abs(distance[:, None] - radii[None, :]).min(axis=1) <= radii.max() * self.tolerance
+        distance[near_edge] = self.distance_to(points[pt_idx[near_edge]], line_idx[near_edge])
+        for col, radius in enumerate(radii):
+            inside = distance <= radius
+            counts[:, col] = np.bincount(pt_idx[inside], minlength=len(points))
+        return counts[:, 0] if single else counts
+
+
+# The index for a distance mode: degrees, as the features have always been,
+# or metres, over lines already in a projected CRS.
+def make_line_index(power_lines, distance='degrees'):
+    if distance == 'metres':
+        return GeodesicLineIndex(power_lines)
+    return NearestLineIndex(power_lines)
+
+
+# Convenience wrappers for a one-off query.
+def nearest_lines(points, power_lines):
+    return NearestLineIndex(power_lines).query(points)
+
+
+def count_within_distance(points, power_lines, radius, quad_segs=16):
+    return NearestLineIndex(power_lines).count_within(points, radius, quad_segs=quad_segs)
+
+
+# The line count features for the model: 'line_count' for the main radius,
+# plus a 'line_count_<radius>' column for each extra radius, all from a
+# single query of the index. The radii are in degrees either way; a metres
+# index counts within the same arc on the ground.
+def line_count_features(line_index, points, radius, extra_radii=()):
+    radii = [radius] + list(extra_radii)
+    if isinstance(line_index, GeodesicLineIndex):
+        radii = [value * projection.metres_per_degree for value in radii]
+    counts = line_index.count_within(points, radii)
+    columns = ['line_count'] + ['line_count_{}'.format(extra) for extra in extra_radii]
+    return pd.DataFrame(counts, columns=columns)
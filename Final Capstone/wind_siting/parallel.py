@@ -0,0 +1,179 @@
+import os
+import resource
+import traceback
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+# Rough ratio of peak RAM to bytes on disk while a state is being processed
+# (parsed geometries, sjoin results, the copies made along the way), by file
+# type. GeoParquet is about 7x smaller on disk than the same GeoJSON.
+# It only has to be good enough to keep TX and CA from running side by side.
+memory_factors = {'.geojson': 6,
+                  '.parquet': 40}
+default_memory_factor = 6
+
+
+def physical_memory():
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+
+
+# Estimated peak memory, in bytes, for a state whose inputs are these files.
+# Missing files (e.g. WY has no power line file) count as zero.
+def estimate_memory(paths):
+    total = 0
+    for path in paths:
+        if os.path.exists(path):
+            factor = memory_factors.get(os.path.splitext(path)[1], default_memory_factor)
+            total += os.path.getsize(path) * factor
+    return total
+
+
+# Peak resident memory of this process so far, in bytes. On Linux, VmHWM
+# is used because ru_maxrss carries over the parent's peak into a child.
+def peak_rss():
+    return max(earlier_peak, hwm_rss())
+
+
+# The peak since the last reset_peak_rss().
+def hwm_rss():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+# Restart VmHWM from the current RSS, so the peak of what runs next can be
+# measured on its own (writing 5 to clear_refs, Linux 4.0+). peak_rss()
+# still reports the peak from before. False if the kernel won't let us,
+# in which case hwm_rss() stays the peak of the whole process.
+earlier_peak = 0
+
+
+def reset_peak_rss():
+    global earlier_peak
+    earlier_peak = max(earlier_peak, hwm_rss())
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+# --workers / --memory-budget, shared by the per-state scripts.
+def add_worker_arguments(parser):
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of states to process at once (default: 1, no process pool)')
+    parser.add_argument('--memory-budget', type=float, default=None,
+                        help='GB of RAM the running states may use between them '
+                             '(default: 75%% of physical memory)')
+
+
+def memory_budget_bytes(memory_budget_gb):
+    if memory_budget_gb is None:
+        return int(physical_memory() * 0.75)
+    return int(memory_budget_gb * 2**30)
+
+
+# What run_states raises once every state has had its turn, if any of them
+# failed: {state: exception} for those, and {state: result} for the rest.
+# The states that finished are in their manifests, so a rerun only does the
+# failed ones again.
+class StateFailures(Exception):
+
+    def __init__(self, failures, results):
+        self.failures = failures
+        self.results = results
+        super().__init__("{} of {} states failed: {}; rerun to retry them".format(
+                         len(failures), len(failures) + len(results),
+                         ', '.join('{} ({})'.format(state, type(e).__name__) for state, e in sorted(failures.items()))))
+
+
+def report_failure(state, e):
+    print("{} failed:".format(state))
+    traceback.print_exception(type(e), e, e.__traceback__)
+
+
+# Run func(*args) for every (state, estimated_bytes, args) job and return
+# {state: result}.
+#
+# With one worker the states run in this process, in alphabetical order, as
+# the scripts always did. With more, the states are fanned out to a process
+# pool, biggest first, and a state is only started if its estimate fits in
+# what is left of the memory budget. A state bigger than the whole budget
+# still runs, but only once nothing else is running.
+#
+# Results are keyed by state, so callers that merge them in sorted(state)
+# order get the same output no matter which worker finished first.
+#
+# A state that fails doesn't stop the others: its exception is printed, the
+# rest carry on, and StateFailures is raised at the end. Pass a dict as
+# failures to have them added to it instead, and get the results back. A
+# worker that dies (killed for running out of memory, say) takes the states
+# running alongside it down too; the pool is started again for the rest.
+def run_states(func, jobs, workers=1, memory_budget=None, failures=None):
+    jobs = sorted(jobs, key=lambda job: job[0])
+    results = {}
+    failed = {}
+    if workers <= 1:
+        for state, estimate, args in jobs:
+            try:
+                results[state] = func(*args)
+            except Exception as e:
+                report_failure(state, e)
+                failed[state] = e
+        return finish(results, failed, failures)
+
+    if memory_budget is None:
+        memory_budget = memory_budget_bytes(None)
+    pending = sorted(jobs, key=lambda job: job[1], reverse=True)
+    running = {}
+    in_use = 0
+    pool = ProcessPoolExecutor(max_workers=workers)
+    broken = False
+    try:
+        while pending or running:
+            if broken and not running:
+                pool.shutdown()
+                pool = ProcessPoolExecutor(max_workers=workers)
+                broken = False
+            idx = 0
+            while not broken and idx < len(pending) and len(running) < workers:
+                state, estimate, args = pending[idx]
+                if running and in_use + estimate > memory_budget:
+                    idx += 1
+                    continue
+                print("Starting {} (estimated {:.1f} GB)".format(state, estimate / 2**30))
+                running[pool.submit(func, *args)] = (state, estimate)
+                in_use += estimate
+                pending.pop(idx)
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                state, estimate = running.pop(future)
+                in_use -= estimate
+                try:
+                    results[state] = future.result()
+                    print("Finished {}".format(state))
+                except BrokenProcessPool as e:
+                    report_failure(state, e)
+                    failed[state] = e
+                    broken = True
+                except Exception as e:
+                    report_failure(state, e)
+                    failed[state] = e
+    finally:
+        pool.shutdown()
+    return finish({state: results[state] for state in sorted(results)}, failed, failures)
+
+
+def finish(results, failed, failures):
+    if failures is not None:
+        failures.update(failed)
+    elif failed:
+        raise StateFailures(failed, results)
+    return results
@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+from wind_siting import projection
+
+polygon_types = [shapely.GeometryType.POLYGON, shapely.GeometryType.MULTIPOLYGON]
+
+
+# Only keep the polygonal part of an intersection, the way gpd.overlay does:
+# a cell that merely touches a border (a line or a point in common) is dropped,
+# and a collection keeps just its polygons.
+def polygonal(geoms):
+    geoms = np.array(geoms, dtype=object)
+    type_ids = shapely.get_type_id(geoms)
+    for idx in np.flatnonzero(type_ids == shapely.GeometryType.GEOMETRYCOLLECTION):
+        parts = shapely.get_parts(geoms[idx])
+        parts = parts[np.isin(shapely.get_type_id(parts), polygon_types)]
+        geoms[idx] = shapely.union_all(parts) if len(parts) > 0 else None
+    keep = np.isin(shapely.get_type_id(geoms), polygon_types) & ~shapely.is_empty(geoms)
+    return geoms, keep
+
+
+# Splits cells between the states they overlap, in one pass.
+#
+# The borders get one spatial index, built once. Each cell is matched to the
+# states it intersects; a cell that lies entirely within its state is kept as
+# it is, and only the cells that straddle a border are clipped to it. That is
+# the same result as sjoin followed by an overlay per state, without running
+# 48 overlays.
+class StatePartitioner:
+
+    def __init__(self, borders, key_column='STUSPS'):
+        self.borders = borders.reset_index(drop=True)
+        self.key_column = key_column
+        self.border_geoms = np.asarray(self.borders['geometry'].values)
+        shapely.prepare(self.border_geoms)
+        self.tree = shapely.STRtree(self.border_geoms)
+
+# Returns one row per (cell, state) pair with some area in common, carrying
+# the cell's columns, the state in key_column and the clipped geometry.
+# Cells that don't fall in any state (offshore) are left out.
+    def partition(self, cells):
+        cells = projection.to_crs(cells, self.borders.crs)
+        cell_geoms = np.asarray(cells['geometry'].values)
+        cell_idx, border_idx = self.tree.query(cell_geoms, predicate='intersects')
+        order = np.lexsort((border_idx, cell_idx))
+        cell_idx, border_idx = cell_idx[order], border_idx[order]
+
+        geoms = cell_geoms[cell_idx].copy()
+        straddling = ~shapely.within(geoms, self.border_geoms[border_idx])
+        geoms[straddling] = shapely.intersection(geoms[straddling], self.border_geoms[border_idx[straddling]])
+        geoms, keep = polygonal(geoms)
+
+        out = pd.DataFrame(cells.drop(columns='geometry').iloc[cell_idx[keep]])
+        out[self.key_column] = self.borders[self.key_column].values[border_idx[keep]]
+        return gpd.GeoDataFrame(out, geometry=geoms[keep], crs=self.borders.crs)
+
+
+# --partition tiles: which tile_size x tile_size degree square each cell's
+# centroid is in, as '<x>_<y>' (counted in tiles from 0, 0, so -51_16 is
+# the square whose south-west corner is at 102W, 32N). A cell without a
+# centroid goes in a tile of its own, 'none'.
+def tile_keys(longs, lats, tile_size):
+    longs = np.asarray(longs, dtype=float)
+    lats = np.asarray(lats, dtype=float)
+    found = np.isfinite(longs) & np.isfinite(lats)
+    x = pd.Series(np.floor(np.where(found, longs, 0) / tile_size).astype(np.int64)).astype(str)
+    y = pd.Series(np.floor(np.where(found, lats, 0) / tile_size).astype(np.int64)).astype(str)
+    return np.where(found, (x + '_' + y).to_numpy(), 'none')
+
+
+# The box every line a tile's cells could need lies in: the bounds of their
+# centroids, halo degrees bigger all round. Any line within halo of a
+# centroid touches it. In metres the halo is an arc on the ground, which is
+# more degrees of longitude the further north the tile is, and a little
+# more again for the projection's scale error (see
+# wind_siting.nearest.GeodesicLineIndex).
+def halo_bounds(longs, lats, halo, distance='degrees'):
+    min_x, max_x = np.nanmin(longs), np.nanmax(longs)
+    min_y, max_y = np.nanmin(lats), np.nanmax(lats)
+    halo_x = halo
+    if distance == 'metres':
+        halo = halo * 1.1
+        halo_x = halo / np.cos(np.radians(min(89.0, max(abs(min_y), abs(max_y)) + halo)))
+    return (min_x - halo_x, min_y - halo, max_x + halo_x, max_y + halo)
+
+
+# A cell whose nearest line is no further than this (in the distance mode's
+# units) has found the same line among the halo's lines as it would among
+# all of its state's; one whose nearest line is further has to look again.
+def halo_reach(halo, distance='degrees'):
+    if distance == 'metres':
+        return halo * projection.metres_per_degree
+    return halo
@@ -0,0 +1,601 @@
+import os
+import glob
+import time
+import shutil
+import pandas as pd
+import geopandas as gpd
+
+from wind_siting import line_store, plan, schema, scoring, sketch, stages, storage, instrument
+from wind_siting.instrument import span
+from wind_siting.nearest import LINE_ATTRIBUTES
+from wind_siting.parallel import StateFailures, estimate_memory, memory_budget_bytes, run_states, peak_rss
+from wind_siting.partition import StatePartitioner, halo_bounds, halo_reach, tile_keys
+from wind_siting.streaming import GeoJSONBatchWriter, ParquetBatchWriter, PartitionWriter, batch_writer, \
+                                  iter_batches, iter_column_batches, read_geoparquet, read_parts
+from wind_siting.wind_class import load_wind_class_lookup
+
+# Running each stage for real: reading its inputs, calling wind_siting.stages
+# and writing (and recording in the manifest) what comes out. dirs is the
+# stage's directories from wind_siting.config; args the parsed command line
+# (states, --workers, --memory-budget, --force, --format). Everything read
+# is put in wind_siting.schema's compact dtypes straight away, and so is
+# everything a stage makes before it's written.
+
+
+# Split the NREL datasets by state and add cell centroids.
+#
+# This dataset eats an ENORMOUS amount of RAM trying to calculate these
+# attributes if vectorized instead of looped, unfortunately, so the national
+# file is streamed from disk a chunk at a time: each chunk gets its centroid
+# and is split between the states it falls in, then spilled to disk by
+# state. Each state's file is then written from its spilled parts one part
+# at a time, so peak memory depends on the chunk size and the spill buffer
+# (PartitionWriter's max_buffered_rows), rather than the size of the file or
+# of the biggest state.
+#
+# Each state's output is recorded in a manifest, so a rerun skips the
+# national file entirely when nothing has changed, and only rewrites the
+# states that are out of date.
+def run_centroid(dirs, args):
+# We can determine state by joining to this dataset of US boundaries
+    with span('read_borders') as stage:
+        borders = gpd.read_file("{}.shp".format(os.path.join(dirs['in'], plan.borders_source)))
+        stage.rows = borders.shape[0]
+    lower48_borders = borders.loc[(borders['REGION'] < '5') & (~borders['STUSPS'].isin(['AK','HI']))].to_crs({'init': 'epsg:4326'})
+    del borders
+
+# One spatial index over the state borders, shared by every chunk.
+    state_partitioner = StatePartitioner(lower48_borders[['STUSPS','geometry']])
+
+    for qualifier in ['w','no']:
+        manifest = plan.centroid_manifest(dirs, qualifier, args.force)
+        input_files = plan.centroid_input_files(dirs, qualifier)
+        if plan.all_current(manifest, input_files):
+            print("All {} NREL state files are up to date; skipping ".format(qualifier),time.strftime('%X %x %Z'))
+            continue
+
+        print("Streaming {} NREL file ".format(qualifier),time.strftime('%X %x %Z'))
+        state_partitions = PartitionWriter("{}/nrel_{}_spill".format(dirs['out'],qualifier))
+# Per-chunk stages are added up per qualifier ('w'/'no' in the state column).
+        for nrel_wind_data in instrument.timed_iter(iter_batches(plan.nrel_source(dirs['in'], qualifier) + '.shp',
+                                                                 plan.nrel_chunk_size),
+                                                    'read_batch', qualifier):
+            print("nrel_wind_data[{}:{}]".format(nrel_wind_data.index[0],nrel_wind_data.index[-1] + 1))
+            nrel_wind_data = schema.compact(nrel_wind_data, schema.nrel_cells)
+            print("Adding state and extracting centroid...")
+            nrel_chunk_df = stages.split_cells_by_state(nrel_wind_data, state_partitioner, lower48_borders.crs, qualifier)
+            with span('spill', qualifier, rows=nrel_chunk_df.shape[0]):
+                state_partitions.append(nrel_chunk_df, 'state')
+        print("Peak memory so far: {:.1f} GB".format(peak_rss() / 2**30))
+
+        for state in state_partitions.keys():
+            if not plan.wanted(state, args.state):
+                continue
+            state_stem = plan.nrel_state_stem(dirs['out'], qualifier, state)
+            output_file = storage.artifact_path(state_stem, args.format)
+            state_inputs = manifest.input_digests(state, input_files)
+            if manifest.is_current(state, state_inputs, [output_file]):
+                print("{} NREL file for {} is up to date; skipping it".format(qualifier,state))
+                continue
+            print("Writing {} NREL file for {} ".format(qualifier,state),time.strftime('%X %x %Z'))
+            with instrument.profiled(state, qualifier), span('write_{}'.format(qualifier), state) as stage:
+                writer = batch_writer(output_file)
+                for state_df in state_partitions.iter_read(state):
+                    writer.write(schema.compact(state_df, schema.nrel_cells))
+                stage.rows = writer.rows
+                written = writer.close()
+            if written is not None:
+                manifest.record(state, state_inputs, [output_file])
+
+        state_partitions.cleanup()
+    print("Peak memory: {:.1f} GB".format(peak_rss() / 2**30))
+
+
+def read_borders(dirs):
+    with span('read_borders') as stage:
+        lower48_borders = gpd.read_file('{}/lower48_borders.geojson'.format(dirs['in']),driver='GeoJSON')
+        stage.rows = lower48_borders.shape[0]
+    return lower48_borders
+
+
+# Add state to the high-voltage transmission lines and split them by state.
+# If every state's power line file is still current, there's nothing to do.
+# The whole network also goes into the line store (wind_siting.line_store),
+# which the turbines and nrel stages map instead of reading these files.
+def run_power(dirs, args):
+    manifest = plan.power_manifest(dirs, args.force, args.format)
+    input_files = plan.power_input_files(dirs)
+    if plan.all_current(manifest, input_files):
+        print("Power line files are up to date; skipping ",time.strftime('%X %x %Z'))
+        return
+
+    lower48_borders = read_borders(dirs)
+    print("Opening transmission lines file ",time.strftime('%X %x %Z'))
+    with span('read_power_lines') as stage:
+        power_lines = schema.compact(gpd.read_file(plan.power_source(dirs['in']) + '.shp'), schema.power_lines)
+        stage.rows = power_lines.shape[0]
+    power_lines = stages.usable_power_lines(power_lines)
+
+    print("Joining transmission lines to borders to obtain state ",time.strftime('%X %x %Z'))
+    power_out_df = schema.compact(stages.power_lines_by_state(power_lines, lower48_borders, plan.power_chunk_size),
+                                  schema.power_lines)
+    with span('write_power_lines', rows=power_out_df.shape[0]):
+        power_out_file = storage.write_frame(power_out_df, '{}/power_out_df'.format(dirs['out']), args.format)
+    with span('write_line_store', rows=power_out_df.shape[0]):
+        line_store_file = line_store.write_store(dirs['out'], power_out_df)
+
+    for state in power_out_df['state'].unique():
+        if not plan.wanted(state, args.state):
+            continue
+        print("Writing power line GeoJSON file for {} ".format(state),time.strftime('%X %x %Z'))
+        if power_out_df.loc[power_out_df['state'] == state].shape[0] == 0:
+            print("No power line data for {} ".format(state),time.strftime('%X %x %Z'))
+        else:
+            with span('write_power_lines', state):
+                power_state_file = storage.write_frame(power_out_df.loc[power_out_df['state'] == state],
+                                                       plan.power_state_stem(dirs['out'], state),
+                                                       args.format)
+            manifest.record(state,
+                            manifest.input_digests(state, input_files),
+                            [power_state_file, power_out_file, line_store_file])
+
+
+# Add the nearest-line, line count and wind_class features to one state's
+# turbines and write them out. This runs in a worker process when --workers > 1.
+# Once the output is written, the state is recorded in the manifest.
+@instrument.traced_state
+def turbines_state(us_state, existing_turbines, power_line_states, manifest, inputs, fmt, dirs, distance):
+    print("Adding features to {} turbines for {} ".format(existing_turbines.shape[0],us_state),time.strftime('%X %x %Z'))
+    power_lines = read_power_lines(dirs['in'], power_line_states, us_state)
+    with span('wind_class_lookup', us_state):
+        wind_class_lookup = load_wind_class_lookup(plan.nrel_state_stem(dirs['in'], 'w', us_state),
+                                                   '{}/wind_class_lookup'.format(dirs['out']),
+                                                   us_state)
+    existing_turbines_add_nrel = stages.turbine_features(existing_turbines, power_lines, wind_class_lookup,
+                                                         plan.line_count_radius, plan.extra_line_count_radii,
+                                                         plan.default_wind_class, us_state, distance)
+    existing_turbines_add_nrel = schema.compact(existing_turbines_add_nrel, schema.turbine_features)
+
+    print("Writing turbine GeoJSON file for {} ".format(us_state),time.strftime('%X %x %Z'))
+    with span('write', us_state, rows=existing_turbines_add_nrel.shape[0]):
+        output_file = storage.write_frame(existing_turbines_add_nrel,
+                                          plan.turbine_state_stem(dirs['out'], us_state),
+                                          fmt)
+    manifest.record(us_state, inputs, [output_file])
+    return existing_turbines_add_nrel.shape[0]
+
+
+# Use our augmented power line dataset to create some features for the turbine dataset.
+def run_turbines(dirs, args):
+    manifest = plan.turbines_manifest(dirs, args.force, args.distance)
+    todo = []
+    for us_state, power_line_states, input_files, inputs, output_file, current in \
+            plan.turbine_jobs(dirs, manifest, args.format, args.state):
+# Skip states that were already built from these exact inputs.
+        if current:
+            print("{} is up to date; skipping it".format(us_state))
+        else:
+            todo.append((us_state, power_line_states, input_files, inputs))
+    if not todo:
+        return
+
+    print("Opening existing turbines file ",time.strftime('%X %x %Z'))
+    with span('read_turbines') as stage:
+        existing_turbines_US = schema.compact(gpd.read_file('{}/existing_turbines.geojson'.format(dirs['in']),driver='GeoJSON'),
+                                              schema.turbines)
+        stage.rows = existing_turbines_US.shape[0]
+    existing_turbines_US.rename(columns={'index':'t_index'},inplace=True)
+
+    jobs = []
+    for us_state, power_line_states, input_files, inputs in todo:
+        print("Processing turbines for {} ".format(us_state),time.strftime('%X %x %Z'))
+        existing_turbines = existing_turbines_US.loc[existing_turbines_US['t_state'] == us_state].copy(deep=True)
+# If there are no turbines for a given state, skip ahead to the next state.
+        if (existing_turbines.shape[0] == 0):
+            print("No turbines found for {}. Skipping to the next state ".format(us_state),time.strftime('%X %x %Z'))
+            continue
+        if power_line_states != [us_state]:
+            print("No power lines for {}. Using the power lines of its neighbors: {}".format(us_state,power_line_states))
+# Each worker looks its power lines up in the line store itself.
+        jobs.append((us_state, estimate_memory(input_files[1:2]),
+                     (us_state, existing_turbines, power_line_states, manifest, inputs, args.format, dirs, args.distance)))
+
+    run_states(turbines_state, jobs,
+               workers=args.workers,
+               memory_budget=memory_budget_bytes(args.memory_budget))
+
+
+def read_optional(stem, us_state, what, frame_schema):
+    print("Reading {} file for ".format(what),us_state,time.strftime('%X %x %Z'))
+    if not storage.exists(stem):
+        print("Couldn't open that file! We'll have to fillna some values for this state later.")
+        return None
+    with span('read_{}'.format(what.replace(' ', '_')), us_state) as stage:
+        frame = schema.compact(storage.read_frame(stem), frame_schema)
+        stage.rows = frame.shape[0]
+    return frame
+
+
+# The power lines of these states, one row per line and state, in
+# power_out_df's order, with the attributes the features are made of. They
+# come from the line store, which every worker maps rather than reads, so
+# this costs next to nothing per state. Without a store (a power stage from
+# before there was one), from each state's file. None if there aren't any.
+# With bbox, only the lines whose bounding box touches it (a tile's halo).
+def read_power_lines(root, states, us_state, bbox=None):
+    if not line_store.exists(root):
+        frames = [read_optional(plan.power_state_stem(root, state), us_state, 'power lines', schema.power_lines)
+                  for state in states]
+        frames = [frame for frame in frames if frame is not None]
+        if bbox is not None:
+            frames = [frame.cx[bbox[0]:bbox[2], bbox[1]:bbox[3]] for frame in frames]
+            frames = [frame for frame in frames if frame.shape[0] > 0]
+        return pd.concat(frames, ignore_index=True) if frames else None
+    print("Looking up power lines for ",us_state,time.strftime('%X %x %Z'))
+    with span('read_power_lines', us_state) as stage:
+        power_lines = line_store.open_store(root).for_states(states, LINE_ATTRIBUTES, bbox)
+        stage.rows = power_lines.shape[0]
+    if power_lines.shape[0] == 0:
+        print("Couldn't find any! We'll have to fillna some values for this state later.")
+        return None
+    return power_lines
+
+
+# Add the model features to the NREL cells for one state and write them out.
+# Returns the summary statistics for this state that go into national_df,
+# as a wind_siting.sketch.FeatureStatistics dict (plain JSON, so it comes
+# back from a worker and into the manifest as it is).
+# This runs in a worker process when --workers > 1, so it only touches files.
+# Once the output is written, the state is recorded in the manifest, along with
+# its statistics so a rerun that skips this state can still report them.
+@instrument.traced_state
+def nrel_state(us_state, manifest, inputs, dirs, distance):
+    print("Reading NREL file for ",us_state,time.strftime('%X %x %Z'))
+    with span('read_nrel', us_state) as stage:
+        nrel_wind_data = schema.compact(storage.read_frame(plan.nrel_state_stem(dirs['in'], 'no', us_state)),
+                                        schema.nrel_cells)
+        stage.rows = nrel_wind_data.shape[0]
+
+# Open the corresponding power line and turbine state files.
+# NOTE: WY does not have a power line file, and 9 or so states don't have a turbine file.
+    power_lines = read_power_lines(dirs['features_in'], [us_state], us_state)
+    turbines = read_optional(plan.turbine_state_stem(dirs['features_in'], us_state), us_state, 'turbines',
+                             schema.turbine_features)
+
+# The lookup is built from the exclusion file once and kept on disk.
+    with span('wind_class_lookup', us_state):
+        wind_class_lookup = load_wind_class_lookup(plan.nrel_state_stem(dirs['in'], 'w', us_state),
+                                                   '{}/wind_class_lookup'.format(dirs['out']),
+                                                   us_state)
+    nrel_augmented_out = stages.cell_features(nrel_wind_data, power_lines, turbines, wind_class_lookup,
+                                              plan.line_count_radius, plan.extra_line_count_radii, us_state, distance)
+    nrel_augmented_out = schema.compact(nrel_augmented_out, schema.cell_features)
+    del nrel_wind_data, power_lines, turbines, wind_class_lookup
+
+    print("Writing augmented nrel_wind_data GeoJSON file for {} ".format(us_state),time.strftime('%X %x %Z'))
+# This is the final product, which the notebooks read, so it stays GeoJSON.
+    with span('write', us_state, rows=nrel_augmented_out.shape[0]):
+        output_file = storage.write_frame(nrel_augmented_out, plan.augmented_stem(dirs['out'], us_state), 'geojson')
+
+    state_stats = stages.cell_statistics(nrel_augmented_out, us_state, plan.statistics_columns,
+                                         plan.statistics_compression).to_dict()
+    manifest.record(us_state, inputs, [output_file], result=state_stats)
+    return state_stats
+
+
+# --partition tiles: the same augmented cells as nrel_state, built a tile
+# at a time. A state's cells are split into tiles by their centroid, a batch
+# of its file at a time, so nothing ever holds the whole state; each tile
+# gets its features in a job of its own; then the tiles are put back
+# together into the state's file, in its cells' original order. A tile only
+# reads its state's lines within plan.tile_halo of its cells:
+#   line_count     every line the radii can reach is within the halo, so the
+#                  counts are the state's
+#   nearest line   the same line the state's would find, unless it's further
+#                  away than the halo (the tile had no lines near it at
+#                  all), in which case those cells look again among all of
+#                  the state's lines
+#
+# split_state_tiles returns the state's {tile: cells}, and the bounds of
+# its centroids, which the tiles' distances in metres are measured from, as
+# they are for the whole state. It builds the wind_class lookup too, so the
+# tiles (which may run side by side) only ever read it.
+@instrument.traced_state
+def split_state_tiles(us_state, dirs, tile_size):
+    tile_dir = plan.tile_dir(dirs['out'], us_state)
+    shutil.rmtree(tile_dir, ignore_errors=True)
+    writer = PartitionWriter('{}/cells'.format(tile_dir), plan.assemble_batch_size)
+    tiles = {}
+    longs, lats = [], []
+    print("Splitting the NREL file for {} into {} degree tiles ".format(us_state, tile_size),time.strftime('%X %x %Z'))
+    with span('split_tiles', us_state) as stage:
+        for batch in iter_batches(storage.existing_path(plan.nrel_state_stem(dirs['in'], 'no', us_state)),
+                                  plan.assemble_batch_size):
+            batch = batch.assign(source_row=batch.index,
+                                 tile=tile_keys(batch['centroid_long'], batch['centroid_lat'], tile_size))
+            for tile, count in batch['tile'].value_counts().items():
+                tiles[tile] = tiles.get(tile, 0) + int(count)
+            longs += [batch['centroid_long'].min(), batch['centroid_long'].max()]
+            lats += [batch['centroid_lat'].min(), batch['centroid_lat'].max()]
+            writer.append(batch, 'tile')
+        writer.flush()
+        stage.rows = sum(tiles.values())
+    bounds = [float(pd.Series(longs).min()), float(pd.Series(lats).min()),
+              float(pd.Series(longs).max()), float(pd.Series(lats).max())]
+    with span('wind_class_lookup', us_state):
+        load_wind_class_lookup(plan.nrel_state_stem(dirs['in'], 'w', us_state), '{}/wind_class_lookup'.format(dirs['out']),
+                               us_state)
+    return {'tiles': tiles, 'bounds': bounds}
+
+
+# One tile's features, written to <tile_dir>/augmented/<tile>.parquet in its
+# cells' original order. tile_name (<state>_<tile>) labels it in the timings.
+# This runs in a worker process when --workers > 1, so it only touches files.
+@instrument.traced_state
+def nrel_tile(tile_name, us_state, tile, dirs, distance, distance_bounds):
+    tile_dir = plan.tile_dir(dirs['out'], us_state)
+    with span('read_nrel', tile_name) as stage:
+        nrel_wind_data = schema.compact(read_parts('{}/cells/{}'.format(tile_dir, tile)).drop(columns='tile'),
+                                        schema.nrel_cells)
+        stage.rows = nrel_wind_data.shape[0]
+
+    bbox = halo_bounds(nrel_wind_data['centroid_long'], nrel_wind_data['centroid_lat'], plan.tile_halo, distance)
+    power_lines = read_power_lines(dirs['features_in'], [us_state], tile_name, bbox)
+    turbines = read_optional(plan.turbine_state_stem(dirs['features_in'], us_state), tile_name, 'turbines',
+                             schema.turbine_features)
+    with span('wind_class_lookup', tile_name):
+        wind_class_lookup = load_wind_class_lookup(plan.nrel_state_stem(dirs['in'], 'w', us_state),
+                                                   '{}/wind_class_lookup'.format(dirs['out']),
+                                                   us_state)
+    nrel_augmented_out = stages.cell_features(nrel_wind_data, power_lines, turbines, wind_class_lookup,
+                                              plan.line_count_radius, plan.extra_line_count_radii, tile_name,
+                                              distance, distance_bounds)
+
+# Cells whose nearest line is past the halo, or that had no lines in it.
+    nearest = nrel_augmented_out['dist_to_nearest_line']
+    farther = (nearest.isna() | (nearest > halo_reach(plan.tile_halo, distance))).to_numpy()
+    if farther.any():
+        state_lines = read_power_lines(dirs['features_in'], [us_state], tile_name)
+        if state_lines is not None:
+            print("{} cells of {} have no line within the halo; looking among all of {}'s".format(
+                  farther.sum(), tile_name, us_state))
+            again = stages.cell_features(nrel_wind_data.iloc[farther.nonzero()[0]], state_lines, turbines,
+                                         wind_class_lookup, plan.line_count_radius, plan.extra_line_count_radii,
+                                         tile_name, distance, distance_bounds)
+            nrel_augmented_out = pd.concat([nrel_augmented_out.loc[~farther], again])
+        del state_lines
+    nrel_augmented_out = schema.compact(nrel_augmented_out.sort_values('source_row', ignore_index=True),
+                                        schema.cell_features)
+    del nrel_wind_data, power_lines, turbines, wind_class_lookup
+
+    with span('write', tile_name, rows=nrel_augmented_out.shape[0]):
+        os.makedirs('{}/augmented'.format(tile_dir), exist_ok=True)
+        nrel_augmented_out.to_parquet('{}/augmented/{}.parquet'.format(tile_dir, tile), index=False,
+                                      row_group_size=plan.tile_row_group_size)
+    return {'cells': nrel_augmented_out.shape[0], 'looked_again': int(farther.sum())}
+
+
+# Put a state's tiles back together: its cells plan.assemble_batch_size at
+# a time, in their original order (each batch only reads the row groups of
+# each tile it's in), appended to the state's GeoJSON as they come, with the
+# statistics added up as they go. Then record the state in the manifest and
+# clear its tiles away, as nrel_state would have left things.
+@instrument.traced_state
+def assemble_state(us_state, manifest, inputs, dirs, cells):
+    tile_dir = plan.tile_dir(dirs['out'], us_state)
+    tile_files = sorted(glob.glob('{}/augmented/*.parquet'.format(tile_dir)))
+    writer = GeoJSONBatchWriter(storage.artifact_path(plan.augmented_stem(dirs['out'], us_state), 'geojson'))
+    state_stats = sketch.FeatureStatistics(plan.statistics_columns, plan.statistics_compression)
+    print("Writing augmented nrel_wind_data GeoJSON file for {} from {} tiles ".format(us_state, len(tile_files)),
+          time.strftime('%X %x %Z'))
+    for start in range(0, cells, plan.assemble_batch_size):
+        rows = [('source_row', '>=', start), ('source_row', '<', start + plan.assemble_batch_size)]
+        with span('read_tiles', us_state) as stage:
+            nrel_augmented_out = pd.concat([read_geoparquet(path, rows) for path in tile_files])
+            nrel_augmented_out = schema.compact(nrel_augmented_out.sort_values('source_row', ignore_index=True)
+                                                                  .drop(columns='source_row'),
+                                                schema.cell_features)
+            stage.rows = nrel_augmented_out.shape[0]
+        with span('write', us_state, rows=nrel_augmented_out.shape[0]):
+            writer.write(nrel_augmented_out)
+        state_stats.merge(stages.cell_statistics(nrel_augmented_out, us_state, plan.statistics_columns,
+                                                 plan.statistics_compression))
+    output_file = writer.close()
+    shutil.rmtree(tile_dir, ignore_errors=True)
+
+    state_stats = state_stats.to_dict()
+    if output_file is not None:
+        manifest.record(us_state, inputs, [output_file], result=state_stats)
+    return state_stats
+
+
+# The nrel stage's jobs (as run_nrel makes them for nrel_state), a tile at a
+# time: split every state, then the tiles of all of them, biggest first
+# when there are workers to share them between, then put each state back
+# together. A state without any cells has no tiles, and is built as it is.
+# A state whose split or any of whose tiles fails isn't put back together;
+# the other states are, and the failures are raised at the end.
+def run_tiles(dirs, args, jobs):
+    memory_budget = memory_budget_bytes(args.memory_budget)
+    batch_estimate = plan.assemble_batch_size * plan.tile_bytes_per_cell
+    failures = {}
+    splits = run_states(split_state_tiles,
+                        [(job[0], batch_estimate, (job[0], job[2][3], args.tile_size)) for job in jobs],
+                        workers=args.workers, memory_budget=memory_budget, failures=failures)
+
+    tile_jobs = []
+    for us_state, split in splits.items():
+        for tile, cells in sorted(split['tiles'].items()):
+            tile_name = '{}_{}'.format(us_state, tile)
+            tile_jobs.append((tile_name, cells * plan.tile_bytes_per_cell,
+                              (tile_name, us_state, tile, dirs, args.distance, split['bounds'])))
+    print("{} states split into {} tiles; the biggest has {} cells".format(
+          len(splits), len(tile_jobs), max([job[1] for job in tile_jobs] or [0]) // plan.tile_bytes_per_cell))
+    tile_failures = {}
+    run_states(nrel_tile, tile_jobs, workers=args.workers, memory_budget=memory_budget, failures=tile_failures)
+    for tile_name, e in tile_failures.items():
+        failures.setdefault(tile_name.split('_')[0], e)
+
+    state_stats = run_states(nrel_state, [job for job in jobs if job[0] in splits and not splits[job[0]]['tiles']],
+                             workers=args.workers, memory_budget=memory_budget, failures=failures)
+    state_stats.update(run_states(assemble_state,
+                                  [(us_state, batch_estimate, (us_state, manifest, inputs, dirs,
+                                                               sum(splits[us_state]['tiles'].values())))
+                                   for us_state, estimate, (_, manifest, inputs, _, _) in jobs
+                                   if us_state in splits and splits[us_state]['tiles'] and us_state not in failures],
+                                  workers=args.workers, memory_budget=memory_budget, failures=failures))
+    if failures:
+        raise StateFailures(failures, state_stats)
+    try:
+        os.rmdir('{}/nrel_tiles'.format(dirs['out']))
+    except OSError:
+        pass
+    return state_stats
+
+
+# Add the remaining features we will need for the supervised learning model
+# to every state's NREL cells (the dataset without exclusions).
+def run_nrel(dirs, args):
+    manifest = plan.nrel_manifest(dirs, args.force, args.distance)
+
+    jobs = []
+    state_stats = {}
+    for us_state, input_files, inputs, output_file, current in plan.nrel_jobs(dirs, manifest):
+# States left out with --state keep the statistics they were last built with.
+        if not plan.wanted(us_state, args.state):
+            if manifest.result(us_state) is not None:
+                state_stats[us_state] = manifest.result(us_state)
+            continue
+# Skip states that were already built from these exact inputs.
+        if current:
+            print("{} is up to date; skipping it".format(us_state))
+            state_stats[us_state] = manifest.result(us_state)
+            continue
+        jobs.append((us_state, estimate_memory(input_files), (us_state, manifest, inputs, dirs, args.distance)))
+
+    if args.partition == 'tiles':
+        state_stats.update(run_tiles(dirs, args, jobs))
+    else:
+        state_stats.update(run_states(nrel_state, jobs,
+                                      workers=args.workers,
+                                      memory_budget=memory_budget_bytes(args.memory_budget)))
+
+# Some summary statistics will be generated for each state, and compiled in a single dataframe.
+# This way, we won't have to open 48 files later to obtain these stats to compare.
+# Merge in state order, so the columns come out the same however many workers we used.
+# Each state's sketches are added into the national ones as they go, and the
+# national figures go in after the states', as <feature>_national.
+    national_columns = {}
+    national_stats = sketch.FeatureStatistics(plan.statistics_columns, plan.statistics_compression)
+    for us_state in sorted(state_stats):
+        try:
+            us_state_stats = sketch.FeatureStatistics.from_dict(state_stats[us_state])
+        except ValueError:
+            print("The statistics recorded for {} can't be merged; rebuild it with --force {} to include it".format(us_state,us_state))
+            continue
+        national_columns.update(us_state_stats.describe(us_state))
+        national_stats.merge(us_state_stats)
+    national_columns.update(national_stats.describe('national'))
+    national_df = pd.DataFrame(national_columns,
+                               index=pd.Index(['count','unique','top','freq','mean','std','min','25%','50%','75%','max'],
+                                              name='index'))
+
+    print("Writing augmented national stats file",time.strftime('%X %x %Z'))
+    national_df.reset_index(level=0).to_csv('{}/national_level_statistics.csv'.format(dirs['out']),index=False)
+
+
+# Score one state's augmented cells with the model and write each cell's
+# siting probability. The cells are read, scored and written a batch at a
+# time (only the columns the model and the output need, never the
+# geometries), so a worker only ever holds one batch: its memory depends on
+# --batch-size and the model, not on how many cells the state has.
+# This runs in a worker process when --workers > 1.
+@instrument.traced_state
+def score_state(us_state, model_file, manifest, inputs, input_file, output_file, batch_size):
+    bundle = scoring.load_model(model_file)
+    print("Scoring cells for {} ".format(us_state),time.strftime('%X %x %Z'))
+    columns = scoring.feature_columns(bundle['features']) + scoring.score_id_columns
+    writer = ParquetBatchWriter(output_file)
+    scored = 0
+    for cells in instrument.timed_iter(iter_column_batches(input_file, columns, batch_size), 'read_batch', us_state):
+        with span('score', us_state, rows=cells.shape[0]):
+            scores = schema.compact(scoring.score_cells(cells, bundle), schema.cell_scores)
+        with span('write', us_state, rows=scores.shape[0]):
+            writer.write(scores)
+        scored += int(scores['siting_probability'].notna().sum())
+# A state with no cells still gets a file, with the columns it would have had.
+    if writer.rows == 0:
+        writer.write(schema.compact(scoring.score_cells(pd.DataFrame(columns=columns), bundle), schema.cell_scores))
+    writer.close()
+    result = {'cells': writer.rows, 'scored': scored}
+    manifest.record(us_state, inputs, [output_file], result=result)
+    return result
+
+
+# Score every state's augmented NREL cells with a fitted model (--model, from
+# python3 -m wind_siting fit) and write cell_scores_<state>.parquet. States
+# are shared out between --workers, each reserving the model plus a batch
+# against --memory-budget, so the whole country never has to be in memory.
+def run_score(dirs, args):
+    if args.model is None:
+        raise SystemExit("The score stage needs a fitted model: --model FILE (see python3 -m wind_siting fit --help)")
+    model_file = os.path.abspath(args.model)
+    manifest = plan.score_manifest(dirs, args.force)
+    os.makedirs(os.path.dirname(plan.score_state_stem(dirs['out'], 'XX')), exist_ok=True)
+    estimate = 2 * os.path.getsize(model_file) + args.batch_size * plan.score_bytes_per_cell
+
+    jobs = []
+    for us_state, input_files, inputs, output_file, current in plan.score_jobs(dirs, manifest, model_file, args.state):
+# Skip states that were already scored from these exact cells with this exact model.
+        if current:
+            print("{} is up to date; skipping it".format(us_state))
+            continue
+        jobs.append((us_state, estimate, (us_state, model_file, manifest, inputs, input_files[0], output_file, args.batch_size)))
+
+    start = time.perf_counter()
+    results = run_states(score_state, jobs,
+                         workers=args.workers,
+                         memory_budget=memory_budget_bytes(args.memory_budget))
+    elapsed = time.perf_counter() - start
+    cells = sum(result['cells'] for result in results.values())
+    scored = sum(result['scored'] for result in results.values())
+    print("Scored {} cells in {} states in {:.1f} s ({:.0f} cells/s); {} were missing a feature".format(
+          cells, len(results), elapsed, cells / elapsed if elapsed else 0, cells - scored))
+
+
+# Fit one of the notebook's classifiers (--estimator) to the augmented cells
+# of the states given (default: all of them; --sample takes that many cells
+# from each) and save it where the score stage can use it. Only the
+# feature and target columns are read.
+def run_fit(dirs, args):
+    frames = []
+    for us_state in plan.augmented_states(dirs):
+        if not plan.wanted(us_state, args.state):
+            continue
+        print("Reading training cells for ",us_state,time.strftime('%X %x %Z'))
+        with span('read_training', us_state) as stage:
+            cells = pd.concat(iter_column_batches(storage.existing_path(plan.augmented_stem(dirs['in'], us_state)),
+                                                  scoring.feature_columns(scoring.features) +
+                                                  ['turbine_count','wind_class_excl'],
+                                                  plan.score_batch_size),
+                              ignore_index=True)
+            if args.sample is not None and cells.shape[0] > args.sample:
+                cells = cells.sample(args.sample, random_state=args.random_state)
+            stage.rows = cells.shape[0]
+        frames.append(cells)
+    if not frames:
+        raise SystemExit("No augmented cells to fit to in {}".format(dirs['in']))
+    cells = pd.concat(frames, ignore_index=True)
+    print("Fitting {} to {} cells ".format(args.estimator, cells.shape[0]),time.strftime('%X %x %Z'))
+    with span('fit', rows=cells.shape[0]):
+        bundle = scoring.fit_model(cells, args.estimator, args.random_state)
+    scoring.save_model(bundle, args.model_file)
+    print("Saved {} ({} cells, {} left out for a missing feature) to {}".format(
+          args.estimator, bundle['training_cells'], cells.shape[0] - bundle['training_cells'], args.model_file))
+
+
+runners = {'centroid': run_centroid,
+           'power': run_power,
+           'turbines': run_turbines,
+           'nrel': run_nrel,
+           'score': run_score}
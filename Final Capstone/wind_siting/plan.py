@@ -0,0 +1,264 @@
+import os
+import json
+import fnmatch
+
+from wind_siting import storage
+from wind_siting.manifest import Manifest
+
+# What each stage reads and writes, and which states are already up to date.
+# Nothing in here needs geopandas, so --dry-run (and the check at the start
+# of a real run) answers straight away; only the states that need
+# rebuilding ever pay for the heavy imports.
+
+# The raw inputs, relative to the centroid stage's input directory.
+nrel_sources = {'w': 'ref-wind-with-exclusions/ref_wind',
+                'no': 'ref-wind-no-excl/ref_wind_no_excl'}
+borders_source = 'tl_2017_us_state/tl_2017_us_state'
+
+# The number of records we will process at one time:
+nrel_chunk_size = 1000
+power_chunk_size = 1000
+
+# The line_count feature counts the power lines within this many degrees of
+# each turbine, and of each cell's centroid. Extra radii add a
+# line_count_<radius> column each.
+line_count_radius = 1
+extra_line_count_radii = []
+
+# Turbines that touch no NREL cell with exclusions get this wind_class.
+default_wind_class = 2
+
+# What dist_to_nearest_line and line_count are measured in (--distance):
+# degrees of long/lat, as the model was built with, or metres on the ground.
+distance_modes = ['degrees', 'metres']
+default_distance = 'degrees'
+
+# The features national_level_statistics.csv describes, for each state and
+# for the country as a whole (see wind_siting.sketch), and how many
+# centroids the quantiles are kept in (about half this many).
+statistics_columns = ['line_count','dist_to_nearest_line','VOLTAGE','SHAPE__Len','cap_factor','turbine_count'] + \
+                     ['line_count_{}'.format(radius) for radius in extra_line_count_radii]
+statistics_compression = 400
+
+# The score stage reads and scores this many cells at a time, so what a
+# worker holds depends on this (and the model), not on the size of its state.
+# A batch takes roughly score_bytes_per_cell per cell at its peak (the
+# columns as read, the feature matrix, the model's working arrays).
+score_batch_size = 50000
+score_bytes_per_cell = 2048
+
+# The classifiers the fit command can fit (see wind_siting.scoring).
+estimators = ['rfc', 'svc', 'sgdc']
+
+# How the nrel stage shares out its work (--partition): a job per state, or
+# (tiles) a job per tile_size x tile_size degree square of each state's
+# cells, by centroid, so TX is a few dozen jobs the size of RI rather than
+# one that runs long after everything else has finished. A tile only reads
+# the lines within tile_halo degrees of its cells, which is every line the
+# line_count radii reach. A tile's worker holds about tile_bytes_per_cell
+# per cell at its peak; putting a state back together takes
+# assemble_batch_size cells at a time, out of tiles written in row groups
+# of tile_row_group_size cells, so a batch only reads the row groups it's in.
+partition_modes = ['states', 'tiles']
+default_partition = 'states'
+tile_size = 2.0
+tile_halo = max([line_count_radius] + extra_line_count_radii)
+tile_bytes_per_cell = 4096
+assemble_batch_size = 50000
+tile_row_group_size = 10000
+
+# Each stage's version, recorded in its manifests. Bump a stage's number when
+# a change to its code changes what it writes (including a change to a module
+# it shares with other stages, like nearest or schema, which bumps each of
+# them), so the states it built before get rebuilt. A change that doesn't,
+# to the CLI, the instrumentation or another stage, leaves them alone.
+# --force all rebuilds regardless.
+stage_versions = {'centroid': 1, 'power': 1, 'turbines': 1, 'nrel': 1, 'score': 1}
+
+# Anything that changes the output for a state without changing its input files
+# goes here, so the manifest knows to rebuild those states.
+centroid_params = {'nrel_chunk_size': nrel_chunk_size}
+power_params = {'power_chunk_size': power_chunk_size}
+turbines_params = {'line_count_radius': line_count_radius,
+                   'extra_line_count_radii': extra_line_count_radii, 'default_wind_class': default_wind_class}
+nrel_params = {'line_count_radius': line_count_radius,
+               'extra_line_count_radii': extra_line_count_radii,
+               'statistics_columns': statistics_columns,
+               'statistics_compression': statistics_compression}
+
+
+def version(stage):
+    return stage_versions[stage]
+
+
+def nrel_source(in_dir, qualifier):
+    if qualifier not in nrel_sources:
+        raise ValueError("{} is not a valid value for qualifier".format(qualifier))
+    return os.path.join(in_dir, nrel_sources[qualifier])
+
+
+def nrel_state_stem(root, qualifier, state):
+    return "{}/nrel_{}_exclusions_by_state/nrel_{}_exclusions_{}".format(root, qualifier, qualifier, state)
+
+
+def power_source(root):
+    return "{}/Electric_Power_Transmission_Lines/Electric_Power_Transmission_Lines".format(root)
+
+
+def power_state_stem(root, state):
+    return "{}/power_by_state/power_{}".format(root, state)
+
+
+def turbine_state_stem(root, state):
+    return "{}/turbines_by_state/turbines_{}".format(root, state)
+
+
+def augmented_stem(root, state):
+    return "{}/nrel_augmented_by_state/nrel_augmented_{}".format(root, state)
+
+
+def score_state_stem(root, state):
+    return "{}/cell_scores_by_state/cell_scores_{}".format(root, state)
+
+
+# Where --partition tiles keeps a state's tiles while it's being built:
+# cells/<tile>/part-*.parquet going in, augmented/<tile>.parquet coming out.
+def tile_dir(root, state):
+    return "{}/nrel_tiles/{}".format(root, state)
+
+
+def wanted(state, states):
+    return not states or state in states
+
+
+# Every state comes out of the same national file, so if every state we
+# wrote last time is still current there is nothing to do for this file.
+def all_current(manifest, input_files):
+    done_states = manifest.states()
+    return len(done_states) > 0 and all(manifest.is_current(state, manifest.input_digests(state, input_files),
+                                                            manifest.entry(state)['outputs'])
+                                        for state in done_states)
+
+
+# centroid: one national NREL file per qualifier, split by state.
+def centroid_manifest(dirs, qualifier, force=()):
+    return Manifest("{}/nrel_{}_exclusions_by_state".format(dirs['out'], qualifier), version('centroid'), centroid_params, force)
+
+
+def centroid_input_files(dirs, qualifier):
+    nrel_file = nrel_source(dirs['in'], qualifier)
+    borders_file = os.path.join(dirs['in'], borders_source)
+    return [nrel_file + '.shp', nrel_file + '.dbf', borders_file + '.shp', borders_file + '.dbf']
+
+
+# power: adding state to the power lines only depends on the lines and the
+# borders, and which format they're written in, since the national file and
+# each state's are recorded as its outputs.
+def power_manifest(dirs, force=(), fmt=storage.default_format):
+    return Manifest('{}/power_by_state'.format(dirs['out']), version('power'), dict(power_params, format=fmt), force)
+
+
+def power_input_files(dirs):
+    return [power_source(dirs['in']) + '.shp', power_source(dirs['in']) + '.dbf',
+            '{}/lower48_borders.geojson'.format(dirs['in'])]
+
+
+# {state: [its neighbors]} for the lower 48, straight from the GeoJSON's
+# properties, without parsing the borders themselves.
+def border_states(borders_path):
+    with open(borders_path) as f:
+        features = json.load(f)['features']
+    return {feature['properties']['STUSPS']: (feature['properties'].get('neighbors') or '').split(',')
+            for feature in features}
+
+
+def turbines_manifest(dirs, force=(), distance=default_distance):
+    return Manifest('{}/turbines_by_state'.format(dirs['out']), version('turbines'), dict(turbines_params, distance=distance), force)
+
+
+# One job per state: (state, power line states, input files, inputs, output
+# file, current). If there are no power lines for a given state, its
+# neighbors' power lines are used instead.
+def turbine_jobs(dirs, manifest, fmt, states=None):
+    jobs = []
+    for us_state, neighbors in sorted(border_states('{}/lower48_borders.geojson'.format(dirs['in'])).items()):
+        if not wanted(us_state, states):
+            continue
+        power_line_states = [us_state]
+        if not storage.exists(power_state_stem(dirs['in'], us_state)):
+            power_line_states = neighbors
+        input_files = ['{}/existing_turbines.geojson'.format(dirs['in']),
+                       storage.existing_path(nrel_state_stem(dirs['in'], 'w', us_state))] + \
+                      [storage.existing_path(power_state_stem(dirs['in'], state)) for state in power_line_states]
+        output_file = storage.artifact_path(turbine_state_stem(dirs['out'], us_state), fmt)
+        inputs = manifest.input_digests(us_state, input_files)
+        jobs.append((us_state, power_line_states, input_files, inputs, output_file,
+                     manifest.is_current(us_state, inputs, [output_file])))
+    return jobs
+
+
+def nrel_manifest(dirs, force=(), distance=default_distance):
+    return Manifest('{}/nrel_augmented_by_state'.format(dirs['out']), version('nrel'), dict(nrel_params, distance=distance), force)
+
+
+# The states there are NREL files for. Skip files that don't have a
+# two-letter abbreviation for state. Unfortunately, this includes a lot of
+# great offshore locations... but we don't have any power line data,
+# calculating it would be a pain, and only a turbine or two may be out
+# there anyway.
+def nrel_states(dirs):
+    us_states = set()
+    for filename in os.listdir('{}/nrel_no_exclusions_by_state/'.format(dirs['in'])):
+        stem, fmt = storage.split_format(filename)
+        if (stem is None) or not (fnmatch.fnmatch(stem, 'nrel_no_exclusions_??')):
+            print("Found and skipping a stray file: ",filename)
+            continue
+        us_states.add(stem.split('_')[3])
+    return sorted(us_states)
+
+
+# One job per state: (state, input files, inputs, output file, current).
+def nrel_jobs(dirs, manifest, states=None):
+    jobs = []
+    for us_state in nrel_states(dirs):
+        if not wanted(us_state, states):
+            continue
+        input_files = [storage.existing_path(nrel_state_stem(dirs['in'], 'no', us_state)),
+                       storage.existing_path(nrel_state_stem(dirs['in'], 'w', us_state)),
+                       storage.existing_path(power_state_stem(dirs['features_in'], us_state)),
+                       storage.existing_path(turbine_state_stem(dirs['features_in'], us_state))]
+        output_file = storage.artifact_path(augmented_stem(dirs['out'], us_state), 'geojson')
+        inputs = manifest.input_digests(us_state, input_files)
+        jobs.append((us_state, input_files, inputs, output_file,
+                     manifest.is_current(us_state, inputs, [output_file])))
+    return jobs
+
+
+# score: the model is one of each state's inputs, so fitting a new one
+# rescores every state.
+def score_manifest(dirs, force=()):
+    return Manifest('{}/cell_scores_by_state'.format(dirs['out']), version('score'), {}, force)
+
+
+# The states the nrel stage has written augmented cells for.
+def augmented_states(dirs):
+    us_states = set()
+    for filename in os.listdir('{}/nrel_augmented_by_state/'.format(dirs['in'])):
+        stem, fmt = storage.split_format(filename)
+        if (stem is not None) and fnmatch.fnmatch(stem, 'nrel_augmented_??'):
+            us_states.add(stem.split('_')[2])
+    return sorted(us_states)
+
+
+# One job per state: (state, input files, inputs, output file, current).
+def score_jobs(dirs, manifest, model_file, states=None):
+    jobs = []
+    for us_state in augmented_states(dirs):
+        if not wanted(us_state, states):
+            continue
+        input_files = [storage.existing_path(augmented_stem(dirs['in'], us_state)), model_file]
+        output_file = storage.artifact_path(score_state_stem(dirs['out'], us_state), 'parquet')
+        inputs = manifest.input_digests(us_state, input_files)
+        jobs.append((us_state, input_files, inputs, output_file,
+                     manifest.is_current(us_state, inputs, [output_file])))
+    return jobs
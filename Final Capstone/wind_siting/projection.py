@@ -0,0 +1,114 @@
+import json
+import functools
+import numpy as np
+import geopandas as gpd
+from geopandas.array import GeometryArray
+import pyproj
+import shapely
+
+# Reprojection for the pipeline, with the CRS and transformer objects built
+# once per process and reused. geopandas' .to_crs() parses the CRS and builds
+# a new transformer on every call, which adds up when it's called for every
+# chunk of a national file and again for every state.
+#
+# It also has what the 'metres' distance mode needs: an equidistant conic
+# fitted to each state, for finding the nearest line and the lines within
+# a radius in metres, and geodesic distances on the WGS84 ellipsoid for the
+# distances themselves.
+
+# One degree of arc on the mean Earth sphere (~69 miles/111 km), for
+# turning the line_count radii, which are in degrees, into metres.
+metres_per_degree = 6371008.8 * np.pi / 180
+
+geod = pyproj.Geod(ellps='WGS84')
+
+
+@functools.lru_cache(maxsize=None)
+def cached_crs(user_input):
+    if user_input.startswith('{'):
+        user_input = json.loads(user_input)
+    return pyproj.CRS.from_user_input(user_input)
+
+
+# Anything .to_crs() takes: a pyproj CRS, a string, or an old {'init': ...} dict.
+def as_crs(crs):
+    if crs is None or isinstance(crs, pyproj.CRS):
+        return crs
+    if isinstance(crs, dict):
+        return cached_crs(json.dumps(crs, sort_keys=True))
+    return cached_crs(str(crs))
+
+
+@functools.lru_cache(maxsize=None)
+def transformer(src, dst):
+    return pyproj.Transformer.from_crs(src, dst, always_xy=True)
+
+
+# Points (turbines, cell centroids) are built straight from the transformed
+# coordinates, which is several times quicker than shapely.transform copying
+# each geometry and setting its coordinates.
+def transform_geometries(geoms, src, dst):
+    src, dst = as_crs(src), as_crs(dst)
+    if src == dst:
+        return geoms
+    geoms = np.asarray(geoms)
+    if len(geoms) > 0 and (shapely.get_type_id(geoms) == shapely.GeometryType.POINT).all():
+        coords = shapely.get_coordinates(geoms)
+        if len(coords) == len(geoms):
+            return shapely.points(*transformer(src, dst).transform(coords[:, 0], coords[:, 1]))
+    return shapely.transform(geoms, transformer(src, dst).transform, interleaved=False)
+
+
+# A GeoDataFrame or GeoSeries in crs, or the same object if it's already in it.
+def to_crs(frame, crs):
+    crs = as_crs(crs)
+    if frame.crs == crs:
+        return frame
+    geoms = GeometryArray(transform_geometries(frame.geometry.values, frame.crs, crs), crs=crs)
+    if isinstance(frame, gpd.GeoSeries):
+        return gpd.GeoSeries(geoms, index=frame.index, name=frame.name)
+    return frame.set_geometry(geoms)
+
+
+def lonlat_bounds(frame):
+    bounds = frame.total_bounds
+    if frame.crs is None or as_crs(frame.crs).is_geographic:
+        return bounds
+    return transformer(as_crs(frame.crs), as_crs('epsg:4326')).transform_bounds(*bounds)
+
+
+# An equidistant conic fitted to (min long, min lat, max long, max lat), in
+# metres. With the standard parallels a sixth of the way in from the top and
+# bottom, the scale error is a small fraction of a percent across a state
+# (and the neighbors it borrows lines from). The bounds are rounded, so
+# nearby calls share one CRS and its transformers.
+def distance_crs(bounds):
+    min_x, min_y, max_x, max_y = [round(value * 2) / 2 for value in bounds]
+    return cached_crs('+proj=eqdc +lat_0={} +lon_0={} +lat_1={} +lat_2={} +datum=WGS84 +units=m +no_defs'.format(
+                      (min_y + max_y) / 2, (min_x + max_x) / 2,
+                      min_y + (max_y - min_y) / 6, max_y - (max_y - min_y) / 6))
+
+
+# Geodesic distance in metres between two arrays of points, given in crs.
+def geodesic_distance(points, others, crs):
+    to_lonlat = transformer(as_crs(crs), as_crs('epsg:4326'))
+    lon1, lat1 = to_lonlat.transform(shapely.get_x(points), shapely.get_y(points))
+    lon2, lat2 = to_lonlat.transform(shapely.get_x(others), shapely.get_y(others))
+    return geod.inv(lon1, lat1, lon2, lat2)[2]
+
+
+# The lines and the points in the CRS the distance features are measured
+# in: as they are for 'degrees', or both in one conic fitted to the points
+# for 'metres' (or to bounds, in long/lat, e.g. a whole state's when these
+# are only some of its points). Each is reprojected once, however many
+# queries follow.
+def distance_frames(power_lines, points, distance='degrees', bounds=None):
+    if distance != 'metres':
+        return power_lines, points
+    crs = distance_crs(lonlat_bounds(points) if bounds is None else bounds)
+# Points in another datum (the turbines are NAD83) go via the lines' CRS:
+# finding a datum shift to each state's conic takes far longer than the
+# transform itself, and this way it's only found once.
+    if power_lines.crs is not None and as_crs(power_lines.crs).is_geographic:
+        points = to_crs(points, power_lines.crs)
+    return to_crs(power_lines, crs), to_crs(points, crs)
@@ -0,0 +1,110 @@
+import fnmatch
+
+# The dtypes each of the pipeline's frames is kept in. Left to themselves,
+# pandas and the readers give us a Python string object per row for every
+# text column (state, TYPE, VOLT_CLASS, STATUS, ...), and float64 for every
+# count and class, because a single NaN is enough to turn an int column into
+# floats. A per-state NREL frame with a million cells carries a lot of that.
+#
+# wind_siting.pipeline puts every frame in these dtypes as soon as it's
+# read, and each stage's output before it's written:
+#   'category'          a few distinct strings, stored once each plus a
+#                       small code per row
+#   'UInt8', 'UInt16'   classes and counts; nullable, so NaN stays NaN
+#   'float32'           measurements that don't need more than ~7
+#                       significant digits (capacity factors, voltages,
+#                       line lengths and distances)
+# Coordinates (centroid_lat/long, xlong/ylat) stay float64: the geometry
+# work is done with them, and float32 would move a point by up to a metre.
+# A column whose values don't fit its dtype (e.g. a count over 65535) is
+# left as it is, with a message, rather than being silently truncated.
+# Keys can be patterns, like 'line_count*' for line_count_<radius>.
+
+# The NREL cells, as split by state (nrel_{w,no}_exclusions_<state>).
+nrel_cells = {'id': 'Int32',
+              'wind_class': 'UInt8',
+              'cap_factor': 'float32',
+              'state': 'category',
+              'centroid_lat': 'float64',
+              'centroid_long': 'float64'}
+
+# The HIFLD transmission lines (power_out_df, power_<state>).
+power_lines = {'OBJECTID': 'Int32',
+               'TYPE': 'category',
+               'STATUS': 'category',
+               'VOLTAGE': 'float32',
+               'VOLT_CLASS': 'category',
+               'SHAPE__Len': 'float32',
+               'state': 'category'}
+
+# The USWTDB turbines (existing_turbines.geojson).
+turbines = {'case_id': 'Int32',
+            't_state': 'category',
+            't_county': 'category',
+            'p_name': 'category',
+            'p_year': 'UInt16',
+            'p_tnum': 'UInt16',
+            'p_cap': 'float32',
+            't_manu': 'category',
+            't_model': 'category',
+            't_cap': 'float32',
+            't_hh': 'float32',
+            't_rd': 'float32',
+            't_rsa': 'float32',
+            't_ttlh': 'float32',
+            't_conf_atr': 'UInt8',
+            't_conf_loc': 'UInt8',
+            't_img_srce': 'category',
+            'xlong': 'float64',
+            'ylat': 'float64'}
+
+# What the nearest line and line count features add to a turbine or a cell.
+line_features = {'OBJECTID': 'Int32',
+                 'TYPE': 'category',
+                 'VOLTAGE': 'float32',
+                 'VOLT_CLASS': 'category',
+                 'SHAPE__Len': 'float32',
+                 'dist_to_nearest_line': 'float32',
+                 'line_count*': 'UInt32'}
+
+turbine_features = dict(turbines, wind_class='UInt8', **line_features)
+
+cell_features = dict(nrel_cells, turbine_count='UInt16', wind_class_turbine='UInt8', wind_class_excl='UInt8',
+                     **line_features)
+
+# What the score stage writes for each cell (wind_siting.scoring).
+cell_scores = {'id': 'Int32',
+               'state': 'category',
+               'centroid_lat': 'float64',
+               'centroid_long': 'float64',
+               'siting_probability': 'float32'}
+
+
+def dtype_for(column, schema):
+    if column in schema:
+        return schema[column]
+    for pattern, dtype in schema.items():
+        if fnmatch.fnmatchcase(column, pattern):
+            return dtype
+    return None
+
+
+# A shallow copy of frame with its columns in schema's dtypes. Columns the
+# schema doesn't mention, or that the frame doesn't have, are left alone.
+def compact(frame, schema):
+    frame = frame.copy(deep=False)
+    for column in frame.columns:
+        dtype = dtype_for(column, schema)
+        if dtype is None or str(frame[column].dtype) == dtype:
+            continue
+        try:
+            frame[column] = frame[column].astype(dtype)
+        except (TypeError, ValueError, OverflowError) as e:
+            print("Keeping {} as {}: it doesn't fit in {} ({})".format(column, frame[column].dtype, dtype, e))
+    return frame
+
+
+# Bytes per row of each column, as pandas counts them (strings included,
+# but not the GEOS geometries behind the geometry column's pointers).
+def bytes_per_row(frame):
+    return frame.memory_usage(index=False, deep=True) / max(frame.shape[0], 1)
@@ -0,0 +1,131 @@
+import os
+import numpy as np
+import pandas as pd
+
+from wind_siting import plan
+
+# Scoring NREL cells with the supervised learning notebook's classifiers.
+#
+# A fitted model is saved as a bundle (joblib, as scikit-learn recommends):
+# the estimator, the features it was fitted on, in order, and the
+# VOLT_CLASS values behind volt_class_encoded. The notebook fitted a
+# LabelEncoder on one state's VOLT_CLASS at a time, so the codes depended on
+# which classes that state happened to have; the bundle keeps them, so
+# every state is encoded the way the model saw it.
+#
+# A cell that's missing one of the features (no power lines in the state,
+# or a voltage class the model never saw) can't be scored, and gets a
+# siting_probability of NaN rather than a made-up one.
+#
+# scikit-learn (and joblib, which comes with it) are only imported by the
+# functions that need them, so the rest of the pipeline runs without them.
+model_version = 1
+
+# The notebook's train_columns, without the geometry.
+features = ['SHAPE__Len','VOLTAGE','volt_class_encoded','dist_to_nearest_line','line_count','wind_class']
+
+# What identifies each scored cell in the output, next to its probability.
+score_id_columns = ['id','state','centroid_lat','centroid_long']
+
+
+# Where a cell could go: it already has turbines, or its wind class with
+# exclusions applied is at least 3.
+def target(cells):
+    return np.where((cells['turbine_count'] > 0) | (cells['wind_class_excl'] >= 3), 1, 0)
+
+
+# The classifiers the notebook compares, as it set them up, except that SVC
+# and SGDClassifier are made to give probabilities: SVC with
+# probability=True (Platt scaling, fitted with an internal cross
+# validation), SGDClassifier with the logistic loss.
+def make_estimator(name, random_state=None):
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.linear_model import SGDClassifier
+    from sklearn.svm import SVC
+    if name == 'rfc':
+        return RandomForestClassifier(n_estimators=500, criterion='entropy', random_state=random_state)
+    if name == 'svc':
+        return SVC(class_weight={0:8,1:1}, probability=True, random_state=random_state)
+    if name == 'sgdc':
+        return SGDClassifier(class_weight={0:3,1:1}, loss='log_loss', random_state=random_state)
+    raise ValueError("{} is not one of: {}".format(name, ', '.join(plan.estimators)))
+
+
+# The augmented columns these features are made from.
+def feature_columns(features):
+    return [column if column != 'volt_class_encoded' else 'VOLT_CLASS' for column in features]
+
+
+# The features of these cells, as a float64 frame in the bundle's column
+# order, with NaN wherever a feature is missing.
+def feature_matrix(cells, bundle):
+    matrix = {}
+    for column in bundle['features']:
+        if column == 'volt_class_encoded':
+            codes = pd.Categorical(cells['VOLT_CLASS'], categories=bundle['volt_classes']).codes
+            matrix[column] = np.where(codes >= 0, codes, np.nan)
+        else:
+            matrix[column] = pd.to_numeric(cells[column]).to_numpy(dtype=float, na_value=np.nan)
+    return pd.DataFrame(matrix, index=cells.index)
+
+
+# Fit name ('rfc', 'svc' or 'sgdc') to these augmented cells (one state or
+# several, concatenated) and return the bundle. Cells missing a feature are
+# left out.
+def fit_model(cells, name, random_state=None):
+    volt_classes = sorted(cells['VOLT_CLASS'].dropna().astype(str).unique())
+    bundle = {'version': model_version,
+              'estimator': name,
+              'features': list(features),
+              'volt_classes': volt_classes}
+    X = feature_matrix(cells, bundle)
+    usable = X.notna().all(axis=1).to_numpy()
+    model = make_estimator(name, random_state)
+    model.fit(X.loc[usable], target(cells)[usable])
+    bundle['model'] = model
+    bundle['training_cells'] = int(usable.sum())
+    return bundle
+
+
+def save_model(bundle, path):
+    import joblib
+    tmp_path = path + '.tmp'
+    joblib.dump(bundle, tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+# One bundle per process and file, reloaded if the file has been replaced
+# since. Each worker scores its states one batch at a time and on its own,
+# so the model isn't allowed its own pool of threads or processes.
+loaded_models = {}
+
+
+def load_model(path):
+    stamp = os.stat(path).st_mtime_ns
+    if path not in loaded_models or loaded_models[path][0] != stamp:
+        import joblib
+        bundle = joblib.load(path)
+        if not isinstance(bundle, dict) or bundle.get('version') != model_version:
+            raise ValueError("{} isn't a version {} wind_siting model; refit it with python3 -m wind_siting fit".format(path, model_version))
+        if not hasattr(bundle['model'], 'predict_proba'):
+            raise ValueError("{}'s {} can't give probabilities".format(path, type(bundle['model']).__name__))
+        if hasattr(bundle['model'], 'n_jobs'):
+            bundle['model'].n_jobs = 1
+        loaded_models[path] = (stamp, bundle)
+    return loaded_models[path][1]
+
+
+# One batch of augmented cells: their id, state and centroid, and the
+# probability the model gives them of being a candidate site.
+def score_cells(cells, bundle):
+    X = feature_matrix(cells, bundle)
+    usable = X.notna().all(axis=1).to_numpy()
+    probability = np.full(cells.shape[0], np.nan, dtype=np.float32)
+    if usable.any():
+        model = bundle['model']
+        positive = list(model.classes_).index(1)
+        probability[usable] = model.predict_proba(X.loc[usable])[:, positive]
+    scores = pd.DataFrame({column: cells[column].to_numpy() for column in score_id_columns}, index=cells.index)
+    scores['siting_probability'] = probability
+    return scores
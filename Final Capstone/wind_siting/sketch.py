@@ -0,0 +1,247 @@
+import numpy as np
+
+# Summary statistics of a frame's columns that can be built up a chunk at a
+# time and added together afterwards: each state's cells as they come out of
+# the nrel stage, then every state into the national figures, whichever
+# worker made them and in whatever order they finish. Nothing needs the
+# values themselves once they've been added in.
+#
+#   count, mean, std, min, max   exact (the mean and the sum of squared
+#                                deviations are combined with Chan et al.'s
+#                                pairwise formulas, as describe() would get
+#                                them from all the values at once)
+#   25%, 50%, 75%, ...           from a t-digest: the sorted values kept as a
+#                                few hundred weighted centroids, smallest at
+#                                the ends of the distribution, so the
+#                                tails come out most accurately
+#
+# A digest keeps about compression / 2 centroids, however many values go
+# into it (plus one for each value that covers more than 1 / compression
+# of them). Everything round-trips through JSON, so the manifest can keep a
+# state's statistics for a rerun that skips the state.
+sketch_version = 1
+default_compression = 400
+
+# The rows describe() gives a numeric column.
+describe_quantiles = [0.25, 0.5, 0.75]
+
+
+# A t-digest. Each centroid covers at most one unit step of the scale
+# function
+#   k(q) = compression / (2 pi) * arcsin(2q - 1),
+# which is steep near q = 0 and q = 1 (single values in the tails) and flat
+# in the middle. A batch of values is sorted and squeezed into centroids in
+# one pass (each value joins the others in its unit step of k); then the
+# batch's centroids and the digest's own are merged, smallest first, into
+# as few as that limit allows, which only ever takes a few hundred steps.
+#
+# Columns like line_count and turbine_count are whole numbers, mostly the
+# same few. A run of equal values that's big enough to matter is kept as a
+# centroid of its own, marked single (all one value), which is too big to
+# take in anything but more of that same value; otherwise the centroid
+# where the values step from 0 to 1 would average the two, and the median
+# could come out as 0.99.
+class TDigest:
+
+    def __init__(self, compression=default_compression, means=(), weights=(), single=()):
+        self.compression = compression
+        self.means = np.asarray(means, dtype=float)
+        self.weights = np.asarray(weights, dtype=float)
+        self.single = np.asarray(single, dtype=bool)
+
+    def __len__(self):
+        return self.means.shape[0]
+
+    def total(self):
+        return self.weights.sum()
+
+    def scale(self, q):
+        return self.compression / (2 * np.pi) * np.arcsin(2 * np.clip(q, 0, 1) - 1)
+
+    def update(self, values):
+        values = np.sort(np.asarray(values, dtype=float))
+        if len(values) == 0:
+            return
+        run_starts = np.flatnonzero(np.concatenate([[True], values[1:] != values[:-1]]))
+        run_weights = np.diff(np.append(run_starts, len(values)))
+        run_values = values[run_starts]
+        q = (np.cumsum(run_weights) - run_weights / 2) / len(values)
+        step = np.floor(self.scale(q) + self.compression / 4).astype(np.int64)
+        big = run_weights * self.compression > len(values)
+        starts = np.flatnonzero(np.concatenate([[True], (step[1:] != step[:-1]) | big[1:] | big[:-1]]))
+        weights = np.add.reduceat(run_weights, starts).astype(float)
+        means = np.add.reduceat(run_values * run_weights, starts) / weights
+# A centroid of one value is that value exactly, not a sum divided back down.
+        single = np.diff(np.append(starts, len(run_values))) == 1
+        means[single] = run_values[starts[single]]
+        self.add(means, weights, single)
+
+    def merge(self, other):
+        self.add(other.means, other.weights, other.single)
+
+    def add(self, means, weights, single):
+        if len(means) == 0:
+            return
+        means = np.concatenate([self.means, means])
+        weights = np.concatenate([self.weights, weights])
+        single = np.concatenate([self.single, single])
+        order = np.argsort(means, kind='stable')
+        means, weights, single = means[order].tolist(), weights[order].tolist(), single[order].tolist()
+        total = sum(weights)
+
+        out_means, out_weights, out_single = [means[0]], [weights[0]], [single[0]]
+        done = 0.0
+        k_start = self.scale(0)
+        for mean, weight, one_value in zip(means[1:], weights[1:], single[1:]):
+            same_value = one_value and out_single[-1] and mean == out_means[-1]
+            if same_value or self.scale((done + out_weights[-1] + weight) / total) - k_start <= 1:
+                out_weights[-1] += weight
+                out_means[-1] += (mean - out_means[-1]) * weight / out_weights[-1]
+                out_single[-1] = same_value
+            else:
+                done += out_weights[-1]
+                k_start = self.scale(done / total)
+                out_means.append(mean)
+                out_weights.append(weight)
+                out_single.append(one_value)
+        self.means = np.array(out_means)
+        self.weights = np.array(out_weights)
+        self.single = np.array(out_single, dtype=bool)
+
+# The values at these quantiles (0 to 1), between low and high (the exact
+# minimum and maximum). A single-valued centroid is its value at every rank
+# it covers; any other stands for its values spread evenly around its mean.
+# In between, the answer is interpolated, so while every centroid is
+# single-valued, this is exactly np.quantile(values, qs) (describe()'s
+# linear interpolation).
+    def quantile(self, qs, low, high):
+        total = self.total()
+        if total == 0:
+            return np.full(np.shape(qs), np.nan)
+        first = np.cumsum(self.weights) - self.weights
+        middle = first + (self.weights - 1) / 2
+        positions = np.column_stack([np.where(self.single, first, middle),
+                                     np.where(self.single, first + self.weights - 1, middle)]).ravel()
+        values = np.repeat(self.means, 2)
+        if positions[0] > 0:
+            positions, values = np.append(0, positions), np.append(low, values)
+        if positions[-1] < total - 1:
+            positions, values = np.append(positions, total - 1), np.append(values, high)
+        return np.interp(np.asarray(qs) * (total - 1), positions, values)
+
+    def to_dict(self):
+        return {'compression': self.compression,
+                'means': self.means.tolist(),
+                'weights': self.weights.tolist(),
+                'single': self.single.tolist()}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d['compression'], d['means'], d['weights'], d['single'])
+
+
+# One column: the exact moments plus a digest of its values. NaNs are left
+# out, as describe() leaves them out.
+class ColumnSummary:
+
+    def __init__(self, compression=default_compression):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.digest = TDigest(compression)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+        mean = values.mean()
+        self.combine(len(values), mean, ((values - mean) ** 2).sum(), values.min(), values.max())
+        self.digest.update(values)
+
+    def merge(self, other):
+        if other.count == 0:
+            return
+        self.combine(other.count, other.mean, other.m2, other.min, other.max)
+        self.digest.merge(other.digest)
+
+    def combine(self, count, mean, m2, low, high):
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta ** 2 * self.count * count / total
+        self.count = total
+        self.min = min(self.min, low)
+        self.max = max(self.max, high)
+
+    def quantile(self, qs):
+        return self.digest.quantile(qs, self.min, self.max)
+
+# The same rows, and the same NaNs, describe() gives a numeric column.
+    def describe(self):
+        stats = {'count': float(self.count),
+                 'mean': self.mean if self.count else np.nan,
+                 'std': np.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else np.nan,
+                 'min': self.min if self.count else np.nan}
+        for q, value in zip(describe_quantiles, self.quantile(describe_quantiles)):
+            stats['{:g}%'.format(q * 100)] = float(value)
+        stats['max'] = self.max if self.count else np.nan
+        return stats
+
+    def to_dict(self):
+        return {'count': self.count,
+                'mean': self.mean,
+                'm2': self.m2,
+                'min': self.min if self.count else None,
+                'max': self.max if self.count else None,
+                'digest': self.digest.to_dict()}
+
+    @classmethod
+    def from_dict(cls, d):
+        summary = cls()
+        summary.count = d['count']
+        summary.mean = d['mean']
+        summary.m2 = d['m2']
+        summary.min = d['min'] if d['count'] else np.inf
+        summary.max = d['max'] if d['count'] else -np.inf
+        summary.digest = TDigest.from_dict(d['digest'])
+        return summary
+
+
+# A ColumnSummary for each of these columns. update() takes a frame (or a
+# chunk of one) and skips the columns it doesn't have.
+class FeatureStatistics:
+
+    def __init__(self, columns=(), compression=default_compression):
+        self.summaries = {column: ColumnSummary(compression) for column in columns}
+
+    def update(self, frame):
+        for column, summary in self.summaries.items():
+            if column in frame.columns:
+                summary.update(frame[column].to_numpy(dtype=float, na_value=np.nan))
+
+    def merge(self, other):
+        for column, summary in other.summaries.items():
+            if column not in self.summaries:
+                self.summaries[column] = ColumnSummary(summary.digest.compression)
+            self.summaries[column].merge(summary)
+
+# {column_<label>: describe()-style stats}, as national_df has them.
+    def describe(self, label):
+        return {'{}_{}'.format(column, label): summary.describe() for column, summary in self.summaries.items()}
+
+    def to_dict(self):
+        return {'version': sketch_version,
+                'columns': {column: summary.to_dict() for column, summary in self.summaries.items()}}
+
+# Statistics recorded by something other than this version (e.g. a
+# manifest from before there were sketches) can't be merged.
+    @classmethod
+    def from_dict(cls, d):
+        if not isinstance(d, dict) or d.get('version') != sketch_version:
+            raise ValueError("these statistics weren't recorded as version {} sketches".format(sketch_version))
+        stats = cls()
+        stats.summaries = {column: ColumnSummary.from_dict(summary) for column, summary in d['columns'].items()}
+        return stats
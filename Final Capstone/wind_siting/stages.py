@@ -0,0 +1,250 @@
+import time
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+from wind_siting import projection, sketch
+from wind_siting.accumulate import FrameAccumulator
+from wind_siting.instrument import span
+from wind_siting.nearest import NEAREST_COLUMNS, line_count_features, make_line_index
+
+# The pipeline's stages as functions over dataframes: nothing in here knows
+# about paths, manifests or file formats. wind_siting.pipeline reads their
+# inputs and writes their outputs; a notebook or a benchmark can call them
+# just as well on frames it made itself.
+#
+# us_state (or label) only names the stage in the timings. distance is
+# 'degrees' (the features as they've always been) or 'metres' (see
+# wind_siting.nearest.GeodesicLineIndex).
+
+
+# One chunk of NREL cells: add the centroid, then split the cells between
+# the states they fall in. Cells that aren't in any state (Offshore, which
+# is garbage) are dropped.
+#
+# Whittling each state down to what is within its borders used to take an
+# overlay of the whole dataset per state (sjoin doesn't clip--.overlay()
+# does). The partitioner does it in the same pass, only clipping the cells
+# that straddle a border.
+def split_cells_by_state(nrel_wind_data, state_partitioner, crs, label=None):
+    with span('centroid', label, rows=nrel_wind_data.shape[0]):
+        nrel_wind_data = projection.to_crs(nrel_wind_data.drop('gid',axis='columns'), crs)
+        cell_columns = [col for col in nrel_wind_data.columns if col != 'geometry']
+# The centroid is of the whole cell, before it gets clipped to a state.
+        centroids = shapely.centroid(np.asarray(nrel_wind_data['geometry'].values))
+        nrel_wind_data['centroid_lat'] = shapely.get_y(centroids)
+        nrel_wind_data['centroid_long'] = shapely.get_x(centroids)
+
+    with span('partition', label, rows=nrel_wind_data.shape[0]):
+        nrel_chunk_df = state_partitioner.partition(nrel_wind_data)
+        nrel_chunk_df.rename({'STUSPS': 'state'},axis='columns',inplace=True)
+        return nrel_chunk_df[cell_columns + ['state','centroid_lat','centroid_long','geometry']]
+
+
+# High-voltage transmission lines that are in service or being built.
+def usable_power_lines(power_lines):
+    return power_lines.loc[(power_lines['VOLTAGE'] > 0) &
+                           (~power_lines['VOLT_CLASS'].isin(['UNDER 100','100-161','NOT AVAILABLE'])) &
+                            (power_lines['STATUS'].isin(['IN SERVICE','UNDER CONST']))]
+
+
+# Add state to the power line dataset, in chunks so we don't blow out memory.
+# A line that crosses a border appears once for each state it's in; each row
+# keeps the index of the line it came from, so the line store can tell them apart.
+# The lines are put in the borders' CRS once, up front, rather than chunk by chunk.
+def power_lines_by_state(power_lines, lower48_borders, power_chunk_size=1000):
+    with span('reproject', rows=power_lines.shape[0]):
+        power_lines = projection.to_crs(power_lines, lower48_borders.crs)
+    power_out_chunks = FrameAccumulator()
+    power_length = power_lines.shape[0]
+    power_first_idx = 0
+    power_last_idx = power_chunk_size
+    print("power_length: {}".format(power_length))
+    not_done = True
+    while not_done:
+        print("power_lines[{}:{}]".format(power_first_idx,power_last_idx))
+        print("Adding state...")
+        with span('power_state_join', rows=power_lines[power_first_idx:power_last_idx].shape[0]):
+            power_chunk_df = gpd.sjoin(power_lines[power_first_idx:power_last_idx],
+                                      lower48_borders[['STUSPS','geometry']],
+                                      how='left')
+
+        power_chunk_df.drop('index_right',axis='columns',inplace=True)
+
+        power_out_chunks.append(power_chunk_df)
+
+        power_last_idx += power_chunk_size
+        power_first_idx += power_chunk_size
+        if power_last_idx > power_length:
+            power_last_idx = power_length
+        if power_first_idx > power_length:
+            not_done = False # In other words, we are not not_done. :)
+
+    power_out_df = power_out_chunks.to_frame(ignore_index=False)
+    del power_out_chunks
+    power_out_df.rename({'STUSPS': 'state'},axis='columns',inplace=True)
+    return power_out_df.loc[~power_out_df['state'].isin(['HI','AK'])]
+
+
+# Add the nearest-line, line count and wind_class features to one state's turbines.
+def turbine_features(existing_turbines, power_lines, wind_class_lookup,
+                     line_count_radius=1, extra_line_count_radii=(), default_wind_class=2, us_state=None,
+                     distance='degrees'):
+    with span('reproject', us_state, rows=existing_turbines.shape[0]):
+        power_lines, turbine_points = projection.distance_frames(power_lines, existing_turbines['geometry'], distance)
+
+# What I'd like to do is find the nearest transmission line for each turbine,
+# some of its attributes, and maybe an extra, related feature or two.
+# A spatial index over the lines answers this for every turbine in one call.
+    print("Finding the nearest transmission line for each turbine ",time.strftime('%X %x %Z'))
+    with span('nearest_line', us_state, rows=existing_turbines.shape[0]):
+        line_index = make_line_index(power_lines, distance)
+        nearest_df = line_index.query(turbine_points)
+
+# We end up with a dataframe that has the same number of rows as the turbine dataframe--easy to concat.
+    existing_turbines_updated = pd.concat([existing_turbines.reset_index(drop=True),
+                                           nearest_df[NEAREST_COLUMNS].reset_index(drop=True)],
+                                          axis=1)
+
+# Create a feature: the number of transmission lines
+# within 1 degree (~69 miles/111 km) of the turbine.
+# The line index counts them directly; no need to buffer every turbine.
+    with span('line_count', us_state, rows=existing_turbines.shape[0]):
+        line_counts = line_count_features(line_index, turbine_points,
+                                          line_count_radius, extra_line_count_radii)
+    existing_turbines_updated = pd.concat([existing_turbines_updated, line_counts], axis=1)
+    print("Count frequency for power lines w/in turbine buffers:",existing_turbines_updated['line_count'].value_counts())
+
+# Next up: the NREL dataset w/exclusions. Look up the wind_class for each turbine.
+# A turbine on the edge between two NREL cells gets the lower of their classes.
+    with span('wind_class', us_state, rows=existing_turbines.shape[0]):
+        existing_turbines_add_nrel = gpd.GeoDataFrame(existing_turbines_updated, geometry='geometry', crs=existing_turbines.crs)
+        existing_turbines_add_nrel['wind_class'] = wind_class_lookup.min_class(existing_turbines_add_nrel['geometry'])
+        existing_turbines_add_nrel.loc[:,'wind_class'] = existing_turbines_add_nrel['wind_class'].fillna(default_wind_class)
+    return existing_turbines_add_nrel
+
+
+# Add the model features to one state's NREL cells (without exclusions).
+# power_lines or turbines is None if the state has none (WY has no power
+# line file; 9 or so states have no turbines): those features are NaN.
+# distance_bounds is the long/lat bounds of the whole state's centroids,
+# when nrel_wind_data is only some of them, so that in metres they're
+# measured in the same CRS as they would be with the rest.
+def cell_features(nrel_wind_data, power_lines, turbines, wind_class_lookup,
+                  line_count_radius=1, extra_line_count_radii=(), us_state=None, distance='degrees',
+                  distance_bounds=None):
+    nrel_crs = nrel_wind_data.crs
+    cell_count = nrel_wind_data.shape[0]
+
+# Create some features to add to the NREL dataset!
+# 1. We have the centroid for each cell. Join to the power line dataset and:
+#   a. Calculate the distance from it to the nearest power line.
+    if power_lines is not None:
+# Turn the centroid lat/long into points, all at once. They're kept out of
+# nrel_wind_data, so the joins and merges below don't drag them along, and
+# only for as long as the power line features need them.
+        with span('centroid', us_state, rows=cell_count):
+            centroids = gpd.GeoSeries(gpd.points_from_xy(nrel_wind_data['centroid_long'], nrel_wind_data['centroid_lat']),
+                                      index=nrel_wind_data.index, crs=nrel_crs)
+        with span('reproject', us_state, rows=cell_count):
+            power_lines, centroids = projection.distance_frames(power_lines, centroids, distance, distance_bounds)
+
+        print("Finding the nearest power line for each cell",time.strftime('%X %x %Z'))
+        with span('nearest_line', us_state, rows=cell_count):
+            line_index = make_line_index(power_lines, distance)
+            nearest_df = line_index.query(centroids)
+
+#   b. Get some attributes for the closest power line
+        existing_wind_data_updated = pd.concat([nrel_wind_data.reset_index(drop=True),
+                                           nearest_df[NEAREST_COLUMNS].reset_index(drop=True)],
+                                           axis=1)
+        del nearest_df
+
+#   c. Calculate the number of power lines in a 1 degree radius (~69mi/111km)
+# The line index counts them directly; no need to buffer every centroid.
+        with span('line_count', us_state, rows=cell_count):
+            line_counts = line_count_features(line_index, centroids,
+                                              line_count_radius, extra_line_count_radii)
+        existing_wind_data_updated = pd.concat([existing_wind_data_updated, line_counts], axis=1)
+        print("Count frequency for power lines w/in NREL cells:",existing_wind_data_updated['line_count'].value_counts())
+        del line_index,line_counts,centroids
+    else:
+        existing_wind_data_updated = nrel_wind_data.copy(deep=True).reset_index(drop=True)
+
+# Add these columns as NaNs to mimic what would have been added if we had a power line dataset
+# Nearest line:
+# 'OBJECTID','TYPE','VOLTAGE','VOLT_CLASS','SHAPE__Len','dist_to_nearest_line'
+#
+# Lines within 1 degree of the centroid:
+# 'line_count'
+        existing_wind_data_updated = existing_wind_data_updated.assign(OBJECTID=np.nan,TYPE=np.nan,
+                                            VOLTAGE=np.nan,VOLT_CLASS=np.nan,SHAPE__Len=np.nan,
+                                            dist_to_nearest_line=np.nan,line_count=np.nan)
+        for radius in extra_line_count_radii:
+            existing_wind_data_updated['line_count_{}'.format(radius)] = np.nan
+
+    if turbines is not None:
+        with span('reproject', us_state, rows=turbines.shape[0]):
+            turbines = projection.to_crs(turbines, nrel_crs)
+# 2. Using the turbine dataset, calculate the number of turbines in this cell.
+        with span('turbine_join', us_state, rows=cell_count):
+            turbines_here = gpd.sjoin(nrel_wind_data,turbines,how='left')
+# Eliminate rows with no turbines in them from the count.
+        turbines_here = turbines_here.loc[~turbines_here['index_right'].isnull()]
+        turbines_here_ct = turbines_here['id'].value_counts()
+        turbines_here_ct.rename('turbine_count',inplace=True)
+
+        existing_wind_data_updated = existing_wind_data_updated.merge(right=turbines_here_ct,
+                                                                  left_on='id',right_index=True,
+                                                                  how='left')
+        existing_wind_data_updated.loc[:,'turbine_count'] = existing_wind_data_updated['turbine_count'].fillna(0)
+
+# Each turbine has an associated wind_class from the NREL dataset with exclusions
+# applied. For each cell, find the lowest wind_class among the cell's turbines.
+        turbines_here = turbines_here.loc[~turbines_here['index_right'].isnull()]\
+                                 .sort_values(by=['id','wind_class_right'])
+        turbines_ct_w_dups = turbines_here[['id','wind_class_right']].sort_values(by=['id','wind_class_right'])
+        turbines_ct_w_dups = turbines_ct_w_dups.loc[~turbines_ct_w_dups['id'].duplicated(keep='first')]
+# Join to wind data on id and save the wind_class_right column
+        existing_wind_data_updated = existing_wind_data_updated.merge(right=turbines_ct_w_dups[['id','wind_class_right']],
+                                                                on='id',
+                                                                how='left')
+        existing_wind_data_updated.rename(columns={'wind_class_right': 'wind_class_turbine'},inplace=True)
+        existing_wind_data_updated['wind_class_turbine'] = existing_wind_data_updated['wind_class_turbine'].fillna(0)
+        del turbines_here,turbines_ct_w_dups
+    else:
+# Add these columns as NaNs to mimic what would have been added if we had a turbines dataset
+# Number of turbines in this cell:
+# 'turbine_count'
+#
+# Lowest wind class associated with a turbine in this cell:
+# 'wind_class_turbine'
+        existing_wind_data_updated = existing_wind_data_updated.assign(turbine_count=np.nan,wind_class_turbine=np.nan)
+    del nrel_wind_data
+
+# The NREL cells can touch several cells of the NREL set w/exclusions.
+# Keep the lowest wind_class among them as wind_class_excl (0 if none).
+# The lookup answers this for every cell in one query.
+    print("Looking up wind_class w/exclusions for {} ".format(us_state),time.strftime('%X %x %Z'))
+    with span('wind_class', us_state, rows=cell_count):
+        nrel_augmented_out = gpd.GeoDataFrame(existing_wind_data_updated, geometry='geometry', crs=nrel_crs)
+        nrel_augmented_out['wind_class_excl'] = wind_class_lookup.min_class(nrel_augmented_out['geometry'])
+        nrel_augmented_out.loc[:,'wind_class_excl'] = nrel_augmented_out['wind_class_excl'].fillna(0)
+# Same column order as we've always written.
+    return nrel_augmented_out.sort_index(axis='columns')
+
+
+# Capture these additional stats to add to national_df:
+# 1. Power line density
+# 2. Distribution of dist_to_nearest_line
+# and the other features in columns, as a wind_siting.sketch.FeatureStatistics
+# that the national figures can be added up from, without going back to the
+# cells. Everything is summed as float64, whatever dtype it's stored in, so
+# the means don't lose precision over a million cells.
+def cell_statistics(nrel_augmented_out, us_state, columns=('line_count','dist_to_nearest_line'),
+                    compression=sketch.default_compression):
+    with span('stats', us_state, rows=nrel_augmented_out.shape[0]):
+        state_stats = sketch.FeatureStatistics(columns, compression)
+        state_stats.update(nrel_augmented_out)
+        return state_stats
@@ -0,0 +1,79 @@
+import os
+
+# The per-state intermediate files (power lines, turbines, the NREL cells split
+# by state) are written by one script and read back by the next. GeoJSON is
+# slow to parse and big on disk, so they default to GeoParquet, which is also
+# columnar: a stage that only needs wind_class and the geometry only reads those.
+#
+# Artifacts are named without an extension ("power_by_state/power_TX"); the
+# extension comes from the format. GeoJSON is still available for anything
+# that has to be opened from the notebooks.
+formats = {'parquet': '.parquet',
+           'geojson': '.geojson'}
+default_format = 'parquet'
+
+
+def add_storage_arguments(parser):
+    parser.add_argument('--format', choices=sorted(formats), default=default_format,
+                        help='file format for the per-state intermediate files (default: {})'.format(default_format))
+
+
+def artifact_path(stem, fmt=default_format):
+    return stem + formats[fmt]
+
+
+# The file that currently holds this artifact. If it was written in more than
+# one format (e.g. after switching --format), the newest one wins. If it
+# doesn't exist at all, return the path it would have in the default format.
+def existing_path(stem):
+    found = [artifact_path(stem, fmt) for fmt in formats if os.path.exists(artifact_path(stem, fmt))]
+    if len(found) == 0:
+        return artifact_path(stem)
+    return max(found, key=os.path.getmtime)
+
+
+def exists(stem):
+    return any(os.path.exists(artifact_path(stem, fmt)) for fmt in formats)
+
+
+# Split a file name into (stem, format), or (None, None) if it isn't one of ours.
+def split_format(path):
+    stem, ext = os.path.splitext(path)
+    for fmt, fmt_ext in formats.items():
+        if ext == fmt_ext:
+            return stem, fmt
+    return None, None
+
+
+def write_frame(gdf, stem, fmt=default_format):
+    path = artifact_path(stem, fmt)
+    if fmt == 'parquet':
+        gdf.to_parquet(path, index=False)
+    else:
+        gdf.to_file(path, driver='GeoJSON')
+    return path
+
+
+# Read an artifact in whichever format it's in. columns limits what gets read
+# (the geometry always comes along); the other columns are never even
+# parsed, in either format. A missing artifact raises FileNotFoundError.
+# geopandas is only imported here, so planning a run (which only needs the
+# paths above) doesn't pay for it.
+def read_frame(stem, columns=None):
+    import geopandas as gpd
+    path = existing_path(stem)
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    if split_format(path)[1] == 'parquet':
+        if columns is not None:
+            columns = list(columns) + ['geometry']
+        return gpd.read_parquet(path, columns=columns)
+    if columns is None:
+        return gpd.read_file(path)
+# OGR hands the columns back in the file's order, so put them in ours.
+    return gpd.read_file(path, columns=list(columns))[list(columns) + ['geometry']]
+
+
+# Write a GeoJSON copy of an artifact next to it, for the notebooks.
+def export_geojson(stem):
+    return write_frame(read_frame(stem), stem, 'geojson')
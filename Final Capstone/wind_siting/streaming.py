@@ -0,0 +1,282 @@
+import os
+import glob
+import json
+import shutil
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pyogrio
+import shapely
+
+from wind_siting import projection
+
+
+# Read a (potentially huge) vector file a batch of rows at a time, without
+# ever loading the whole thing, in one pass over the file: OGR's Arrow
+# stream parses it as it goes, rather than starting again from the top for
+# every slice of rows. Each batch keeps the row numbers of the source file,
+# as if we had read all of it. bbox limits the read to features that touch
+# that box, e.g. one state's bounds; the rows it skips aren't counted, so
+# then each row is labelled with its feature id instead. For a shapefile
+# that's the same thing; a GeoJSON feature's is its integer "id" (as a
+# member or a property), if it has one.
+def iter_batches(path, batch_size, bbox=None):
+    if path.endswith('.parquet'):
+        yield from iter_parquet_batches(path, batch_size, bbox)
+        return
+    start = 0
+    with pyogrio.open_arrow(path, batch_size=batch_size, bbox=bbox, return_fids=bbox is not None,
+                            use_pyarrow=True) as (meta, reader):
+        crs = projection.as_crs(meta['crs'])
+        for batch in reader:
+            if batch.num_rows == 0:
+                continue
+# The feature ids come first, under a name that can be a field's too.
+            if bbox is not None:
+                index = pd.Index(batch.column(0).to_numpy())
+                batch = batch.select(range(1, batch.num_columns))
+            else:
+                index = pd.RangeIndex(start, start + batch.num_rows)
+            start += batch.num_rows
+            block = to_geoframe(batch, meta['geometry_name'] or 'wkb_geometry', crs)
+            block.index = index
+            yield block
+
+
+# A GeoParquet file's geometry column and CRS, from its geo metadata
+# (OGC:CRS84 if it doesn't say, as the spec has it). The CRS is parsed once
+# per process, however many files have it: pyproj takes longer over a
+# PROJJSON CRS than reading a small file does.
+def geo_metadata(arrow_schema):
+    geo = json.loads(arrow_schema.metadata[b'geo'])
+    column = geo['primary_column']
+    crs = geo['columns'][column].get('crs', 'OGC:CRS84')
+    return column, projection.as_crs(json.dumps(crs, sort_keys=True) if isinstance(crs, dict) else crs)
+
+
+# An Arrow table or record batch of GeoParquet rows as a GeoDataFrame, the
+# way gpd.read_parquet makes one (WKB geometries only).
+def to_geoframe(table, column, crs):
+    geoms = shapely.from_wkb(table.column(column).to_numpy(zero_copy_only=False))
+    return gpd.GeoDataFrame(table.drop_columns([column]).to_pandas(), geometry=geoms, crs=crs)
+
+
+# gpd.read_parquet, but with the CRS from geo_metadata, and only the rows
+# that pass filters (pyarrow's, e.g. [('source_row', '<', 1000)]), which
+# skips every row group whose statistics rule it out.
+def read_geoparquet(path, filters=None):
+    table = pq.read_table(path, filters=filters)
+    return to_geoframe(table, *geo_metadata(table.schema))
+
+
+# The same for GeoParquet (which OGR may not have a driver for), a record
+# batch at a time. bbox keeps the rows whose bounding box touches it, as
+# OGR does.
+def iter_parquet_batches(path, batch_size, bbox=None):
+    parquet = pq.ParquetFile(path)
+    column, crs = geo_metadata(parquet.schema_arrow)
+    start = 0
+    for batch in parquet.iter_batches(batch_size=batch_size):
+        block = to_geoframe(batch, column, crs)
+        block.index = pd.RangeIndex(start, start + batch.num_rows)
+        start += batch.num_rows
+        if bbox is not None:
+            bounds = shapely.bounds(np.asarray(block.geometry.values))
+            block = block.loc[(bounds[:, 0] <= bbox[2]) & (bounds[:, 2] >= bbox[0]) &
+                              (bounds[:, 1] <= bbox[3]) & (bounds[:, 3] >= bbox[1])]
+        yield block
+
+
+# Just these columns of a file (no geometry), a batch of rows at a time, in
+# one pass over the file: GeoParquet a row group at a time, anything else
+# (the augmented GeoJSON) through OGR's Arrow stream, which parses it as it
+# goes rather than loading the whole document first, and rather than
+# starting again from the top for every slice of rows.
+def iter_column_batches(path, columns, batch_size):
+    if path.endswith('.parquet'):
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size, columns=columns):
+            yield batch.to_pandas()
+        return
+    with pyogrio.open_arrow(path, columns=columns, read_geometry=False, batch_size=batch_size,
+                            use_pyarrow=True) as (meta, reader):
+        for batch in reader:
+            yield batch.to_pandas()
+
+
+# Writes a stream of frames to one Parquet file as they come, so only the
+# frame in hand is ever in memory. Every frame has to have the first one's
+# columns. A GeoDataFrame is written as GeoParquet, as to_parquet would: the
+# geometry as WKB, described in the 'geo' metadata (without the geometry
+# types or bounds, which aren't known until the last frame). The file only
+# appears under its own name once it's closed.
+# With no frames there are no columns to give the file, so none is written
+# (and any earlier one at path is removed) and close returns None; write an
+# empty frame first to get a file with just the columns.
+class ParquetBatchWriter:
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = path + '.tmp'
+        self.writer = None
+        self.rows = 0
+
+    def write(self, frame):
+        schema = self.writer.schema if self.writer is not None else None
+        if isinstance(frame, gpd.GeoDataFrame):
+            table = from_geoframe(frame, schema)
+        else:
+            table = pa.Table.from_pandas(frame, schema=schema, preserve_index=False)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.tmp_path, table.schema)
+        self.writer.write_table(table)
+        self.rows += frame.shape[0]
+
+    def close(self):
+        if self.writer is None:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return None
+        self.writer.close()
+        os.replace(self.tmp_path, self.path)
+        return self.path
+
+
+def from_geoframe(frame, schema=None):
+    column = frame.geometry.name
+    data = pd.DataFrame(frame).assign(**{column: shapely.to_wkb(np.asarray(frame.geometry.values))})
+    table = pa.Table.from_pandas(data, schema=schema, preserve_index=False)
+    if schema is not None:
+        return table
+    geo = {'version': '1.0.0',
+           'primary_column': column,
+           'columns': {column: {'encoding': 'WKB',
+                                'geometry_types': [],
+                                'crs': frame.crs.to_json_dict() if frame.crs is not None else None}}}
+    return table.replace_schema_metadata(dict(table.schema.metadata, geo=json.dumps(geo)))
+
+
+# The same for GeoJSON, so a state's augmented cells can be written a batch
+# at a time and still come out as the one FeatureCollection the notebooks
+# read. OGR can append to a GeoJSON file, but only by reading all of it back
+# in first, and not in order, so each frame is written to a file of its own
+# (by OGR, as storage.write_frame would) and its features copied across:
+# OGR writes a feature per line, so the result is the same, byte for byte,
+# as writing every frame at once under the file's own name.
+# As with ParquetBatchWriter, no frames means no file (and close returns None).
+class GeoJSONBatchWriter:
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = path + '.tmp'
+        self.part_path = path + '.part'
+        self.layer = os.path.splitext(os.path.basename(path))[0]
+        self.out = None
+        self.rows = 0
+
+    def write(self, frame):
+        frame.to_file(self.part_path, driver='GeoJSON', layer=self.layer)
+        first = self.out is None
+        if first:
+            self.out = open(self.tmp_path, 'w')
+        with open(self.part_path) as part:
+# The first frame's header (everything up to the features) is the file's.
+            for line in part:
+                if first:
+                    self.out.write(line)
+                if line.startswith('"features"'):
+                    break
+            for line in part:
+                if line.startswith(']'):
+                    break
+                if line.strip():
+                    self.out.write((',\n' if self.rows else '') + line.rstrip('\n').rstrip(','))
+                    self.rows += 1
+        os.remove(self.part_path)
+
+    def close(self):
+        if self.out is None:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return None
+        self.out.write('\n]\n}\n')
+        self.out.close()
+        os.replace(self.tmp_path, self.path)
+        return self.path
+
+
+# The batch writer for a file, by its extension.
+def batch_writer(path):
+    if path.endswith('.geojson'):
+        return GeoJSONBatchWriter(path)
+    return ParquetBatchWriter(path)
+
+
+# Splits a stream of batches by a key column (e.g. state) into GeoParquet
+# part files on disk, so a pass over the national file can write each
+# state's rows out as it goes instead of holding the whole country in memory.
+# Rows are buffered until max_buffered_rows have piled up across all keys,
+# then everything buffered is flushed.
+class PartitionWriter:
+
+    def __init__(self, spill_dir, max_buffered_rows=50000):
+        self.spill_dir = spill_dir
+        self.max_buffered_rows = max_buffered_rows
+        self.buffers = {}
+        self.buffered_rows = 0
+        self.parts = {}
+        self.crs = None
+        shutil.rmtree(spill_dir, ignore_errors=True)
+        os.makedirs(spill_dir)
+
+    def append(self, gdf, key_column):
+        if self.crs is None:
+            self.crs = gdf.crs
+        for key, rows in gdf.groupby(key_column, sort=False):
+            self.buffers.setdefault(key, []).append(rows)
+            self.buffered_rows += rows.shape[0]
+        if self.buffered_rows >= self.max_buffered_rows:
+            self.flush()
+
+    def flush(self):
+        for key, chunks in self.buffers.items():
+            part = self.parts.get(key, 0)
+            key_dir = os.path.join(self.spill_dir, str(key))
+            os.makedirs(key_dir, exist_ok=True)
+            gpd.GeoDataFrame(pd.concat(chunks), crs=self.crs)\
+               .to_parquet(os.path.join(key_dir, 'part-{:05d}.parquet'.format(part)))
+            self.parts[key] = part + 1
+        self.buffers = {}
+        self.buffered_rows = 0
+
+    def keys(self):
+        self.flush()
+        return sorted(self.parts)
+
+# All of the rows for one key, in the order they were appended.
+    def read(self, key):
+        self.flush()
+        return read_parts(os.path.join(self.spill_dir, str(key)), self.crs)
+
+# The same, a part file at a time, so no more than max_buffered_rows of
+# them are ever in memory.
+    def iter_read(self, key):
+        self.flush()
+        return iter_parts(os.path.join(self.spill_dir, str(key)), self.crs)
+
+    def cleanup(self):
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+
+# One key's part files, read back by anything that knows where they are
+# (e.g. another process), without the writer.
+def iter_parts(key_dir, crs=None):
+    for path in sorted(glob.glob(os.path.join(key_dir, 'part-*.parquet'))):
+        part = read_geoparquet(path)
+        yield part if crs is None else part.set_crs(crs, allow_override=True)
+
+
+def read_parts(key_dir, crs=None):
+    frames = list(iter_parts(key_dir, crs))
+    return gpd.GeoDataFrame(pd.concat(frames), crs=frames[0].crs)
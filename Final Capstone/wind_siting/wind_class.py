@@ -0,0 +1,89 @@
+import os
+import numpy as np
+import geopandas as gpd
+import shapely
+
+from wind_siting import storage, projection
+from wind_siting.manifest import Manifest
+
+# Bump this if the way lookups are built changes, so old ones get rebuilt.
+lookup_version = 1
+
+
+# Answers "what is the lowest wind_class of the exclusion polygons this
+# point/cell touches?" for a whole array of geometries at once.
+#
+# The exclusion polygons are dissolved by wind_class and split back into
+# single polygons, which leaves far fewer (if bigger) polygons than there
+# are NREL cells. Those go into an STRtree, and each geometry's matches are
+# reduced to their minimum wind_class. Touching a polygon of a class is the
+# same as touching that class's unary_union, so this gives the same answer
+# as sjoining to one union per class and keeping the lowest class.
+class WindClassLookup:
+
+    def __init__(self, polygons):
+        self.polygons = polygons.reset_index(drop=True)
+        self.crs = polygons.crs
+        self.wind_classes = self.polygons['wind_class'].to_numpy(dtype=float, na_value=np.nan)
+        geoms = np.asarray(self.polygons['geometry'].values)
+        shapely.prepare(geoms)
+        self.tree = shapely.STRtree(geoms)
+
+    @classmethod
+    def from_exclusions(cls, exclusions):
+        polygons = exclusions[['wind_class','geometry']].dissolve(by='wind_class', as_index=False)
+        return cls(polygons.explode(index_parts=False))
+
+# Lowest wind_class touching each geometry, NaN where there is none.
+    def min_class(self, geoms, predicate='intersects'):
+        if getattr(geoms, 'crs', None) is not None and self.crs is not None:
+            geoms = projection.to_crs(geoms, self.crs)
+        geoms = np.asarray(geoms, dtype=object)
+        lowest = np.full(len(geoms), np.inf)
+        if len(geoms) > 0 and len(self.wind_classes) > 0:
+            geom_idx, polygon_idx = self.tree.query(geoms, predicate=predicate)
+            np.minimum.at(lowest, geom_idx, self.wind_classes[polygon_idx])
+        lowest[np.isinf(lowest)] = np.nan
+        return lowest
+
+    def save(self, path):
+        tmp_path = path + '.tmp'
+        self.polygons.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        return cls(gpd.read_parquet(path))
+
+
+def file_stamps(paths):
+    return tuple(os.stat(path).st_mtime_ns if os.path.exists(path) else None for path in paths)
+
+
+# The lookup for one state, built from its NREL exclusion file the first time
+# it's needed and kept in lookup_dir after that. It's rebuilt whenever the
+# exclusion file changes. A process keeps the last one it loaded for each
+# state until either file changes, since every tile of a state
+# (--partition tiles) asks for it again.
+loaded_lookups = {}
+
+
+def load_wind_class_lookup(exclusion_stem, lookup_dir, state):
+    exclusion_file = storage.existing_path(exclusion_stem)
+    lookup_file = os.path.join(lookup_dir, 'wind_class_lookup_{}.parquet'.format(state))
+    stamps = file_stamps([exclusion_file, lookup_file])
+    if lookup_file in loaded_lookups and loaded_lookups[lookup_file][0] == stamps:
+        return loaded_lookups[lookup_file][1]
+    manifest = Manifest(lookup_dir, lookup_version)
+    inputs = manifest.input_digests(state, [exclusion_file])
+    if manifest.is_current(state, inputs, [lookup_file]):
+        loaded_lookups[lookup_file] = (stamps, WindClassLookup.load(lookup_file))
+        return loaded_lookups[lookup_file][1]
+
+    print("Building the wind_class lookup for {}".format(state))
+    lookup = WindClassLookup.from_exclusions(storage.read_frame(exclusion_stem, columns=['wind_class']))
+    os.makedirs(lookup_dir, exist_ok=True)
+    lookup.save(lookup_file)
+    manifest.record(state, inputs, [lookup_file])
+    loaded_lookups[lookup_file] = (file_stamps([exclusion_file, lookup_file]), lookup)
+    return lookup
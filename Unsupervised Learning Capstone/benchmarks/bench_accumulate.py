@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+# Build the crawler's listing frame and write its blocks of player records
+# the old way (a one-row DataFrame appended per listing row; one appended row
+# plus a .loc write per skill per player, into a frame pre-filled with one
+# empty row per listed player) and the new way (plain rows/dicts, one frame
+# per block), on synthetic players.
+#
+# The old way is too slow to run on all of them, so it is timed on the first
+# --legacy-players and scaled up linearly. That's a lower bound: each of its
+# .loc writes also scans a frame as long as the whole listing, which only
+# gets longer with more players. The CSV it writes for those players is
+# checked byte for byte against the new one.
+# Run from the "Unsupervised Learning Capstone" directory:
+#   python3 benchmarks/bench_accumulate.py [--players 20000] [--legacy-players 1000]
+
+import os
+import sys
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import crawler_2020
+from crawler_2020 import columns, detailed_columns, write_block
+from fifa_crawler.sink import OutputSink
+from fifa_crawler.parse import parse_listing_page, parse_player_page
+from fifa_crawler.fixtures import make_players, player_page, listing_page, players_per_page
+
+# Distinct players whose pages are parsed; the rest reuse their rows and
+# skill maps under new IDs, so setup doesn't dwarf what's being timed.
+distinct_players = 244
+
+
+def synthetic_crawl(n_players):
+    players = make_players(distinct_players)
+    parsed_rows = []
+    for start in range(0, distinct_players, players_per_page):
+        parsed_rows.extend(parse_listing_page(listing_page(players[start:start + players_per_page])))
+    skill_maps = [parse_player_page(player_page(player)) for player in players]
+    listing_rows = [[str(1000 + i)] + parsed_rows[i % distinct_players][1:] for i in range(n_players)]
+    detailed = [(row[0], skill_maps[i % distinct_players]) for i, row in enumerate(listing_rows)]
+    return listing_rows, detailed
+
+
+# DataFrame.append, which the crawler relied on, is gone from newer pandas;
+# this is what it did.
+def append(frame, other):
+    if isinstance(other, dict):
+        other = pd.DataFrame([other])
+    return pd.concat([frame, other], ignore_index=True)
+
+
+def legacy(listing_rows, detailed, block_size, output_file):
+    data = pd.DataFrame(columns = columns)
+    for row in listing_rows:
+        player_data = pd.DataFrame([row])
+        player_data.columns = columns
+        data = append(data, player_data)
+    data = data.drop_duplicates()
+
+    to_csv_mode, write_header, processed_count = 'w', True, 1
+    detailed_data = pd.DataFrame(index = range(0, len(data)), columns = detailed_columns)
+    for id, skill_map in detailed:
+        detailed_data = append(detailed_data, {'ID': id})
+        for key, value in skill_map.items():
+            detailed_data.loc[detailed_data.ID == id, key] = value
+        processed_count += 1
+        if (processed_count > block_size):
+            full_data = pd.merge(data, detailed_data, how = 'inner', on = 'ID')
+            full_data.to_csv(output_file, encoding='utf-8-sig',mode=to_csv_mode,header=write_header)
+            processed_count, to_csv_mode, write_header = 1, 'a', False
+            detailed_data = pd.DataFrame(index = range(0, len(data)), columns = detailed_columns)
+    full_data = pd.merge(data, detailed_data, how = 'inner', on = 'ID')
+    full_data.to_csv(output_file, encoding='utf-8-sig',mode=to_csv_mode,header=write_header)
+
+
+def current(listing_rows, detailed, block_size, output_file):
+    data = pd.DataFrame(listing_rows, columns = columns).drop_duplicates()
+    listing = data.set_index('ID', drop=False)
+    sink = OutputSink(output_file)
+    detailed_rows = []
+    for id, skill_map in detailed:
+        detailed_rows.append(dict(skill_map, ID=id))
+        if len(detailed_rows) == block_size:
+            write_block(sink, listing, detailed_rows)
+            detailed_rows = []
+    write_block(sink, listing, detailed_rows)
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--players', type=int, default=20000)
+    parser.add_argument('--legacy-players', type=int, default=1000)
+    parser.add_argument('--block-size', type=int, default=crawler_2020.player_block_size)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    listing_rows, detailed = synthetic_crawl(args.players)
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        sample_rows = listing_rows[:args.legacy_players]
+        sample_detailed = detailed[:args.legacy_players]
+        legacy_csv = os.path.join(tmp_dir, 'legacy.csv')
+        current_csv = os.path.join(tmp_dir, 'current.csv')
+        legacy_s = timed(legacy, sample_rows, sample_detailed, args.block_size, legacy_csv)
+        timed(current, sample_rows, sample_detailed, args.block_size, current_csv)
+        with open(legacy_csv, 'rb') as f, open(current_csv, 'rb') as g:
+            identical = f.read() == g.read()
+
+        current_s = timed(current, listing_rows, detailed, args.block_size, current_csv)
+        legacy_est = legacy_s * args.players / args.legacy_players
+
+        print("CSV identical on the first {} players: {}".format(args.legacy_players, identical))
+        print("{:>10} {:>10} {:>12} {:>14}".format('method', 'players', 'seconds', 'players/s'))
+        print("{:>10} {:>10} {:>12.2f} {:>14.0f}".format('legacy', args.legacy_players, legacy_s, args.legacy_players / legacy_s))
+        print("{:>10} {:>10} {:>12} {:>14.0f}".format('legacy', args.players, '>{:.0f} est'.format(legacy_est), args.players / legacy_est))
+        print("{:>10} {:>10} {:>12.2f} {:>14.0f}".format('records', args.players, current_s, args.players / current_s))
+    finally:
+        shutil.rmtree(tmp_dir)
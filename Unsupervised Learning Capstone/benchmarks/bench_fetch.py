@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+# Time fetching player pages from a local fixture server that adds a fixed
+# latency to every response: one request at a time (what the crawler used to
+# do, minus its 1-5s sleeps), then through Fetcher with a few in flight.
+# With --fail-rate some responses are 503s, to show the retries at work.
+# Run from the "Unsupervised Learning Capstone" directory:
+#   python3 benchmarks/bench_fetch.py [--players 200] [--latency 0.1] [--fail-rate 0.05]
+
+import os
+import sys
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from fifa_crawler.fetch import Fetcher
+from fifa_crawler.fixtures import FixtureServer, write_fixtures
+
+
+def sequential(urls):
+    fetched = 0
+    for url in urls:
+        try:
+            response = requests.get(url)
+        except requests.RequestException:
+            continue
+        fetched += response.status_code == 200
+    return fetched
+
+
+def concurrent(urls, max_in_flight, retries):
+    with Fetcher(rate=None, max_in_flight=max_in_flight, retries=retries, backoff=0.05) as fetcher:
+        return sum(text is not None for _, text in fetcher.fetch_all(enumerate(urls)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--players', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.1)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        players = write_fixtures(tmp_dir, args.players)
+        print("{:>22} {:>8} {:>8} {:>10} {:>10}".format('mode', 'fetched', 'secs', 'pages/s', 'requests'))
+        for mode, max_in_flight in [('sequential', 1), ('Fetcher', 1), ('Fetcher', 4), ('Fetcher', 16)]:
+            with FixtureServer(tmp_dir, latency=args.latency, fail_rate=args.fail_rate) as server:
+                urls = ['{}/player/{}'.format(server.url, player['ID']) for player in players]
+                start = time.perf_counter()
+                if mode == 'sequential':
+                    fetched = sequential(urls)
+                else:
+                    fetched = concurrent(urls, max_in_flight, retries=5)
+                secs = time.perf_counter() - start
+                label = mode if mode == 'sequential' else '{} x{}'.format(mode, max_in_flight)
+                print("{:>22} {:>8} {:>8.2f} {:>10.1f} {:>10}".format(label, fetched, secs, fetched / secs, server.requests))
+    finally:
+        shutil.rmtree(tmp_dir)
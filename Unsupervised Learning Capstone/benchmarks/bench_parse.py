@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+# Parse the same listing and player pages with every parser backend, check
+# that they agree field for field, and report pages/second. Exits 1, after
+# printing the first page each pair disagrees on, if any backend differs.
+# Pages are synthetic (fifa_crawler.fixtures) unless --pages-dir points at a
+# fixture directory of saved pages.
+# Run from the "Unsupervised Learning Capstone" directory:
+#   python3 benchmarks/bench_parse.py [--players 500] [--pages-dir fixtures]
+
+import os
+import sys
+import glob
+import time
+import logging
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from fifa_crawler import parse
+from fifa_crawler.fixtures import make_players, player_page, listing_page, players_per_page
+
+
+def load_pages(pages_dir):
+    pages = {}
+    for kind in ['players', 'player']:
+        pages[kind] = []
+        for path in sorted(glob.glob(os.path.join(pages_dir, kind, '*.html'))):
+            with open(path, encoding='utf-8') as f:
+                pages[kind].append(f.read())
+    return pages['players'], pages['player']
+
+
+def synthetic_pages(n_players):
+    players = make_players(n_players)
+    listings = [listing_page(players[start:start + players_per_page])
+                for start in range(0, n_players, players_per_page)]
+    return listings, [player_page(player) for player in players]
+
+
+def timed(func, pages, backend):
+    start = time.perf_counter()
+    results = [func(page, backend) for page in pages]
+    return results, time.perf_counter() - start
+
+
+# Where two parses of a page part: the first listing row that differs, or
+# the player fields that do.
+def first_difference(a, b, a_name, b_name):
+    if isinstance(a, dict) and isinstance(b, dict):
+        return ["{}: {} {!r}, {} {!r}".format(key, a_name, a.get(key), b_name, b.get(key))
+                for key in list(a) + [key for key in b if key not in a] if a.get(key) != b.get(key)]
+    if len(a) != len(b):
+        return ["{} rows from {}, {} from {}".format(len(a), a_name, len(b), b_name)]
+    row = next(idx for idx, (x, y) in enumerate(zip(a, b)) if x != y)
+    return ["row {}".format(row), "{}: {}".format(a_name, a[row]), "{}: {}".format(b_name, b[row])]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--players', type=int, default=500)
+    parser.add_argument('--pages-dir', default=None)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    if args.pages_dir:
+        listings, player_pages = load_pages(args.pages_dir)
+    else:
+        listings, player_pages = synthetic_pages(args.players)
+    backends = [b for b in parse.backends if b != 'lxml' or parse.lxml is not None]
+
+    print("{:>8} {:>8} {:>8} {:>10} {:>10}".format('backend', 'pages', 'kind', 'seconds', 'pages/s'))
+    results = {}
+    for backend in backends:
+        for kind, func, pages in [('listing', parse.parse_listing_page, listings),
+                                  ('player', parse.parse_player_page, player_pages)]:
+            parsed, secs = timed(func, pages, backend)
+            results[backend, kind] = parsed
+            print("{:>8} {:>8} {:>8} {:>10.2f} {:>10.1f}".format(backend, len(pages), kind, secs, len(pages) / secs))
+
+    failed = False
+    for backend in backends[1:]:
+        for kind in ['listing', 'player']:
+            reference, other = results[backends[0], kind], results[backend, kind]
+            differ = [idx for idx, (a, b) in enumerate(zip(reference, other)) if a != b]
+            print("{} vs {} {} pages: {} of {} differ".format(backends[0], backend, kind, len(differ), len(reference)))
+            if differ:
+                failed = True
+                print("  first is {} page {}".format(kind, differ[0]))
+                for line in first_difference(reference[differ[0]], other[differ[0]], backends[0], backend):
+                    print("    " + line)
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+# Run the fetch -> parse -> write pipeline over player pages served by a
+# local fixture server, with 1..N parse processes, and report throughput,
+# the per-stage counters and the peak RSS of the crawler process.
+# Each configuration runs in a fresh process so peak memory is its own; a
+# run over 4x the pages should peak at about the same RSS if backpressure
+# is doing its job.
+# Run from the "Unsupervised Learning Capstone" directory:
+#   python3 benchmarks/bench_pipeline.py [--players 400] [--workers 1 2 4] [--parser bs4]
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import functools
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from fifa_crawler.fetch import Fetcher
+from fifa_crawler.parse import parse_player_page
+from fifa_crawler.pipeline import fetch_and_parse, StageCounters
+from fifa_crawler.fixtures import FixtureServer, write_fixtures
+
+
+def peak_rss_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024.0
+    return float('nan')
+
+
+# One pipeline run; prints its numbers as JSON for the parent.
+def child(site, ids, parser, workers, queue_size):
+    counters = StageCounters(['fetched', 'parsed', 'written'])
+    jobs = [(pid, '{}/player/{}'.format(site, pid)) for pid in ids]
+    start = time.perf_counter()
+    with Fetcher(rate=None, max_in_flight=8) as fetcher:
+        for pid, record in fetch_and_parse(fetcher, jobs, functools.partial(parse_player_page, backend=parser),
+                                           workers, queue_size, counters):
+            counters.count('written')
+    print(json.dumps({'secs': time.perf_counter() - start, 'rss': peak_rss_mb(), 'summary': counters.summary()}))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--players', type=int, default=400)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--parser', default='bs4')
+    parser.add_argument('--queue-size', type=int, default=64)
+    parser.add_argument('--child', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    if args.child:
+        site, ids_path = args.child
+        with open(ids_path) as f:
+            ids = json.load(f)
+        child(site, ids, args.parser, args.workers[0], args.queue_size)
+        sys.exit(0)
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        players = write_fixtures(tmp_dir, args.players)
+        ids = [player['ID'] for player in players]
+        print("{} CPUs, parser {}".format(os.cpu_count(), args.parser))
+        print("{:>8} {:>8} {:>8} {:>10} {:>10}  {}".format('pages', 'workers', 'secs', 'pages/s', 'peak MB', 'counters'))
+        with FixtureServer(tmp_dir) as server:
+            runs = [(ids, workers) for workers in args.workers] + [(ids * 4, args.workers[0])]
+            for run_ids, workers in runs:
+                ids_path = os.path.join(tmp_dir, 'ids.json')
+                with open(ids_path, 'w') as f:
+                    json.dump(run_ids, f)
+                output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', server.url, ids_path,
+                                         '--workers', str(workers), '--parser', args.parser,
+                                         '--queue-size', str(args.queue_size)],
+                                        capture_output=True, text=True, check=True).stdout
+                result = json.loads(output.splitlines()[-1])
+                print("{:>8} {:>8} {:>8.2f} {:>10.1f} {:>10.1f}  {}".format(
+                    len(run_ids), workers, result['secs'], len(run_ids) / result['secs'], result['rss'], result['summary']))
+    finally:
+        shutil.rmtree(tmp_dir)
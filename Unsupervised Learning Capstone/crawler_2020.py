@@ -2,13 +2,17 @@
 
 # Adapted from https://github.com/amanthedorkknight/fifa18-all-player-statistics/blob/master/2019/crawler.py
 
+import os
 import sys
-from time import sleep
-from random import randint
+import shutil
+import argparse
+import functools
 import pandas as pd
-import re
-import requests
-from bs4 import BeautifulSoup
+from fifa_crawler.fetch import Fetcher
+from fifa_crawler.cache import PageCache, add_cache_arguments
+from fifa_crawler.parse import parse_listing_page, parse_player_page, add_parser_arguments
+from fifa_crawler.pipeline import fetch_and_parse, StageCounters
+from fifa_crawler.sink import OutputSink, add_sink_arguments, output_path
 
 import logging,sys
 logging.basicConfig(stream=sys.stderr, level=logging.INFO)
@@ -17,151 +21,204 @@ logging.basicConfig(stream=sys.stderr, level=logging.INFO)
 get_basic_player_info = True
 saved_player_list = 'basic_player_info.json.zip'
 
+# The listing as of the last crawl that got to the end. --changed-only diffs
+# against this, not saved_player_list, which is rewritten before the player
+# pages are fetched: an interrupted crawl would otherwise leave its own
+# listing as the baseline, and the players that changed would look unchanged
+# on the rerun.
+last_crawl_snapshot = 'last_crawl_player_info.json.zip'
+
 # If you want to write blocks of player records to the CSV more or less often,
-# change player_block_size. Don't mess with processed_count.
+# change player_block_size.
 player_block_size = 500
-processed_count = 1
 
 output_file = 'data.csv'
 
-# Overwrite an existing output CSV (this switches to 'a' in the loop, to append)
-to_csv_mode = 'w'
+# Where to crawl, and how many listing pages of 61 players to read. Point
+# --site at a fifa_crawler.fixtures server to crawl saved pages locally.
+site = "https://sofifa.com"
+listing_pages = 300
 
-# Only write a header the first time we write to the CSV.
-write_header = True
+# It's rude to hammer a website with requests. These are the defaults for
+# the politeness budget: requests per second across all fetch threads, and
+# how many requests may be waiting on the site at once.
+request_rate = 1.0
+max_in_flight = 2
+retries = 3
 
-base_url = "https://sofifa.com/players?offset="
-columns = ['ID', 'Name', 'Age', 'Photo', 'Nationality', 'Flag', 'Overall', 'Potential', 'Club', 'Club Logo', 'Value', 'Wage', 'Special']
-data = pd.DataFrame(columns = columns)
-
-# Get basic players information for all players
-if (get_basic_player_info):
-    for offset in range(0, 300):
-        url = base_url + str(offset * 61)
-        source_code = requests.get(url)
-        plain_text = source_code.text
-        soup = BeautifulSoup(plain_text, 'html.parser')
-        table_body = soup.find('tbody')
-        for row in table_body.findAll('tr'):
-            td = row.findAll('td')
-            picture = td[0].find('img').get('data-src')
-            pid = td[0].find('img').get('id')
-            nationality = td[1].find('a').get('title')
-            flag_img = td[1].find('img').get('data-src')
-            name = td[1].findAll('a')[1].text
-            logging.info("Retrieving player info for {}, ID {}".format(name,pid))
-            age = td[2].text.strip()
-            overall = td[3].text.strip()
-            potential = td[4].text.strip()
-            club = td[5].find('a').text
-            club_logo = td[5].find('img').get('data-src')
-            value = td[6].text.strip()
-            wage = td[7].text.strip()
-            special = td[8].text.strip()
-            player_data = pd.DataFrame([[pid, name, age, picture, nationality, flag_img, overall, potential, club, club_logo, value, wage, special]])
-            player_data.columns = columns
-            data = data.append(player_data, ignore_index=True)
-    data = data.drop_duplicates()
+# Player pages are parsed by this many processes (1: in the crawler itself),
+# fed from a queue of at most fetch_queue_size fetched pages.
+parse_workers = 1
+fetch_queue_size = 64
 
-# Write basic player info, so we don't have to retrieve it again in a rerun.
-    data.to_json(saved_player_list,orient='split',index=False)
-else:
-# Try reading the players list from a saved file
-    data = pd.read_json(saved_player_list,orient='split')
-    logging.info("Successfully read {}".format(saved_player_list))
+# With --changed-only, a player's page is only refetched if one of these
+# differs between their listing row and the one saved by the last crawl.
+snapshot_columns = ['Overall', 'Value', 'Wage']
 
-logging.info("Player info dataframe shape: {}".format(data.shape))
+columns = ['ID', 'Name', 'Age', 'Photo', 'Nationality', 'Flag', 'Overall', 'Potential', 'Club', 'Club Logo', 'Value', 'Wage', 'Special']
 
 # 2020 updates: 'Release Clause' and 'DefensiveAwareness' added.
 detailed_columns = ['ID', 'Preferred Foot', 'International Reputation', 'Weak Foot', 'Skill Moves', 'Work Rate', 'Body Type', 'Real Face', 'Player Positions', 'Position', 'Jersey Number', 'Joined', 'Loaned From', 'Contract Valid Until', 'Release Clause', 'Height', 'Weight', 'LS', 'ST', 'RS', 'LW', 'LF', 'CF', 'RF', 'RW', 'LAM', 'CAM', 'RAM', 'LM', 'LCM', 'CM', 'RCM', 'RM', 'LWB', 'LDM', 'CDM', 'RDM', 'RWB', 'LB', 'LCB', 'CB', 'RCB', 'RB', 'Crossing', 'Finishing', 'HeadingAccuracy', 'ShortPassing', 'Volleys', 'Dribbling', 'Curve', 'FKAccuracy', 'LongPassing', 'BallControl', 'Acceleration', 'SprintSpeed', 'Agility', 'Reactions', 'Balance', 'ShotPower', 'Jumping', 'Stamina', 'Strength', 'LongShots', 'Aggression', 'Interceptions', 'Positioning', 'Vision', 'Penalties', 'Composure', 'Marking', 'DefensiveAwareness', 'StandingTackle', 'SlidingTackle', 'GKDiving', 'GKHandling', 'GKKicking', 'GKPositioning', 'GKReflexes']
-detailed_data = pd.DataFrame(index = range(0, data.count()[0]), columns = detailed_columns)
-player_data_url = 'https://sofifa.com/player/'
-
-for id in data.ID:
-# It's rude to hammer a website with requests. Let's sleep for some random amount of time to slow things down.
-    sleep(randint(1,5))
-
-    skill_map = {}
-    logging.info("Retrieving individual info for player ID {}. Processed {}/{}".format(id,processed_count,player_block_size))
-    url = player_data_url + str(id)
-    try:
-        source_code = requests.get(url)
-    except:
-        logging.info("Unable to retrieve info for player ID {}! Skipping.".format(id))
-        continue
-    plain_text = source_code.text
-    soup = BeautifulSoup(plain_text, 'html.parser')
-
-# Metadata format is: first_name, last_name, flag (returns an empty string), position(s), 'Age', age_number, '('+birth_month, birth_day+',', birth_year+')'
-    meta_data = soup.find('div', {'class': 'meta'}).text.split(' ')
-    length = len(meta_data)
-    flag_space_ind = meta_data.index('')
-    age_string_ind = meta_data.index('Age')
-# We'll capture all of the positions listed here now. We can decide what to do with them in analysis.
-    skill_map['Player Positions'] = str.join(' ',meta_data[flag_space_ind+1:age_string_ind])
-    weight = meta_data[length - 1]
-    height = meta_data[length - 2].split('\'')[0] + '\'' + meta_data[length - 2].split('\'')[1].split('\"')[0]
-    skill_map["Height"] = height
-    skill_map['Weight'] = weight
-
-# Players' attributes have been split across a few different classes, so we'll extract values from all of them.
-    for col_idx in [5,6]:
-        columns = soup.find('div', {'class': 'teams'}).find('div', {'class': 'columns'}).find_all('div', {'class': 'column col-{}'.format(col_idx)})
-        for column in columns:
-            skills = column.find_all('li')
-            for skill in skills:
-                if(skill.find('label') != None):
-                    label = skill.find('label').text
-                    value = skill.text.replace(label, '').strip()
-                    skill_map[label] = value
-
-# col-5 information (the team to which a player belongs, and the position they play) may not be populated.
-# If it isn't, use the first position listed next to their name as Position.
-    if('Position' not in skill_map.keys()):
-        skill_map['Position'] = meta_data[3]
-
-
-# Position scores have been moved outside of the 'article' tag to an 'aside' tag.
-# Goalkeepers don't have these stats.
-    if (skill_map['Position'] != 'GK'):
-        positions = soup.find('aside').find_all('div', class_='columns')
-        for position in positions:
-            for pos_div in position.find_all('div', class_=re.compile('column col-sm-2 text-center p')):
-                my_output = re.split(r'(\d+)',pos_div.text,maxsplit=1)
-                my_output[0] = my_output[0][1:]
-
-# There is a bonus awarded to some players. Capture it--we can decide what to do with it in analysis.
-                skill_map[my_output[0]] = str.join('',my_output[1:3])
-
-# The rest of the players' attributes have been split into a bunch of classes as well.
-# Bonus work, tbd: Capture the class information regarding the players' skill levels in each area--
-#  tags look like "bp3-intent-(success|warning|danger)". Could be useful summary info?
-    sections = soup.find('article').find_all('div', class_=re.compile('bp3-callout '))[2:]
-    for section in sections:
-        items = section.find('ul').find_all('li')
-        for item in items:
-            value = int(re.findall(r'\d+', item.text)[0])
-            name = ''.join(re.findall('[a-zA-Z]*', item.text))
-            skill_map[str(name)] = value
-
-    detailed_data = detailed_data.append({'ID': id},ignore_index=True)
-    for key, value in skill_map.items():
-        detailed_data.loc[detailed_data.ID == id, key] = value
-    processed_count += 1
+
+
+# IDs (as strings) of the players whose listing row has changed since the
+# previous crawl's, or who weren't listed then.
+def changed_players(previous, data):
+    key_columns = ['ID'] + snapshot_columns
+    current = data[key_columns].astype(str)
+    before = previous[key_columns].astype(str).drop_duplicates('ID')
+    merged = current.merge(before, how='left', on='ID', suffixes=('', ' before'), indicator=True)
+    changed = merged['_merge'] == 'left_only'
+    for column in snapshot_columns:
+        changed |= merged[column] != merged[column + ' before']
+    return set(merged.ID[changed])
+
+
+# One block of player records as a frame: detailed_columns first, then any
+# labels the site has added since, in the order they were first seen. Values
+# are kept as parsed (object columns), so the CSV reads exactly as it did
+# when each value was set on the frame one at a time.
+def detailed_frame(detailed_rows):
+    detailed_data = pd.DataFrame(detailed_rows, dtype=object)
+    extra_columns = [key for key in detailed_data.columns if key not in detailed_columns]
+    return detailed_data.reindex(columns=detailed_columns + extra_columns).astype(object)
+
+
+# Merge a block of player records with just their own listing rows (listing
+# is the listing frame indexed by ID) and hand it to the sink.
+def write_block(sink, listing, detailed_rows):
+    logging.info("Merging player data...")
+    detailed_data = detailed_frame(detailed_rows)
+    listing_rows = listing.loc[pd.unique(detailed_data.ID)].reset_index(drop=True)
+    full_data = pd.merge(listing_rows, detailed_data, how = 'inner', on = 'ID')
+    logging.info("Writing player data to {}...".format(sink.path))
+    sink.write_block(full_data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Crawl sofifa.com player listings and player pages into {}.'.format(output_file))
+    parser.add_argument('--site', default=site,
+                        help='site to crawl (default: %(default)s); a fifa_crawler.fixtures server works too')
+    parser.add_argument('--pages', type=int, default=listing_pages,
+                        help='number of listing pages to read (default: %(default)s)')
+    parser.add_argument('--rate', type=float, default=request_rate,
+                        help='requests per second, across all fetch threads (default: %(default)s; 0 for no limit)')
+    parser.add_argument('--max-in-flight', type=int, default=max_in_flight,
+                        help='requests waiting on the site at once (default: %(default)s)')
+    parser.add_argument('--retries', type=int, default=retries,
+                        help='retries for a page that times out or gets a 429/5xx (default: %(default)s)')
+    parser.add_argument('--parse-workers', type=int, default=parse_workers,
+                        help='processes parsing player pages (default: %(default)s, parse in this process)')
+    parser.add_argument('--queue-size', type=int, default=fetch_queue_size,
+                        help='fetched pages that may wait to be parsed before fetching pauses (default: %(default)s)')
+    parser.add_argument('--changed-only', action='store_true',
+                        help='reread the listing, but only refetch player pages whose {} changed since the '
+                             'last crawl; the rest come from the page cache'.format('/'.join(snapshot_columns)))
+    add_cache_arguments(parser)
+    add_parser_arguments(parser)
+    add_sink_arguments(parser)
+    args = parser.parse_args()
+
+    base_url = args.site.rstrip('/') + "/players?offset="
+    player_data_url = args.site.rstrip('/') + '/player/'
+
+# Players processed in the current block
+    processed_count = 1
+
+# An offline run only has the cache to read from, so nothing is evicted, however old.
+    cache = None
+    if not args.no_cache:
+        cache = PageCache(args.cache_dir, ttl=args.cache_ttl * 3600)
+        if not args.offline:
+            logging.info("Dropped {} pages older than {} days from {}".format(
+                cache.evict(args.cache_max_age * 86400), args.cache_max_age, args.cache_dir))
+    fetcher = Fetcher(rate=args.rate, max_in_flight=args.max_in_flight, retries=args.retries,
+                      cache=cache, offline=args.offline)
+    changed_only = args.changed_only and cache is not None and get_basic_player_info
+    changed_ids = None
+    listing_rows = []
+
+# Get basic players information for all players. A resumed crawl carries on
+# with the list of players it started with.
+    resume_listing = args.resume and os.path.exists(saved_player_list)
+    if (get_basic_player_info and not resume_listing):
+# In --changed-only mode the listing is what tells us what changed, so always check it with the site.
+        listing_jobs = [(offset, base_url + str(offset * 61), True if changed_only else None)
+                        for offset in range(0, args.pages)]
+        for offset, plain_text in fetcher.fetch_all(listing_jobs):
+            if plain_text is None:
+                continue
+            listing_rows.extend(parse_listing_page(plain_text, args.parser))
+        data = pd.DataFrame(listing_rows, columns = columns)
+        data = data.drop_duplicates()
+
+# Crawls from before there was a snapshot left their listing in saved_player_list.
+        if changed_only and not os.path.exists(last_crawl_snapshot) and os.path.exists(saved_player_list):
+            shutil.copyfile(saved_player_list, last_crawl_snapshot)
+        if changed_only and os.path.exists(last_crawl_snapshot):
+            changed_ids = changed_players(pd.read_json(last_crawl_snapshot,orient='split'), data)
+            logging.info("{} of {} players changed since the last crawl".format(len(changed_ids), data.shape[0]))
+
+# Write basic player info, so we don't have to retrieve it again in a rerun.
+        data.to_json(saved_player_list,orient='split',index=False)
+    else:
+# Try reading the players list from a saved file
+        data = pd.read_json(saved_player_list,orient='split')
+        logging.info("Successfully read {}".format(saved_player_list))
+
+    logging.info("Player info dataframe shape: {}".format(data.shape))
+    listing = data.set_index('ID', drop=False)
+
+# Blocks are appended to the output as they're finished. With --resume, the
+# players an interrupted crawl already wrote are kept and skipped.
+    sink = OutputSink(output_path(output_file, args.output_format), args.output_format, resume=args.resume)
+    if sink.committed:
+        logging.info("Resuming: {} players already written to {}".format(len(sink.committed), sink.path))
+
+# One {'ID': id, detailed column: value} dict per player in the current block
+    detailed_rows = []
+
+# Pages are fetched a few at a time in the background and handed back here
+# in player order, so everything below runs just as it did one request at a time.
+# Unless we know which players changed, the cache's ttl decides which pages to check with the site.
+    if changed_ids is None:
+        player_jobs = [(id, player_data_url + str(id)) for id in data.ID if not sink.is_committed(id)]
+    else:
+        player_jobs = [(id, player_data_url + str(id), str(id) in changed_ids) for id in data.ID if not sink.is_committed(id)]
+
+# Fetching, parsing and writing overlap: pages are fetched in the background
+# and parsed by parse_workers processes, and this loop is the only thing
+# writing to the CSV.
+    counters = StageCounters(['fetched', 'parsed', 'written'])
+    parse_func = functools.partial(parse_player_page, backend=args.parser)
+    for id, skill_map in fetch_and_parse(fetcher, player_jobs, parse_func, args.parse_workers, args.queue_size, counters):
+        logging.info("Retrieving individual info for player ID {}. Processed {}/{}".format(id,processed_count,player_block_size))
+        if skill_map is None:
+            logging.info("Unable to retrieve info for player ID {}! Skipping.".format(id))
+            continue
+
+        detailed_rows.append(dict(skill_map, ID=id))
+        processed_count += 1
 
 # Have we processed a full block of records? If so, merge and write them to the CSV.
-    if (processed_count > player_block_size):
-        logging.info("Merging player data...")
-        full_data = pd.merge(data, detailed_data, how = 'inner', on = 'ID')
-        logging.info("Writing player data to CSV...")
-        full_data.to_csv(output_file, encoding='utf-8-sig',mode=to_csv_mode,header=write_header)
-        processed_count = 1
-        to_csv_mode = 'a'
-        write_header = False
-        detailed_data = pd.DataFrame(index = range(0, data.count()[0]), columns = detailed_columns)
+        if (processed_count > player_block_size):
+            write_block(sink, listing, detailed_rows)
+            counters.count('written', len(detailed_rows))
+            logging.info("Pipeline: {}".format(counters.summary()))
+            processed_count = 1
+            detailed_rows = []
+
+    fetcher.close()
 
 # One final merge and write to cover whatever we haven't yet processed
-logging.info("Merging player data...")
-full_data = pd.merge(data, detailed_data, how = 'inner', on = 'ID')
-logging.info("Writing player data to CSV...")
-full_data.to_csv(output_file, encoding='utf-8-sig',mode=to_csv_mode,header=write_header)
+    write_block(sink, listing, detailed_rows)
+    counters.count('written', len(detailed_rows))
+    logging.info("Pipeline: {}".format(counters.summary()))
+
+# Every player page has been through, so this listing is the next --changed-only baseline.
+    data.to_json(last_crawl_snapshot + '.tmp',orient='split',index=False,compression='zip')
+    os.replace(last_crawl_snapshot + '.tmp', last_crawl_snapshot)
+
+
+if __name__ == '__main__':
+    main()
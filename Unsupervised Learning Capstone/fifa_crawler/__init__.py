@@ -0,0 +1,3 @@
+# Shared helpers for crawler_2020.py.
+# The crawler is run from "Unsupervised Learning Capstone", so it can simply do
+#   from fifa_crawler.fetch import Fetcher
@@ -0,0 +1,119 @@
+import os
+import gzip
+import json
+import time
+import hashlib
+
+default_cache_dir = 'page_cache'
+
+
+# --cache-dir / --no-cache / --cache-ttl / --cache-max-age / --offline
+# --offline reads pages only from the cache, so it can't go with --no-cache.
+def add_cache_arguments(parser):
+    parser.add_argument('--cache-dir', default=default_cache_dir,
+                        help='where to keep fetched pages (default: %(default)s)')
+    use_cache = parser.add_mutually_exclusive_group()
+    use_cache.add_argument('--no-cache', action='store_true',
+                           help="don't read or write the page cache")
+    parser.add_argument('--cache-ttl', type=float, default=24,
+                        help='hours a cached page is used without asking the site whether it changed (default: %(default)s)')
+    parser.add_argument('--cache-max-age', type=float, default=30,
+                        help="days after which a page that hasn't been checked is dropped from the cache (default: %(default)s)")
+    use_cache.add_argument('--offline', action='store_true',
+                           help='only use cached pages; never touch the network (e.g. to rerun a fixed parser)')
+
+
+class CacheEntry(object):
+    def __init__(self, meta, text):
+        self.meta = meta
+        self.text = text
+
+# Headers for a conditional GET: the site answers 304 if the page hasn't
+# changed since we cached it.
+    def validators(self):
+        headers = {}
+        if self.meta.get('etag'):
+            headers['If-None-Match'] = self.meta['etag']
+        if self.meta.get('last_modified'):
+            headers['If-Modified-Since'] = self.meta['last_modified']
+        return headers
+
+
+# Fetched pages on disk, gzipped, keyed by URL:
+#   <directory>/<2 hex>/<sha1 of url>.html.gz   the page
+#   <directory>/<2 hex>/<sha1 of url>.json      url, ETag, Last-Modified, when
+#                                               it was fetched and last checked
+# The .json is written last, so a page only counts as cached once it's
+# complete. A page is fresh for ttl seconds after it was last fetched or
+# revalidated (ttl=None: forever).
+class PageCache(object):
+    def __init__(self, directory, ttl=None):
+        self.directory = directory
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def paths(self, url):
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        stem = os.path.join(self.directory, key[:2], key)
+        return stem + '.html.gz', stem + '.json'
+
+    def get(self, url):
+        page_path, meta_path = self.paths(url)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            with gzip.open(page_path, 'rt', encoding='utf-8') as f:
+                return CacheEntry(meta, f.read())
+        except (OSError, ValueError, EOFError):
+            return None
+
+    def is_fresh(self, entry):
+        return self.ttl is None or time.time() - entry.meta['checked'] < self.ttl
+
+    def write_meta(self, meta_path, meta):
+        tmp_path = meta_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, meta_path)
+
+    def put(self, url, text, headers):
+        page_path, meta_path = self.paths(url)
+        os.makedirs(os.path.dirname(page_path), exist_ok=True)
+        tmp_path = page_path + '.tmp'
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, page_path)
+        now = time.time()
+        self.write_meta(meta_path, {'url': url,
+                                    'etag': headers.get('ETag'),
+                                    'last_modified': headers.get('Last-Modified'),
+                                    'fetched': now,
+                                    'checked': now})
+
+# The site said 304 Not Modified: the cached page is good for another ttl.
+    def touch(self, url, entry):
+        entry.meta['checked'] = time.time()
+        self.write_meta(self.paths(url)[1], entry.meta)
+
+# Drop every page that hasn't been fetched or revalidated in max_age
+# seconds. Returns the number of pages dropped.
+    def evict(self, max_age):
+        cutoff = time.time() - max_age
+        dropped = 0
+        for dirpath, dirnames, filenames in os.walk(self.directory):
+            for filename in filenames:
+                if not filename.endswith('.json'):
+                    continue
+                meta_path = os.path.join(dirpath, filename)
+                try:
+                    with open(meta_path) as f:
+                        checked = json.load(f)['checked']
+                except (OSError, ValueError, KeyError):
+                    checked = 0
+                if checked < cutoff:
+                    os.remove(meta_path)
+                    page_path = meta_path[:-len('.json')] + '.html.gz'
+                    if os.path.exists(page_path):
+                        os.remove(page_path)
+                    dropped += 1
+        return dropped
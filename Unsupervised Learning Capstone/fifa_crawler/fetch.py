@@ -0,0 +1,178 @@
+import time
+import random
+import logging
+import threading
+from collections import deque
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+
+# Statuses worth another try: rate limited, or the server is having a bad
+# moment. Anything else (404 for a player that's been removed, say) won't get
+# better by asking again.
+retry_statuses = {429, 500, 502, 503, 504}
+
+# Errors worth another try for the same reason: the connection dropped, timed
+# out, or broke off partway through the page. Any other requests error (too
+# many redirects, a bad URL) is a FetchError straight away.
+retry_errors = (requests.ConnectionError, requests.Timeout,
+                requests.exceptions.ChunkedEncodingError, requests.exceptions.ContentDecodingError)
+
+
+class FetchError(Exception):
+    pass
+
+
+# Politeness budget: on average no more than `rate` requests per second,
+# with at most `burst` of them back to back. rate=None turns it off.
+# Shared by every fetch thread.
+class TokenBucket(object):
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.capacity = float(max(burst, 1))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# Fetches pages over one pooled requests.Session from a small thread pool.
+#
+# Every request takes a token from the bucket and a slot from its host's
+# semaphore first, so neither the request rate nor the number of requests
+# in flight to a host can exceed what we've agreed to be polite with.
+# retry_errors and retry_statuses are retried up to `retries` times, backing
+# off exponentially (plus jitter, or the server's Retry-After if it sent one).
+# Whatever goes wrong with a page, it ends up as a FetchError, so fetch_all
+# logs it and moves on to the next page.
+#
+# With a PageCache, pages are served from disk while they're fresh and
+# revalidated with a conditional GET once they're not. offline=True never
+# touches the network: a page that isn't cached (or any page, with no
+# cache) is a FetchError.
+class Fetcher(object):
+    def __init__(self, rate=1.0, burst=1, max_in_flight=2, retries=3,
+                 backoff=2.0, timeout=30, workers=None, cache=None, offline=False):
+        self.bucket = TokenBucket(rate, burst)
+        self.max_in_flight = max_in_flight
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.workers = workers or max_in_flight
+        self.cache = cache
+        self.offline = offline
+        self.host_slots = {}
+        self.host_lock = threading.Lock()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def host_slot(self, url):
+        host = urlsplit(url).netloc
+        with self.host_lock:
+            if host not in self.host_slots:
+                self.host_slots[host] = threading.BoundedSemaphore(self.max_in_flight)
+            return self.host_slots[host]
+
+    def retry_delay(self, attempt, response=None):
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after is not None and retry_after.isdigit():
+                return float(retry_after)
+        return self.backoff * 2**attempt + random.uniform(0, self.backoff)
+
+    def request(self, url, headers=None):
+        self.bucket.acquire()
+        with self.host_slot(url):
+            return self.session.get(url, headers=headers, timeout=self.timeout)
+
+# The response for url, or FetchError once the retries are used up.
+    def get(self, url, headers=None):
+        for attempt in range(self.retries + 1):
+            response = None
+            try:
+                response = self.request(url, headers)
+            except requests.RequestException as e:
+                problem = repr(e)
+                if not isinstance(e, retry_errors):
+                    break
+            else:
+                if response.status_code < 400:
+                    return response
+                problem = 'HTTP {}'.format(response.status_code)
+                if response.status_code not in retry_statuses:
+                    break
+            if attempt < self.retries:
+                delay = self.retry_delay(attempt, response)
+                logging.info("{} for {}, retrying in {:.1f}s".format(problem, url, delay))
+                time.sleep(delay)
+        raise FetchError("{} for {}".format(problem, url))
+
+# The page at url, from the cache if we can. revalidate=None leaves it to
+# the cache's ttl; True always asks the site (conditionally) and False
+# uses any cached copy, however old.
+    def get_text(self, url, revalidate=None):
+        entry = self.cache.get(url) if self.cache is not None else None
+        if entry is not None and (self.offline or revalidate is False or
+                                  (revalidate is None and self.cache.is_fresh(entry))):
+            return entry.text
+        if self.offline:
+            raise FetchError("{} isn't cached".format(url))
+        if self.cache is None:
+            return self.get(url).text
+        response = self.get(url, entry.validators() if entry is not None else None)
+        if response.status_code == 304:
+            self.cache.touch(url, entry)
+            return entry.text
+        self.cache.put(url, response.text, response.headers)
+        return response.text
+
+# Fetch every (key, url) or (key, url, revalidate) job and yield
+# (key, text), in job order. text is None if the page couldn't be
+# fetched; the reason is logged.
+    #
+# Only `window` jobs are queued at a time, so a long job list (all ~18k
+# player pages) isn't turned into futures up front, and a slow consumer
+# holds back the fetchers rather than piling up pages in memory.
+    def fetch_all(self, jobs, window=None):
+        window = window or self.workers * 4
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for job in jobs:
+                key, url = job[:2]
+                pending.append((key, url, pool.submit(self.get_text, *job[1:])))
+                if len(pending) >= window:
+                    yield self.result(*pending.popleft())
+            while pending:
+                yield self.result(*pending.popleft())
+
+    def result(self, key, url, future):
+        try:
+            return key, future.result()
+        except FetchError as e:
+            logging.info("Unable to retrieve {}: {}".format(url, e))
+            return key, None
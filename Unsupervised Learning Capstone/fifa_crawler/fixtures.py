@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+
+# A local stand-in for sofifa.com, so the crawler can be run (and timed)
+# without going anywhere near the real site.
+#
+# FixtureServer serves saved HTML pages out of a directory laid out as
+#   <dir>/players/offset_<offset>.html   for /players?offset=<offset>
+#   <dir>/player/<id>.html               for /player/<id>
+# Save real pages there with a browser, or generate synthetic ones that have
+# the same markup the crawler parses with write_fixtures().
+#
+# To serve a directory and crawl it:
+#   python3 -m fifa_crawler.fixtures fixtures --players 500 --port 8000
+#   python3 crawler_2020.py --site http://localhost:8000 --pages 9
+
+import os
+import sys
+import random
+import hashlib
+import argparse
+import threading
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# sofifa lists this many players per listing page
+players_per_page = 61
+
+positions = ['GK', 'RB', 'CB', 'LB', 'CDM', 'CM', 'CAM', 'RM', 'LM', 'RW', 'LW', 'CF', 'ST']
+position_columns = ['LS', 'ST', 'RS', 'LW', 'LF', 'CF', 'RF', 'RW', 'LAM', 'CAM', 'RAM', 'LM', 'LCM', 'CM', 'RCM', 'RM', 'LWB', 'LDM', 'CDM', 'RDM', 'RWB', 'LB', 'LCB', 'CB', 'RCB', 'RB']
+# The skill callouts on a player page, in page order, with the label as shown
+# (the crawler strips the spaces).
+skill_sections = [['Crossing', 'Finishing', 'Heading Accuracy', 'Short Passing', 'Volleys'],
+                  ['Dribbling', 'Curve', 'FK Accuracy', 'Long Passing', 'Ball Control'],
+                  ['Acceleration', 'Sprint Speed', 'Agility', 'Reactions', 'Balance'],
+                  ['Shot Power', 'Jumping', 'Stamina', 'Strength', 'Long Shots'],
+                  ['Aggression', 'Interceptions', 'Positioning', 'Vision', 'Penalties', 'Composure'],
+                  ['Marking', 'Defensive Awareness', 'Standing Tackle', 'Sliding Tackle'],
+                  ['GK Diving', 'GK Handling', 'GK Kicking', 'GK Positioning', 'GK Reflexes']]
+first_names = ['Julian', 'Kai', 'Sadio', 'Phil', 'Joao', 'Erling', 'Thomas', 'Ruben', 'Christian', 'Renan']
+last_names = ['Brandt', 'Havertz', 'Mane', 'Foden', 'Felix', 'Haaland', 'Muller', 'Dias', 'Eriksen', 'Lodi']
+nations = ['Germany', 'Senegal', 'England', 'Portugal', 'Norway', 'Denmark', 'Brazil']
+clubs = ['Liverpool', 'Chelsea', 'Manchester City', 'FC Bayern Munchen', 'Inter', 'Real Madrid']
+
+
+def make_player(pid, rng):
+    position = rng.choice(positions)
+    player = {'ID': pid,
+              'Name': '{}. {}'.format(rng.choice(first_names)[0], rng.choice(last_names)),
+              'Age': rng.randint(17, 38),
+              'Nationality': rng.choice(nations),
+              'Overall': rng.randint(48, 94),
+              'Club': rng.choice(clubs),
+              'Value': '€{:.1f}M'.format(rng.uniform(0.1, 100)),
+              'Wage': '€{}K'.format(rng.randint(1, 500)),
+              'Special': rng.randint(800, 2300),
+              'Positions': [position] + rng.sample([p for p in positions if p != position], rng.randint(0, 2)),
+              'Preferred Foot': rng.choice(['Left', 'Right']),
+              'International Reputation': rng.randint(1, 5),
+              'Weak Foot': rng.randint(1, 5),
+              'Skill Moves': rng.randint(1, 5),
+              'Work Rate': rng.choice(['High/ Low', 'Medium/ Medium', 'High/ High']),
+              'Body Type': rng.choice(['Normal', 'Lean', 'Stocky']),
+              'Real Face': rng.choice(['Yes', 'No']),
+              'Release Clause': '€{:.1f}M'.format(rng.uniform(0.1, 200)),
+              'Jersey Number': rng.randint(1, 99),
+              'Joined': 'Jul {}, {}'.format(rng.randint(1, 28), rng.randint(2010, 2019)),
+              'Contract Valid Until': rng.randint(2020, 2025),
+              'Height': '{}\'{}"'.format(rng.randint(5, 6), rng.randint(0, 11)),
+              'Weight': '{}lbs'.format(rng.randint(140, 220)),
+# Some players aren't on a team sheet, so the crawler has to fall
+# back to the first position next to their name.
+              'On Team Sheet': rng.random() < 0.9,
+              'Loaned From': rng.choice(clubs) if rng.random() < 0.05 else None}
+    player['Potential'] = max(player['Overall'], rng.randint(48, 95))
+    player['Position scores'] = {column: (rng.randint(30, 90), rng.choice([0, 0, 1, 2, 3])) for column in position_columns}
+    player['Skills'] = [[(label, rng.randint(10, 95)) for label in section] for section in skill_sections]
+    return player
+
+
+def make_players(n_players, seed=0):
+    rng = random.Random(seed)
+    return [make_player(pid, rng) for pid in rng.sample(range(1000, 260000), n_players)]
+
+
+def listing_row(player):
+    return ('<tr><td class="col-avatar"><figure class="avatar"><img id="{ID}" data-src="https://cdn.sofifa.org/players/4/20/{ID}.png"></figure></td>'
+            '<td class="col-name"><a href="/nation/1" title="{Nationality}"><img data-src="https://cdn.sofifa.org/flags/1.png" class="flag"></a>'
+            '<a href="/player/{ID}" class="tooltip">{Name}</a><div class="bp3-text-overflow-ellipsis"></div></td>'
+            '<td class="col col-ae">{Age}</td><td class="col col-oa"><span>{Overall}</span></td>'
+            '<td class="col col-pt"><span>{Potential}</span></td>'
+            '<td class="col-name"><img data-src="https://cdn.sofifa.org/teams/2/light/9.png" class="team"><a href="/team/9">{Club}</a></td>'
+            '<td class="col col-vl">{Value}</td><td class="col col-wg">{Wage}</td><td class="col col-tt">{Special}</td></tr>').format(**player)
+
+
+def listing_page(players):
+    return ('<html><body><article><table class="table table-hover persist-header"><thead><tr><th>Name</th></tr></thead>'
+            '<tbody class="list">{}</tbody></table></article></body></html>').format(''.join(listing_row(p) for p in players))
+
+
+def player_page(player):
+    meta = '{} <img class="flag"> {} Age {} (Jan 1, {}) {} {}'.format(
+        player['Name'], ' '.join(player['Positions']), player['Age'], 2019 - player['Age'], player['Height'], player['Weight'])
+    profile = ''.join('<li><label>{0}</label>{1}</li>'.format(label, player[label])
+                      for label in ['Preferred Foot', 'International Reputation', 'Weak Foot', 'Skill Moves',
+                                    'Work Rate', 'Body Type', 'Real Face', 'Release Clause'])
+    team = ''
+    if player['On Team Sheet']:
+        team = ''.join('<li><label>{0}</label>{1}</li>'.format(label, value)
+                       for label, value in [('Position', '<span class="pos">{}</span>'.format(player['Positions'][0])),
+                                            ('Jersey Number', player['Jersey Number']),
+                                            ('Joined', player['Joined']) if player['Loaned From'] is None
+                                            else ('Loaned From', player['Loaned From']),
+                                            ('Contract Valid Until', player['Contract Valid Until'])])
+        team = '<li><a href="/team/9">{}</a></li>{}'.format(player['Club'], team)
+    aside = ''
+    if player['Positions'][0] != 'GK':
+        aside = '<aside><div class="columns">{}</div></aside>'.format(''.join(
+            '<div class="column col-sm-2 text-center p">\n{}{}{}</div>'.format(
+                column, score, '+{}'.format(bonus) if bonus else '')
+            for column, (score, bonus) in player['Position scores'].items()))
+    callouts = ''.join(
+        '<div class="column col-4"><div class="bp3-callout bp3-intent-primary"><h5>Section</h5><ul>{}</ul></div></div>'.format(
+            ''.join('<li><span class="bp3-tag p">{}</span> {}</li>'.format(value, label) for label, value in section))
+        for section in player['Skills'])
+    return ('<html><body><div class="center"><div class="bp3-card player">'
+            '<div class="info"><h1>{name}</h1><div class="meta bp3-text-overflow-ellipsis">{meta}</div></div></div>'
+            '<article><div class="bp3-callout spacing"><h5>Profile</h5></div><div class="bp3-callout spacing"><h5>Stats</h5></div>'
+            '{callouts}</article>'
+            '<div class="teams"><div class="columns"><div class="column col-6"><ul>{profile}</ul></div>'
+            '<div class="column col-5"><ul>{team}</ul></div></div></div>'
+            '{aside}</div></body></html>').format(name=player['Name'], meta=meta, callouts=callouts,
+                                                  profile=profile, team=team, aside=aside)
+
+
+# Write listing and player pages for n_players synthetic players into
+# directory, laid out the way FixtureServer serves them. Returns the players.
+def write_fixtures(directory, n_players, seed=0):
+    players = make_players(n_players, seed)
+    os.makedirs(os.path.join(directory, 'players'), exist_ok=True)
+    os.makedirs(os.path.join(directory, 'player'), exist_ok=True)
+    for page, start in enumerate(range(0, n_players, players_per_page)):
+        with open(os.path.join(directory, 'players', 'offset_{}.html'.format(page * players_per_page)), 'w') as f:
+            f.write(listing_page(players[start:start + players_per_page]))
+    for player in players:
+        with open(os.path.join(directory, 'player', '{}.html'.format(player['ID'])), 'w') as f:
+            f.write(player_page(player))
+    return players
+
+
+def fixture_path(directory, url_path, query):
+    parts = url_path.strip('/').split('/')
+    if parts == ['players'] and 'offset' in query:
+        return os.path.join(directory, 'players', 'offset_{}.html'.format(query['offset'][0]))
+    if len(parts) == 2 and parts[0] == 'player' and parts[1].isdigit():
+        return os.path.join(directory, 'player', '{}.html'.format(parts[1]))
+    return None
+
+
+# Serves a fixture directory on localhost from a background thread.
+# latency (seconds) is added to every response, to stand in for the real
+# round trip, and fail_rate is the fraction of requests answered with a 503,
+# to exercise the retries.
+class FixtureServer(object):
+    def __init__(self, directory, port=0, latency=0.0, fail_rate=0.0, seed=0):
+        self.directory = directory
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.failures = 0
+        self.not_modified = 0
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), self.handler())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self.httpd.server_address[1])
+
+    def handler(self):
+        server = self
+
+        class FixtureHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                fail = server.count_request()
+                if server.latency:
+                    threading.Event().wait(server.latency)
+                if fail:
+                    self.send_error(503)
+                    return
+                url = urlsplit(self.path)
+                path = fixture_path(server.directory, url.path, parse_qs(url.query))
+                if path is None or not os.path.exists(path):
+                    self.send_error(404)
+                    return
+                with open(path, 'rb') as f:
+                    body = f.read()
+# Like the real site, tag pages so a cached copy can be revalidated.
+                etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+                if self.headers.get('If-None-Match') == etag:
+                    server.count_not_modified()
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+# The crawler went away mid-response (killed, say); nothing to do.
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        return FixtureHandler
+
+    def count_request(self):
+        with self.lock:
+            self.requests += 1
+            fail = self.fail_rate > 0 and self.rng.random() < self.fail_rate
+            self.failures += fail
+            return fail
+
+    def count_not_modified(self):
+        with self.lock:
+            self.not_modified += 1
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve saved (or generated) sofifa pages on localhost.')
+    parser.add_argument('directory', help='fixture directory')
+    parser.add_argument('--players', type=int, default=0,
+                        help='first generate synthetic pages for this many players')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='fraction of requests answered with a 503')
+    args = parser.parse_args()
+    if args.players:
+        write_fixtures(args.directory, args.players)
+    server = FixtureServer(args.directory, args.port, args.latency, args.fail_rate)
+    print("Serving {} at {}".format(args.directory, server.url))
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        sys.exit(0)
@@ -0,0 +1,211 @@
+import re
+import logging
+from bs4 import BeautifulSoup
+
+# lxml is much faster than BeautifulSoup's pure-Python 'html.parser', but it's
+# a compiled package we don't want to insist on.
+try:
+    import lxml.html
+    from lxml import etree
+except ImportError:
+    lxml = None
+
+# 'lxml' queries the parsed tree with precompiled XPath; 'bs4' is the
+# BeautifulSoup code the crawler has always used. Both return the same
+# fields, value for value (benchmarks/bench_parse.py checks).
+backends = ['lxml', 'bs4']
+default_backend = 'lxml' if lxml is not None else 'bs4'
+
+position_score_class = re.compile('column col-sm-2 text-center p')
+skill_section_class = re.compile('bp3-callout ')
+digits = re.compile(r'\d+')
+split_digits = re.compile(r'(\d+)')
+letters = re.compile('[a-zA-Z]+')
+
+
+# --parser, shared by the crawler and benchmarks.
+def add_parser_arguments(parser):
+    parser.add_argument('--parser', choices=[b for b in backends if b != 'lxml' or lxml is not None],
+                        default=default_backend,
+                        help='HTML parser backend (default: %(default)s)')
+
+
+# One listing page's worth of players, as rows of
+# [ID, Name, Age, Photo, Nationality, Flag, Overall, Potential, Club, Club Logo, Value, Wage, Special].
+def parse_listing_page(plain_text, backend=None):
+    return listing_parsers[backend or default_backend](plain_text)
+
+
+# A player page's details, as {detailed column: value}.
+def parse_player_page(plain_text, backend=None):
+    return player_parsers[backend or default_backend](plain_text)
+
+
+def bs4_listing_page(plain_text):
+    rows = []
+    soup = BeautifulSoup(plain_text, 'html.parser')
+    table_body = soup.find('tbody')
+    for row in table_body.findAll('tr'):
+        td = row.findAll('td')
+        picture = td[0].find('img').get('data-src')
+        pid = td[0].find('img').get('id')
+        nationality = td[1].find('a').get('title')
+        flag_img = td[1].find('img').get('data-src')
+        name = td[1].findAll('a')[1].text
+        logging.info("Retrieving player info for {}, ID {}".format(name,pid))
+        age = td[2].text.strip()
+        overall = td[3].text.strip()
+        potential = td[4].text.strip()
+        club = td[5].find('a').text
+        club_logo = td[5].find('img').get('data-src')
+        value = td[6].text.strip()
+        wage = td[7].text.strip()
+        special = td[8].text.strip()
+        rows.append([pid, name, age, picture, nationality, flag_img, overall, potential, club, club_logo, value, wage, special])
+    return rows
+
+
+# What the player page parsers share once they've pulled the text out of the
+# page: the meta line under the player's name, {label: value} from the team
+# sheet columns, the position score texts and the skill item texts.
+def player_skill_map(meta_text, labelled, position_texts, skill_texts):
+    skill_map = {}
+
+# Metadata format is: first_name, last_name, flag (returns an empty string), position(s), 'Age', age_number, '('+birth_month, birth_day+',', birth_year+')'
+    meta_data = meta_text.split(' ')
+    length = len(meta_data)
+    flag_space_ind = meta_data.index('')
+    age_string_ind = meta_data.index('Age')
+# We'll capture all of the positions listed here now. We can decide what to do with them in analysis.
+    skill_map['Player Positions'] = str.join(' ',meta_data[flag_space_ind+1:age_string_ind])
+    weight = meta_data[length - 1]
+    height = meta_data[length - 2].split('\'')[0] + '\'' + meta_data[length - 2].split('\'')[1].split('\"')[0]
+    skill_map["Height"] = height
+    skill_map['Weight'] = weight
+    skill_map.update(labelled)
+
+# col-5 information (the team to which a player belongs, and the position they play) may not be populated.
+# If it isn't, use the first position listed next to their name as Position.
+    if('Position' not in skill_map.keys()):
+        skill_map['Position'] = meta_data[3]
+
+# Goalkeepers don't have position scores.
+    if (skill_map['Position'] != 'GK'):
+        for text in position_texts():
+            my_output = split_digits.split(text,maxsplit=1)
+            my_output[0] = my_output[0][1:]
+
+# There is a bonus awarded to some players. Capture it--we can decide what to do with it in analysis.
+            skill_map[my_output[0]] = str.join('',my_output[1:3])
+
+    for text in skill_texts:
+        value = int(digits.search(text).group())
+        name = ''.join(letters.findall(text))
+        skill_map[str(name)] = value
+    return skill_map
+
+
+def bs4_player_page(plain_text):
+    soup = BeautifulSoup(plain_text, 'html.parser')
+    meta_text = soup.find('div', {'class': 'meta'}).text
+
+# Players' attributes have been split across a few different classes, so we'll extract values from all of them.
+    labelled = {}
+    for col_idx in [5,6]:
+        columns = soup.find('div', {'class': 'teams'}).find('div', {'class': 'columns'}).find_all('div', {'class': 'column col-{}'.format(col_idx)})
+        for column in columns:
+            skills = column.find_all('li')
+            for skill in skills:
+                if(skill.find('label') != None):
+                    label = skill.find('label').text
+                    value = skill.text.replace(label, '').strip()
+                    labelled[label] = value
+
+# Position scores have been moved outside of the 'article' tag to an 'aside' tag.
+# Only looked for if the player isn't a goalkeeper, hence the function.
+    def position_texts():
+        texts = []
+        positions = soup.find('aside').find_all('div', class_='columns')
+        for position in positions:
+            for pos_div in position.find_all('div', class_=position_score_class):
+                texts.append(pos_div.text)
+        return texts
+
+# The rest of the players' attributes have been split into a bunch of classes as well.
+# Bonus work, tbd: Capture the class information regarding the players' skill levels in each area--
+#  tags look like "bp3-intent-(success|warning|danger)". Could be useful summary info?
+    skill_texts = []
+    sections = soup.find('article').find_all('div', class_=skill_section_class)[2:]
+    for section in sections:
+        for item in section.find('ul').find_all('li'):
+            skill_texts.append(item.text)
+    return player_skill_map(meta_text, labelled, position_texts, skill_texts)
+
+
+# XPath for "has this class", the way BeautifulSoup matches class='meta'
+# against class="meta bp3-text-overflow-ellipsis".
+def has_class(name):
+    return "contains(concat(' ', normalize-space(@class), ' '), ' {} ')".format(name)
+
+
+if lxml is not None:
+    find_tbody = etree.XPath('(//tbody)[1]')
+    find_meta = etree.XPath('(//div[{}])[1]'.format(has_class('meta')))
+    find_team_columns = etree.XPath('((//div[{}])[1]//div[{}])[1]'.format(has_class('teams'), has_class('columns')))
+    find_labelled_items = etree.XPath(".//div[normalize-space(@class)=$column_class]//li")
+    find_aside_columns = etree.XPath('(//aside)[1]//div[{}]'.format(has_class('columns')))
+    find_position_scores = etree.XPath(".//div[contains(normalize-space(@class), 'column col-sm-2 text-center p')]")
+    find_skill_sections = etree.XPath("(//article)[1]//div[contains(normalize-space(@class), 'bp3-callout ')]")
+
+
+def lxml_listing_page(plain_text):
+    rows = []
+    table_body = find_tbody(lxml.html.fromstring(plain_text))[0]
+    for row in table_body.iter('tr'):
+        td = list(row.iter('td'))
+        avatar = td[0].find('.//img')
+        links = list(td[1].iter('a'))
+        picture = avatar.get('data-src')
+        pid = avatar.get('id')
+        nationality = links[0].get('title')
+        flag_img = td[1].find('.//img').get('data-src')
+        name = links[1].text_content()
+        logging.info("Retrieving player info for {}, ID {}".format(name,pid))
+        age = td[2].text_content().strip()
+        overall = td[3].text_content().strip()
+        potential = td[4].text_content().strip()
+        club = td[5].find('.//a').text_content()
+        club_logo = td[5].find('.//img').get('data-src')
+        value = td[6].text_content().strip()
+        wage = td[7].text_content().strip()
+        special = td[8].text_content().strip()
+        rows.append([pid, name, age, picture, nationality, flag_img, overall, potential, club, club_logo, value, wage, special])
+    return rows
+
+
+def lxml_player_page(plain_text):
+    doc = lxml.html.fromstring(plain_text)
+    meta_text = find_meta(doc)[0].text_content()
+
+    labelled = {}
+    team_columns = find_team_columns(doc)[0]
+    for col_idx in [5,6]:
+        for skill in find_labelled_items(team_columns, column_class='column col-{}'.format(col_idx)):
+            label_tag = skill.find('.//label')
+            if label_tag is not None:
+                label = label_tag.text_content()
+                labelled[label] = skill.text_content().replace(label, '').strip()
+
+    def position_texts():
+        return [pos_div.text_content()
+                for position in find_aside_columns(doc)
+                for pos_div in find_position_scores(position)]
+
+    skill_texts = [item.text_content()
+                   for section in find_skill_sections(doc)[2:]
+                   for item in section.find('.//ul').iter('li')]
+    return player_skill_map(meta_text, labelled, position_texts, skill_texts)
+
+
+listing_parsers = {'bs4': bs4_listing_page, 'lxml': lxml_listing_page}
+player_parsers = {'bs4': bs4_player_page, 'lxml': lxml_player_page}
@@ -0,0 +1,111 @@
+import time
+import queue
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+
+# How many items have gone through each stage, and how deep the queues
+# between them have been. Stages are counted from whichever thread runs them.
+class StageCounters(object):
+    def __init__(self, stages):
+        self.stages = list(stages)
+        self.counts = dict.fromkeys(self.stages, 0)
+        self.depths = {}
+        self.start = time.monotonic()
+        self.lock = threading.Lock()
+
+    def count(self, stage, n=1):
+        with self.lock:
+            self.counts[stage] += n
+
+# One observation of a queue's depth: we keep the running mean and the max.
+    def sample(self, name, depth):
+        with self.lock:
+            samples, total, deepest = self.depths.get(name, (0, 0, 0))
+            self.depths[name] = (samples + 1, total + depth, max(deepest, depth))
+
+    def summary(self):
+        with self.lock:
+            elapsed = max(time.monotonic() - self.start, 1e-9)
+            parts = ['{} {} ({:.1f}/s)'.format(stage, self.counts[stage], self.counts[stage] / elapsed)
+                     for stage in self.stages]
+            parts += ['{} depth avg {:.1f} max {}'.format(name, total / samples, deepest)
+                      for name, (samples, total, deepest) in self.depths.items()]
+        return ', '.join(parts)
+
+
+# Fetch pages, parse them in a process pool and yield (key, record) in job
+# order. record is None for a page that couldn't be fetched.
+#
+# A fetch thread drives fetcher.fetch_all() and puts each page on a queue of
+# at most queue_size pages; the calling thread takes pages off it, hands them
+# to parse_workers processes (no more than two each in flight) and yields
+# the records to whoever is writing them. Every stage is bounded, so if
+# parsing or writing falls behind, the queue fills, the fetch thread blocks
+# on it and the fetchers stop asking for more pages: memory stays flat
+# however long the job list is.
+#
+# parse_func must be picklable (a module-level function, or a
+# functools.partial of one). With parse_workers=1 pages are parsed right
+# here, without a pool.
+def fetch_and_parse(fetcher, jobs, parse_func, parse_workers=1, queue_size=64, counters=None):
+    counters = counters or StageCounters(['fetched', 'parsed'])
+    pages = queue.Queue(maxsize=queue_size)
+    finished = object()
+
+    def produce():
+        try:
+            for key, text in fetcher.fetch_all(jobs):
+                counters.count('fetched')
+                pages.put((key, text))
+            pages.put(finished)
+        except BaseException as e:
+            pages.put(e)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+
+    def next_page():
+        counters.sample('fetch queue', pages.qsize())
+        item = pages.get()
+        if isinstance(item, BaseException):
+            raise item
+        return item
+
+    if parse_workers <= 1:
+        while True:
+            item = next_page()
+            if item is finished:
+                break
+            key, text = item
+            record = parse_func(text) if text is not None else None
+            counters.count('parsed', record is not None)
+            yield key, record
+        return
+
+# Fork isn't safe with the fetch threads already running, so the workers are spawned.
+    with ProcessPoolExecutor(max_workers=parse_workers,
+                             mp_context=multiprocessing.get_context('spawn')) as pool:
+        pending = deque()
+        while True:
+            item = next_page()
+            if item is finished:
+                break
+            key, text = item
+            pending.append((key, pool.submit(parse_func, text) if text is not None else None))
+            counters.sample('parse in flight', len(pending))
+            if len(pending) >= parse_workers * 2:
+                yield parsed_result(pending.popleft(), counters)
+        while pending:
+            yield parsed_result(pending.popleft(), counters)
+
+
+def parsed_result(pending, counters):
+    key, future = pending
+    if future is None:
+        return key, None
+    record = future.result()
+    counters.count('parsed')
+    return key, record
@@ -0,0 +1,133 @@
+import os
+import glob
+import json
+import shutil
+
+formats = {'csv': '.csv',
+           'parquet': '.parquet'}
+
+
+# --output-format / --resume
+def add_sink_arguments(parser):
+    parser.add_argument('--output-format', choices=sorted(formats), default='csv',
+                        help='write player records as CSV (default) or as a directory of Parquet parts')
+    parser.add_argument('--resume', action='store_true',
+                        help='keep the players already written by an interrupted crawl and skip them')
+
+
+def output_path(output_file, fmt):
+    return os.path.splitext(output_file)[0] + formats[fmt]
+
+
+def fsync_append(path, data):
+    with open(path, 'ab') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+# Append-only output for the crawler's blocks of player records, which
+# remembers which player IDs it has committed.
+#
+# Each block is written, flushed to disk, and only then recorded in a ledger
+# next to the output (<output>.committed.jsonl, one JSON line per block: its
+# IDs and where the output ended after it). A crash between the two leaves a
+# block on disk that the ledger doesn't know about; on resume it's cut off
+# (CSV: truncated to the last recorded offset; Parquet: the part file is
+# removed) and those players are fetched again, so nothing is written twice.
+# A half-written last ledger line is ignored the same way.
+#
+# CSV blocks are appended to one file, exactly as the crawler always wrote
+# it. Parquet blocks go to a directory, one part file (one row group) per
+# block, written to a temporary name and renamed into place: a Parquet file
+# can't be appended to, and one that was open when the crawl died has no
+# footer and can't be read at all. pd.read_parquet(directory) reads the lot.
+# Parquet columns are stored as strings, the same text the CSV holds, so
+# blocks that saw different values for a column still share one schema.
+#
+# Without resume, any previous output and ledger are removed.
+class OutputSink(object):
+    def __init__(self, path, fmt='csv', resume=False):
+        self.path = path
+        self.fmt = fmt
+        self.ledger_path = path + '.committed.jsonl'
+        self.committed = set()
+        self.blocks = 0
+        if not resume:
+            self.remove()
+        entries = self.read_ledger()
+        for entry in entries:
+            self.committed.update(entry['ids'])
+        self.blocks = len(entries)
+        if fmt == 'csv':
+            self.truncate_csv(entries[-1]['offset'] if entries else 0)
+        else:
+            self.prune_parts(set(entry['part'] for entry in entries))
+        self.rewrite_ledger(entries)
+
+    def remove(self):
+        if os.path.isdir(self.path):
+            shutil.rmtree(self.path)
+        elif os.path.exists(self.path):
+            os.remove(self.path)
+        if os.path.exists(self.ledger_path):
+            os.remove(self.ledger_path)
+
+    def read_ledger(self):
+        entries = []
+        if not os.path.exists(self.ledger_path):
+            return entries
+        with open(self.ledger_path) as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    break
+        return entries
+
+# Drop anything after the last complete entry, so new entries start on a clean line.
+    def rewrite_ledger(self, entries):
+        tmp_path = self.ledger_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + '\n')
+        os.replace(tmp_path, self.ledger_path)
+
+    def truncate_csv(self, offset):
+        if os.path.exists(self.path):
+            with open(self.path, 'r+b') as f:
+                f.truncate(offset)
+        elif offset:
+            raise IOError("{} is missing, but its ledger says {} bytes were committed".format(self.path, offset))
+
+    def prune_parts(self, parts):
+        os.makedirs(self.path, exist_ok=True)
+        for part_path in glob.glob(os.path.join(self.path, '*')):
+            if os.path.basename(part_path) not in parts:
+                os.remove(part_path)
+
+    def is_committed(self, player_id):
+        return str(player_id) in self.committed
+
+# Write one block of player records (the merged listing and detail columns)
+# and commit its IDs. An empty block only matters if it's the first (CSV: the
+# header still gets written).
+    def write_block(self, full_data):
+        if full_data.empty and self.blocks:
+            return
+        ids = [str(player_id) for player_id in full_data.ID]
+        if self.fmt == 'csv':
+            with open(self.path, 'ab') as f:
+                full_data.to_csv(f, encoding='utf-8-sig', header=f.tell() == 0)
+                f.flush()
+                os.fsync(f.fileno())
+                entry = {'ids': ids, 'offset': f.tell()}
+        else:
+            part = 'part-{:05d}.parquet'.format(self.blocks)
+            part_path = os.path.join(self.path, part)
+            full_data.astype('string').to_parquet(part_path + '.tmp', index=False)
+            os.replace(part_path + '.tmp', part_path)
+            entry = {'ids': ids, 'part': part}
+        fsync_append(self.ledger_path, (json.dumps(entry) + '\n').encode('utf-8'))
+        self.committed.update(ids)
+        self.blocks += 1